@@ -0,0 +1,54 @@
+"""Benchmark parsing and merging several history files.
+
+Usage: python -m benchmarks.bench_history_sources [number_of_files] [lines_per_file]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_redaction import make_history
+from terminalfellow.utils.history_sources import load_timeline
+
+
+def main() -> None:
+    """Write timestamped histories and compare serial and parallel loading."""
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 250_000
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sources = []
+        for index in range(files):
+            path = os.path.join(temp_dir, f"host{index}.bash_history")
+            with open(path, "w") as f:
+                for offset, command in enumerate(make_history(lines, seed=index)):
+                    f.write(f"#{1700000000 + offset * files + index}\n{command}\n")
+            sources.append(path)
+        size = sum(os.path.getsize(path) for path in sources) / 1e6
+        print(f"{files} files, {files * lines} entries, {size:.0f} MB")
+
+        for workers in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            timeline = load_timeline(sources, workers=workers, min_bytes=0)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{workers} workers: {elapsed:.2f} s "
+                f"({len(timeline) / elapsed / 1000:.0f} k entries/s)"
+            )
+
+        cache_dir = os.path.join(temp_dir, "timelines")
+        load_timeline(sources, min_bytes=0, cache_dir=cache_dir)
+        start = time.perf_counter()
+        load_timeline(sources, cache_dir=cache_dir)
+        print(f"cached: {time.perf_counter() - start:.2f} s")
+        with open(sources[0], "a") as f:
+            for offset, command in enumerate(make_history(1000, seed=files)):
+                f.write(f"#{1800000000 + offset}\n{command}\n")
+        start = time.perf_counter()
+        load_timeline(sources, cache_dir=cache_dir)
+        print(f"cached, 1000 lines appended: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Benchmark bounded-memory history statistics.
+
+Usage: python -m benchmarks.bench_history_stats [number_of_lines]
+"""
+
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from benchmarks.bench_redaction import make_history
+from terminalfellow.utils.history_stats import StreamingStats
+
+
+def main() -> None:
+    """Compare streaming sketches with exact counting on a synthetic history."""
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    history = make_history(lines)
+
+    start = time.perf_counter()
+    stats = StreamingStats()
+    stats.consume(iter(history))
+    elapsed = time.perf_counter() - start
+    print(f"streaming: {elapsed:.2f} s ({lines / elapsed / 1000:.0f} k lines/s)")
+
+    # Tracing slows the pass down, so memory is measured in a second one
+    tracemalloc.start()
+    StreamingStats().consume(iter(history))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"peak memory beyond the input: {peak / 1e6:.1f} MB")
+
+    exact_tools = Counter(line.split()[0] for line in history if line.split())
+    exact_distinct = len(set(history))
+    estimate = stats.distinct_commands.count()
+    print(
+        f"distinct commands: {estimate} estimated, {exact_distinct} exact "
+        f"({abs(estimate - exact_distinct) / exact_distinct:.2%} error)"
+    )
+    top = {(tool, count) for tool, count, _ in stats.tools.top(10)}
+    expected = set(exact_tools.most_common(10))
+    print(f"top-10 tools match exact counts: {top == expected}")
+
+
+if __name__ == "__main__":
+    main()
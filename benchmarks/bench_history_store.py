@@ -0,0 +1,58 @@
+"""Benchmark the SQLite history store.
+
+Usage: python -m benchmarks.bench_history_store [number_of_lines]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_redaction import make_history
+from terminalfellow.utils.history_store import HistoryStore
+
+QUERIES = ["git", "git comm", "docker compose up", "pytest api", "kubectl pods", "zzz"]
+
+
+def main() -> None:
+    """Sync a synthetic history and report insert and search latency."""
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    history = make_history(lines)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "bash_history")
+        with open(history_file, "w") as f:
+            f.write("\n".join(history) + "\n")
+
+        with HistoryStore(os.path.join(temp_dir, "history.db")) as store:
+            start = time.perf_counter()
+            store.sync(history_file)
+            elapsed = time.perf_counter() - start
+            print(f"sync: {elapsed:.2f} s ({lines / elapsed / 1000:.0f} k lines/s)")
+
+            start = time.perf_counter()
+            store.sync(history_file)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"sync of an unchanged file: {elapsed:.2f} ms")
+
+            with open(history_file, "a") as f:
+                f.write("\n".join(make_history(1000, seed=1)) + "\n")
+            start = time.perf_counter()
+            store.sync(history_file)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"incremental sync of 1000 lines: {elapsed:.1f} ms")
+
+            for query in QUERIES:
+                timings = []
+                for _ in range(5):
+                    start = time.perf_counter()
+                    results = store.search(query, limit=10)
+                    timings.append(time.perf_counter() - start)
+                print(
+                    f"search {query!r}: best {min(timings) * 1000:.2f} ms, "
+                    f"{len(results)} results"
+                )
+
+
+if __name__ == "__main__":
+    main()
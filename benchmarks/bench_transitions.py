@@ -0,0 +1,40 @@
+"""Benchmark the next-command transition model.
+
+Usage: python -m benchmarks.bench_transitions [number_of_lines]
+"""
+
+import sys
+import time
+
+from benchmarks.bench_redaction import make_history
+from terminalfellow.utils.transitions import TransitionModel
+
+
+def main() -> None:
+    """Train on a synthetic history and report update and query latency."""
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    history = make_history(lines)
+
+    model = TransitionModel()
+    start = time.perf_counter()
+    model.update(history)
+    print(f"train: {(time.perf_counter() - start) * 1000:.1f} ms for {lines} lines")
+    print(
+        f"states: {len(model.vocab)}, bigrams: {len(model.bigram_keys)}, "
+        f"trigrams: {len(model.trigram_keys)}"
+    )
+
+    start = time.perf_counter()
+    model.update(make_history(100, seed=1))
+    print(f"incremental update: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    queries = 1000
+    start = time.perf_counter()
+    for i in range(queries):
+        model.predict(history[i : i + 2])
+    elapsed = (time.perf_counter() - start) / queries
+    print(f"predict: {elapsed * 1000:.3f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
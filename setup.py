@@ -11,6 +11,7 @@ setup(
         "typer",
         "rich",
         "questionary",
+        "numpy",
     ],
     extras_require={
         "dev": [
@@ -26,6 +27,7 @@ setup(
     entry_points={
         "console_scripts": [
             "tf=terminalfellow.cli.main:main",
+            "tf-widget=terminalfellow.shell.client:main",
         ],
     },
     author="Can Uysal",
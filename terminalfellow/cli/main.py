@@ -4,17 +4,13 @@ import os
 import sys
 import time
 import typer
-import questionary
 from rich.console import Console
-from rich.panel import Panel
-from rich.spinner import Spinner
 from rich import print as rprint
 from typing import Optional, List
 import enum
 
 from terminalfellow import __version__
-from terminalfellow.core.generator import CommandGenerator
-from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.shell.scripts import WIDGET_SCRIPTS, get_init_script
 from terminalfellow.utils.config import (
     get_openai_api_key,
     set_openai_api_key,
@@ -24,8 +20,18 @@ from terminalfellow.utils.config import (
 )
 
 app = typer.Typer(help="Terminal Fellow: Your intelligent terminal assistant.")
+history_app = typer.Typer(help="Search and record your shell history.")
+app.add_typer(history_app, name="history")
 console = Console(stderr=True)  # Use stderr for console output to keep stdout clean
-history_analyzer = HistoryAnalyzer()
+# Created on first use: templated answers never need the history modules
+_history_analyzer = None
+
+# Flags, accepted anywhere on the command line, that profile the invocation
+PROFILE_FLAGS = {
+    "--profile": "wall",
+    "--profile=wall": "wall",
+    "--profile=local": "local",
+}
 
 
 class ModelProvider(str, enum.Enum):
@@ -40,6 +46,20 @@ class OpenAIModel(str, enum.Enum):
     GPT_4_TURBO = "gpt-4-turbo"
 
 
+def get_history_analyzer():
+    """Get the history analyzer, importing the history modules on first use.
+
+    Returns:
+        The shared HistoryAnalyzer
+    """
+    global _history_analyzer
+    if _history_analyzer is None:
+        from terminalfellow.utils.history import HistoryAnalyzer
+
+        _history_analyzer = HistoryAnalyzer()
+    return _history_analyzer
+
+
 @app.callback()
 def callback():
     """Terminal Fellow: Your fellow terminal assistant."""
@@ -51,6 +71,206 @@ def version():
     rprint(f"Terminal Fellow v{__version__}")
 
 
+@app.command(name="shell-init")
+def shell_init(
+    shell: str = typer.Argument(..., help="Shell to integrate with: bash, zsh or fish"),
+    key: Optional[str] = typer.Option(
+        None, "--key", help="Key binding in the shell's notation (default Ctrl-G)"
+    ),
+):
+    """Print the keybinding widget for your shell.
+
+    Add `eval "$(tf shell-init bash)"` to ~/.bashrc, the zsh equivalent to
+    ~/.zshrc, or `tf shell-init fish | source` to your fish config.
+    """
+    try:
+        print(get_init_script(shell, key))
+    except ValueError as e:
+        console.print(f"[bold red]{str(e)}[/]")
+        raise typer.Exit(1)
+
+
+@app.command()
+def daemon():
+    """Run the generator daemon used by the shell widgets."""
+    from terminalfellow.core.generator import GeneratorError
+    from terminalfellow.shell.daemon import run_daemon
+
+    try:
+        started = run_daemon()
+    except GeneratorError as e:
+        console.print(f"[bold red]{str(e)}[/]")
+        raise typer.Exit(1)
+
+    if not started:
+        console.print("[bold yellow]The Terminal Fellow daemon is already running.[/]")
+
+
+@app.command(name="next")
+def next_command(
+    count: int = typer.Option(1, "--count", "-n", help="Number of suggestions to show"),
+):
+    """Suggest the next command from your history without calling the model."""
+    suggestions = get_history_analyzer().suggest_next(max(count, 1))
+    if not suggestions:
+        console.print("[bold yellow]Not enough history to suggest a command.[/]")
+        raise typer.Exit(1)
+
+    # The best suggestion goes to stdout, alternatives to stderr
+    print(suggestions[0])
+    for suggestion in suggestions[1:]:
+        console.print(f"[dim]{suggestion}[/]")
+
+
+@history_app.command(name="search")
+def history_search(
+    query: List[str] = typer.Argument(..., help="Words to search for"),
+    limit: int = typer.Option(10, "--limit", "-n", help="Number of results"),
+    here: bool = typer.Option(
+        False, "--here", help="Only commands run in the current directory"
+    ),
+):
+    """Search your shell history, best match first."""
+    start = time.perf_counter()
+    results = get_history_analyzer().search_history(
+        " ".join(query), limit, cwd=os.getcwd() if here else None
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not results:
+        console.print("[bold yellow]No matching commands found.[/]")
+        raise typer.Exit(1)
+
+    for result in results:
+        print(result.command)
+    console.print(f"[dim]{len(results)} results in {elapsed:.1f} ms[/]")
+
+
+@history_app.command(name="record")
+def history_record(
+    command: str = typer.Argument(..., help="The command that ran"),
+    cwd: Optional[str] = typer.Option(None, "--cwd", help="Directory it ran in"),
+    exit_status: Optional[int] = typer.Option(
+        None, "--exit-status", help="Its exit status"
+    ),
+    shell: Optional[str] = typer.Option(None, "--shell", help="The shell it ran in"),
+):
+    """Record a command with its directory and exit status, for shell hooks."""
+    from terminalfellow.utils.history_store import HistoryStore
+
+    history_analyzer = get_history_analyzer()
+    if get_config_value("redact_history", True):
+        command = history_analyzer.scrubber.scrub(command)
+    with HistoryStore(history_analyzer.store_file) as store:
+        store.record(command, cwd, exit_status, shell)
+
+
+@app.command()
+def stats(
+    files: Optional[List[str]] = typer.Argument(
+        None, help="History files to read (default: your history file)"
+    ),
+    top: int = typer.Option(10, "--top", "-n", help="Number of top tools and flags"),
+    merge: Optional[List[str]] = typer.Option(
+        None, "--merge", help="Merge statistics exported on another host"
+    ),
+    export: Optional[str] = typer.Option(
+        None, "--export", help="Write the statistics to a file for merging"
+    ),
+    tools: Optional[List[str]] = typer.Option(
+        None, "--tool", "-t", help="Count a tool, however rarely it is used"
+    ),
+):
+    """Show tool, flag and distinct-command statistics in bounded memory."""
+    from terminalfellow.utils.history_stats import StreamingStats
+
+    history_stats = get_history_analyzer().streaming_stats(files or None)
+    for path in merge or []:
+        history_stats = history_stats.merge(StreamingStats.load(path))
+    if export:
+        history_stats.save(export)
+
+    summary = history_stats.summary(top)
+    rprint("[bold blue]History Statistics:[/]")
+    rprint(f"[bold]Commands:[/] {summary['count']}")
+    rprint(f"[bold]Distinct Commands:[/] ~{summary['distinct_commands']}")
+    rprint(f"[bold]Distinct Tools:[/] ~{summary['distinct_tools']}")
+    rprint("[bold]Top Tools:[/]")
+    for tool, count, error in summary["top_tools"]:
+        rprint(f"  {tool}: {count}" + (f" (at most {error} too high)" if error else ""))
+    rprint("[bold]Top Flags:[/]")
+    for flag, count, error in summary["top_flags"]:
+        rprint(f"  {flag}: {count}" + (f" (at most {error} too high)" if error else ""))
+    if tools:
+        rprint("[bold]Tool Counts:[/]")
+        for tool in tools:
+            rprint(f"  {tool}: at most {history_stats.tool_count(tool)}")
+
+
+@app.command()
+def cache(
+    clear: bool = typer.Option(False, "--clear", help="Drop all cached commands"),
+):
+    """Show or clear the semantic response cache."""
+    from terminalfellow.core.semantic_cache import SemanticCache
+
+    semantic_cache = SemanticCache(path=get_config_value("semantic_cache_file", None))
+    if clear:
+        semantic_cache.clear()
+        rprint("[bold green]Semantic cache cleared[/]")
+        return
+
+    stats = semantic_cache.stats
+    enabled = get_config_value("semantic_cache", False)
+    rprint("[bold blue]Semantic Cache:[/]")
+    rprint(f"[bold]Enabled:[/] {'Yes' if enabled else 'No'}")
+    rprint(f"[bold]Entries:[/] {len(semantic_cache.entries)}")
+    rprint(f"[bold]Exact Hits:[/] {stats['exact_hits']}")
+    rprint(f"[bold]Semantic Hits:[/] {stats['semantic_hits']}")
+    rprint(f"[bold]Misses:[/] {stats['misses']}")
+    rprint(f"[bold]False Hits:[/] {stats['false_hits']}")
+    rprint(f"[bold]Hit Rate:[/] {semantic_cache.hit_rate():.1%}")
+
+
+@app.command()
+def routing(
+    clear: bool = typer.Option(False, "--clear", help="Delete the routing log"),
+):
+    """Show how requests were routed between the fast and strong models."""
+    from terminalfellow.core.router import (
+        DEFAULT_ROUTING_LOG,
+        read_routing_log,
+        summarize_routing,
+    )
+
+    log_file = get_config_value("routing_log", None)
+    if clear:
+        try:
+            os.unlink(log_file or DEFAULT_ROUTING_LOG)
+        except OSError:
+            pass
+        rprint("[bold green]Routing log cleared[/]")
+        return
+
+    enabled = get_config_value("model_routing", False)
+    rprint("[bold blue]Model Routing:[/]")
+    rprint(f"[bold]Enabled:[/] {'Yes' if enabled else 'No'}")
+    rprint(f"[bold]Threshold:[/] {get_config_value('routing_threshold', 0.45)}")
+    summary = summarize_routing(read_routing_log(log_file))
+    if not summary:
+        rprint("No requests logged yet")
+        return
+    for tier, row in summary.items():
+        rprint(f"\n[bold]{tier.capitalize()} model calls:[/] {row['calls']}")
+        rprint(f"  Rejected answers: {row['rejected']}")
+        rprint(
+            f"  Latency p50/p95: {row['p50_latency']:.2f}s / {row['p95_latency']:.2f}s"
+        )
+        rprint(f"  Scores: {row['min_score']:.2f} to {row['max_score']:.2f}")
+        if row["min_rejected_score"] is not None:
+            rprint(f"  Lowest rejected score: {row['min_rejected_score']:.2f}")
+
+
 @app.command(name="config")
 def configure(
     openai_api_key: Optional[str] = typer.Option(
@@ -62,6 +282,11 @@ def configure(
     use_history: Optional[bool] = typer.Option(
         None, "--use-history", help="Enable or disable command history usage"
     ),
+    semantic_cache: Optional[bool] = typer.Option(
+        None,
+        "--semantic-cache/--no-semantic-cache",
+        help="Enable or disable serving cached commands for similar prompts",
+    ),
     show: bool = typer.Option(False, "--show", help="Show current configuration"),
 ):
     """Configure Terminal Fellow settings."""
@@ -96,7 +321,21 @@ def configure(
         else:
             rprint("[bold green]Command history usage disabled[/]")
 
-    if show or (not openai_api_key and not history_file and use_history is None):
+    if semantic_cache is not None:
+        config = load_config()
+        config["semantic_cache"] = semantic_cache
+        save_config(config)
+        if semantic_cache:
+            rprint("[bold green]Semantic cache enabled[/]")
+        else:
+            rprint("[bold green]Semantic cache disabled[/]")
+
+    if show or (
+        not openai_api_key
+        and not history_file
+        and use_history is None
+        and semantic_cache is None
+    ):
         # Show current configuration
         api_key = get_openai_api_key() or "[Not set]"
         # Hide full API key
@@ -114,10 +353,14 @@ def configure(
         rprint(f"[bold]API Key:[/] {api_key}")
         rprint(f"[bold]History File:[/] {history_file}")
         rprint(f"[bold]Use Command History:[/] {'Yes' if use_history else 'No'}")
+        semantic_cache = get_config_value("semantic_cache", False)
+        rprint(f"[bold]Semantic Cache:[/] {'Yes' if semantic_cache else 'No'}")
 
 
 def interactive_config():
     """Run interactive configuration wizard for Terminal Fellow."""
+    import questionary
+
     console.print("\n[bold blue]Terminal Fellow Configuration Wizard[/]")
     console.print("[blue]----------------------------------------[/]\n")
 
@@ -238,14 +481,60 @@ def interactive_config():
     return True
 
 
-def generate_command(prompt):
-    """Generate a command based on the natural language prompt."""
+def match_template(prompt, session=None):
+    """Answer a routine request from the offline intent templates.
+
+    Args:
+        prompt: Natural language request for a command
+        session: Session memory; follow-ups to it are left to the model
 
-    generator = CommandGenerator()
+    Returns:
+        The templated command, or None if the model should answer, and the
+        similarity of the request to the closest template example
+    """
+    from terminalfellow.core.intents import IntentMatcher
+
+    if not get_config_value("intent_templates", True):
+        return None, 0.0
+    if session is not None and session.follow_up_context(prompt):
+        return None, 0.0
+    matcher = IntentMatcher(get_config_value("intent_threshold", 0.35))
+    match, similarity = matcher.score(prompt)
+    return (match.command if match else None), similarity
+
+
+def generate_command(prompt, refresh=False):
+    """Generate a command based on the natural language prompt.
+
+    Args:
+        prompt: Natural language request for a command
+        refresh: Skip the semantic cache and report a cached answer as wrong
+    """
+    from terminalfellow.core.context import (
+        build_context,
+        get_session,
+        is_generated_command,
+    )
 
     try:
-        # Check if API key exists, if not run interactive config
-        if not get_openai_api_key():
+        # Routine requests are answered from templates, before anything slow
+        session = get_session()
+        templated, intent_similarity = (
+            (None, 0.0) if refresh else match_template(prompt, session)
+        )
+        if templated is not None:
+            if session is not None:
+                session.add_turn(prompt, templated)
+            print(templated)
+            return True
+
+        # Only a request for the model pays for importing its client
+        from terminalfellow.core.generator import CommandGenerator, GeneratorError
+
+        # Check if API key exists, if not run interactive config.
+        # Replaying a cassette serves recorded responses and needs no key.
+        replaying = get_config_value("cassette_mode") == "replay"
+        if not replaying and not get_openai_api_key():
             config_success = interactive_config()
             # If still no API key, exit
             if not config_success or not get_openai_api_key():
@@ -254,32 +543,39 @@ def generate_command(prompt):
                 )
                 return False
 
-        # Prepare context based on config
-        context = {}
-        config = load_config()
-
-        # Add current directory to context
-        context["cwd"] = os.getcwd()
+        try:
+            generator = CommandGenerator()
+        except GeneratorError as e:
+            console.print(f"[bold red]{str(e)}[/]")
+            return False
 
-        # Add history if enabled in config
-        if config.get("use_history", False):
-            try:
-                history_data = history_analyzer.analyze_history()
-                if history_data and "most_recent" in history_data:
-                    context["history"] = "\n".join(history_data["most_recent"])
-            except Exception as e:
-                console.print(
-                    f"[bold yellow]Warning: Could not analyze history: {str(e)}[/]"
-                )
+        # Prepare context based on config
+        context = build_context(
+            get_history_analyzer(),
+            on_warning=lambda message: console.print(
+                f"[bold yellow]Warning: {message}[/]"
+            ),
+            prompt=prompt,
+            session=session,
+        )
 
         # Generate the command with spinner
         with console.status("[bold yellow]Generating command...[/]", spinner="dots"):
             try:
-                command = generator.generate(prompt, context)
+                command = generator.generate(
+                    prompt,
+                    context,
+                    refresh=refresh,
+                    intent_similarity=intent_similarity,
+                )
             except Exception as e:
                 console.print(f"[bold red]Error generating command: {str(e)}[/]")
                 return False
 
+        # Remember the turn so follow-ups can refine it
+        if session is not None and is_generated_command(command):
+            session.add_turn(prompt, command)
+
         # Clear the line with carriage return and print the command
         sys.stdout.write("\r\033[K")  # Clear the current line
         print(command)  # Print just the command for easy copy-paste
@@ -295,6 +591,18 @@ def main():
         # Get all command line arguments
         args = sys.argv[1:]
 
+        # Profile in a fresh interpreter, so that imports are measured too.
+        # Nothing slower than typer and rich is imported by this point.
+        modes = [PROFILE_FLAGS[arg] for arg in args if arg in PROFILE_FLAGS]
+        if modes:
+            args = [arg for arg in args if arg not in PROFILE_FLAGS]
+            sys.stdout.flush()
+            os.execv(
+                sys.executable,
+                [sys.executable, "-m", "terminalfellow.utils.profiling", modes[0]]
+                + args,
+            )
+
         # Show help if no arguments
         if not args:
             app(["--help"])
@@ -315,10 +623,70 @@ def main():
             app(["version"])
             return
 
+        # "tf shell-init zsh" prints a widget; "tf shell-init for ..." is a prompt
+        if args[0] == "shell-init" and (
+            args[1:] == ["--help"]
+            or (
+                len(args) in (2, 4)
+                and args[1].lower() in WIDGET_SCRIPTS
+                and args[2:3] in ([], ["--key"])
+            )
+        ):
+            app(args)
+            return
+
+        # "tf daemon" runs the daemon; "tf daemon that restarts ..." is a prompt
+        if args[0] == "daemon" and args[1:] in ([], ["--help"]):
+            app(args)
+            return
+
+        # "tf cache" shows the cache; "tf cache npm packages" is a prompt
+        if args[0] == "cache" and args[1:] in ([], ["--clear"], ["--help"]):
+            app(args)
+            return
+
+        # "tf routing" shows the log; "tf routing table ..." is a prompt
+        if args[0] == "routing" and all(arg.startswith("-") for arg in args[1:]):
+            app(args)
+            return
+
+        # "tf history search ..." is a command; "tf history of ..." is a prompt
+        if (
+            args[0] == "history"
+            and len(args) > 1
+            and args[1]
+            in [
+                "search",
+                "record",
+                "--help",
+            ]
+        ):
+            app(args)
+            return
+
+        # "tf stats" takes history files; "tf stats for ..." is a prompt
+        if args[0] == "stats" and all(
+            arg.startswith("-") or os.path.exists(arg) for arg in args[1:2]
+        ):
+            app(args)
+            return
+
+        # "tf next" alone asks for a suggestion; "tf next friday ..." is a prompt
+        if args[0] == "next" and all(
+            arg.startswith("-") or arg.isdigit() for arg in args[1:]
+        ):
+            app(args)
+            return
+
         if args[0] in ["--help", "-h", "help"]:
             app(["--help"])
             return
 
+        # --fresh bypasses the semantic cache when it served a wrong command
+        refresh = args[0] == "--fresh"
+        if refresh:
+            args = args[1:]
+
         # If no specific command matched, treat everything as prompt
         prompt = " ".join(args)
         if not prompt.strip():
@@ -326,7 +694,7 @@ def main():
             return
 
         # Generate command based on prompt
-        generate_command(prompt)
+        generate_command(prompt, refresh=refresh)
 
     except KeyboardInterrupt:
         console.print("\n[bold yellow]Operation cancelled by user.[/]")
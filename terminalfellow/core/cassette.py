@@ -0,0 +1,152 @@
+"""Record/replay cassettes for LLM calls."""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+
+DEFAULT_CASSETTE_FILE = os.path.join(DEFAULT_CONFIG_DIR, "cassette.json")
+
+CASSETTE_MODES = ("record", "replay")
+
+
+class CassetteMiss(KeyError):
+    """Raised when a replayed prompt has no recorded response."""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so that insignificant whitespace does not change its key.
+
+    Args:
+        prompt: The full prompt text sent to the LLM
+
+    Returns:
+        The prompt with whitespace collapsed
+    """
+    return " ".join(prompt.split())
+
+
+def prompt_key(prompt: str, model: str = "") -> str:
+    """Compute the cassette key for a prompt.
+
+    Args:
+        prompt: The full prompt text sent to the LLM
+        model: The model the prompt is sent to
+
+    Returns:
+        A short hex digest identifying the request
+    """
+    payload = f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+class Cassette:
+    """Store LLM request/response pairs on disk and serve them back."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        mode: str = "replay",
+        latency: float = 0.0,
+    ):
+        """Initialize the cassette.
+
+        Args:
+            path: Path to the cassette file. If None, uses the default.
+            mode: Either "record" or "replay"
+            latency: Seconds to sleep before serving a replayed response
+        """
+        if mode not in CASSETTE_MODES:
+            raise ValueError(
+                f"Unknown cassette mode '{mode}', expected one of {CASSETTE_MODES}"
+            )
+        self.path = os.path.expanduser(path or DEFAULT_CASSETTE_FILE)
+        self.mode = mode
+        self.latency = float(latency or 0.0)
+        self.entries: Dict[str, str] = self._load()
+
+    @property
+    def recording(self) -> bool:
+        """Whether responses should be recorded."""
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        """Whether responses should be served from the cassette."""
+        return self.mode == "replay"
+
+    def _load(self) -> Dict[str, str]:
+        """Load recorded entries from disk.
+
+        Returns:
+            Mapping of prompt key to response text
+        """
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+
+    def save(self) -> None:
+        """Write recorded entries to disk."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, separators=(",", ":"), sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def record(self, prompt: str, response: str, model: str = "") -> None:
+        """Record a response for a prompt and persist the cassette.
+
+        Args:
+            prompt: The full prompt text sent to the LLM
+            response: The response text returned by the LLM
+            model: The model the prompt was sent to
+        """
+        self.entries[prompt_key(prompt, model)] = response
+        self.save()
+
+    def lookup(self, prompt: str, model: str = "") -> str:
+        """Look up the recorded response for a prompt without simulating latency.
+
+        Args:
+            prompt: The full prompt text sent to the LLM
+            model: The model the prompt was sent to
+
+        Returns:
+            The recorded response text
+
+        Raises:
+            CassetteMiss: If the prompt was never recorded
+        """
+        key = prompt_key(prompt, model)
+        if key not in self.entries:
+            raise CassetteMiss(f"No recorded response for prompt {key}")
+        return self.entries[key]
+
+    def play(self, prompt: str, model: str = "") -> str:
+        """Serve the recorded response for a prompt.
+
+        Args:
+            prompt: The full prompt text sent to the LLM
+            model: The model the prompt was sent to
+
+        Returns:
+            The recorded response text
+
+        Raises:
+            CassetteMiss: If the prompt was never recorded
+        """
+        response = self.lookup(prompt, model)
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return response
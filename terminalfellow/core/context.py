@@ -0,0 +1,95 @@
+"""Prompt context assembly for Terminal Fellow."""
+
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from terminalfellow.utils.config import load_config
+from terminalfellow.utils.session import SessionStore
+
+if TYPE_CHECKING:
+    # Only build_context needs the history modules; get_session stays cheap
+    from terminalfellow.utils.history import HistoryAnalyzer
+
+
+def build_context(
+    history_analyzer: "HistoryAnalyzer",
+    cwd: Optional[str] = None,
+    on_warning: Optional[Callable[[str], None]] = None,
+    prompt: Optional[str] = None,
+    session: Optional[SessionStore] = None,
+) -> Dict[str, Any]:
+    """Build the context passed to the command generator.
+
+    Args:
+        history_analyzer: Analyzer used to read the shell history
+        cwd: Working directory of the request. If None, uses the current one.
+        on_warning: Optional callback for non-fatal problems
+        prompt: The request, used to detect follow-ups to the session
+        session: Session memory of the requesting terminal
+
+    Returns:
+        Context dictionary for CommandGenerator.generate
+    """
+    context: Dict[str, Any] = {}
+    config = load_config()
+
+    # Add current directory to context
+    context["cwd"] = cwd or os.getcwd()
+
+    # A follow-up only needs the previous turn, not the full history
+    if session is not None and prompt:
+        follow_up = session.follow_up_context(prompt)
+        if follow_up:
+            context.update(follow_up)
+            return context
+
+    # Add history if enabled in config
+    if not config.get("use_history", False):
+        return context
+
+    # A stable profile keeps prompts short and their prefix cacheable
+    if config.get("history_context", "profile") == "profile":
+        from terminalfellow.utils.profile import ProfileStore
+
+        try:
+            store = ProfileStore(config.get("profile_file"), history_analyzer.sources)
+            context["profile"] = store.get_block(history_analyzer)
+        except Exception as e:
+            if on_warning:
+                on_warning(f"Could not build user profile: {str(e)}")
+    else:
+        try:
+            history_data = history_analyzer.analyze_history()
+            if history_data and "most_recent" in history_data:
+                context["history"] = "\n".join(history_data["most_recent"])
+        except Exception as e:
+            if on_warning:
+                on_warning(f"Could not analyze history: {str(e)}")
+
+    return context
+
+
+def get_session(session_id: Optional[str] = None) -> Optional[SessionStore]:
+    """Get the session memory for a terminal if session memory is enabled.
+
+    Args:
+        session_id: Session identifier. If None, uses the current terminal.
+
+    Returns:
+        The session store, or None if session memory is disabled
+    """
+    if not load_config().get("session_memory", True):
+        return None
+    return SessionStore(session_id)
+
+
+def is_generated_command(command: str) -> bool:
+    """Check whether generate() produced a command rather than an error.
+
+    Args:
+        command: The output of CommandGenerator.generate
+
+    Returns:
+        True if the command is worth remembering
+    """
+    return bool(command) and not command.startswith("echo 'Error generating command:")
@@ -1,17 +1,49 @@
 """Command generation module for Terminal Fellow."""
 
-from typing import Optional, Dict, Any, List
-import os
-import sys
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+import asyncio
+import hashlib
+import time
 
-from llama_index.core import Settings
 from llama_index.llms.openai import OpenAI
-from llama_index.core.prompts import PromptTemplate
 
 from terminalfellow.core import prompts
+from terminalfellow.core.cassette import Cassette
+from terminalfellow.core.intents import IntentMatcher
+from terminalfellow.core.router import (
+    FAST,
+    ModelRouter,
+    RouteDecision,
+    avalidate_command,
+    validate_command,
+)
+from terminalfellow.core.scheduler import (
+    INTERACTIVE,
+    PRIORITIES,
+    RateLimitScheduler,
+    estimate_tokens,
+    get_scheduler,
+)
+from terminalfellow.core.semantic_cache import SemanticCache, classify_directory
 from terminalfellow.utils.config import get_openai_api_key, get_config_value
 
 
+class GeneratorError(Exception):
+    """Base class for command generator errors."""
+
+
+class LLMSetupError(GeneratorError):
+    """Raised when the LLM client cannot be set up."""
+
+
+class GenerationError(GeneratorError):
+    """Raised when a command cannot be generated."""
+
+
+class GenerationTimeout(GenerationError):
+    """Raised when a command is not generated within the requested timeout."""
+
+
 class CommandGenerator:
     """Generate commands based on natural language requests."""
 
@@ -23,10 +55,247 @@ class CommandGenerator:
         """
         self.config = config or {}
         self.prompt_type = self.config.get("prompt_type", "default")
-        self._setup_llm()
+        self.model = self.config.get("model") or get_config_value(
+            "model", "gpt-3.5-turbo"
+        )
+        self.router = self._setup_router()
+        if self.router:
+            self.model = self.router.strong_model
+        self.cassette = self._setup_cassette()
+        self.intent_matcher = self._setup_intents()
+        self.semantic_cache = self._setup_semantic_cache()
+        # Batch jobs yield to interactive requests sharing the same quota
+        self.priority = PRIORITIES.get(
+            self.config.get("priority", "interactive"), INTERACTIVE
+        )
+        # Requests sharing a key share its quota, whichever generator sends them
+        self.scheduler: RateLimitScheduler = (
+            self.config.get("scheduler") or get_scheduler()
+        )
+        self.rate_limit_key = "default"
+
+        # Replaying needs neither an API key nor network access
+        self.fast_llm = None
+        if self.cassette and self.cassette.replaying:
+            self.llm = None
+            self.using_openai = False
+        else:
+            self._setup_llm()
+
+    def _setup_cassette(self) -> Optional[Cassette]:
+        """Set up the record/replay cassette if one is configured.
+
+        Returns:
+            The configured cassette, or None when record/replay is disabled
+        """
+        mode = self.config.get("cassette_mode") or get_config_value("cassette_mode")
+        if not mode:
+            return None
+
+        return Cassette(
+            path=self.config.get("cassette_file") or get_config_value("cassette_file"),
+            mode=mode,
+            latency=self.config.get("cassette_latency")
+            or get_config_value("cassette_latency", 0.0),
+        )
+
+    def _setup_router(self) -> Optional[ModelRouter]:
+        """Set up routing between a fast and a strong model if it is enabled.
+
+        Returns:
+            The router, or None when every request uses the configured model
+        """
+        enabled = self.config.get("model_routing")
+        if enabled is None:
+            enabled = get_config_value("model_routing", False)
+        if not enabled:
+            return None
+
+        def setting(key: str, default: Any) -> Any:
+            value = self.config.get(key)
+            return value if value is not None else get_config_value(key, default)
+
+        return ModelRouter(
+            fast_model=setting("fast_model", "gpt-3.5-turbo"),
+            strong_model=setting("strong_model", self.model),
+            threshold=setting("routing_threshold", 0.45),
+            log_file=setting("routing_log", None),
+        )
+
+    def _route(self, query: str, retrieval: float = 0.0) -> RouteDecision:
+        """Choose the model for a query.
+
+        Requests close to a routine request or to one answered before count
+        as easier, since the fast model rarely gets those wrong.
+
+        Args:
+            query: Natural language request for a command
+            retrieval: Similarity found by the template and cache lookups
+
+        Returns:
+            The decision, on the configured model when routing is disabled
+        """
+        if not self.router:
+            return RouteDecision("default", self.model, 0.0, {})
+        return self.router.route(query, retrieval)
+
+    def _client(self, model: str) -> Any:
+        """Get the LLM client for a model.
+
+        Args:
+            model: The model chosen by the router
+
+        Returns:
+            The client
+        """
+        if model != self.model and self.fast_llm is not None:
+            return self.fast_llm
+        return self.llm
+
+    def _setup_intents(self) -> Optional[IntentMatcher]:
+        """Set up the offline intent templates if they are enabled.
+
+        Returns:
+            The matcher, or None when templates are disabled
+        """
+        enabled = self.config.get("intent_templates")
+        if enabled is None:
+            enabled = get_config_value("intent_templates", True)
+        if not enabled:
+            return None
+
+        threshold = self.config.get("intent_threshold")
+        if threshold is None:
+            threshold = get_config_value("intent_threshold", 0.35)
+        return IntentMatcher(threshold=threshold)
+
+    def _local_answer(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]],
+        refresh: bool,
+        intent_similarity: Optional[float] = None,
+    ) -> Tuple[Optional[str], float]:
+        """Answer a query from the intent templates or the semantic cache.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information
+            refresh: Skip the templates and count a cache hit as false
+            intent_similarity: Similarity to the templates from a lookup the
+                caller already made and missed; the templates are then
+                not consulted again
+
+        Returns:
+            The command, or None when the LLM should answer, and how close
+            the query is to a routine request or one answered before
+        """
+        if intent_similarity is None:
+            templated, intent_similarity = self._intent_lookup(query, context, refresh)
+            if templated is not None:
+                return templated, intent_similarity
+        cached, cache_similarity = self._cache_lookup(query, context, refresh)
+        return cached, max(intent_similarity, cache_similarity)
+
+    def _intent_lookup(
+        self, query: str, context: Optional[Dict[str, Any]], refresh: bool
+    ) -> Tuple[Optional[str], float]:
+        """Answer a routine query from the intent templates.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information
+            refresh: Skip the templates, e.g. because one answered wrongly
+
+        Returns:
+            The templated command, or None when the LLM should answer, and
+            the similarity of the query to the closest template example
+        """
+        context = context or {}
+        # Follow-ups refine the previous command, which templates cannot do
+        if not self.intent_matcher or refresh or context.get("previous_command"):
+            return None, 0.0
+
+        match, similarity = self.intent_matcher.score(query)
+        return (match.command if match else None), similarity
+
+    def _setup_semantic_cache(self) -> Optional[SemanticCache]:
+        """Set up the semantic response cache if it is enabled.
+
+        Returns:
+            The cache, or None when caching is disabled
+        """
+        enabled = self.config.get("semantic_cache")
+        if enabled is None:
+            enabled = get_config_value("semantic_cache", False)
+        if not enabled:
+            return None
+
+        def setting(key: str, default: Any) -> Any:
+            value = self.config.get(key)
+            return value if value is not None else get_config_value(key, default)
+
+        return SemanticCache(
+            path=setting("semantic_cache_file", None),
+            threshold=setting("semantic_cache_threshold", 0.9),
+            max_entries=setting("semantic_cache_size", 500),
+            policy=setting("semantic_cache_policy", "lru"),
+        )
+
+    def _cache_lookup(
+        self, query: str, context: Optional[Dict[str, Any]], refresh: bool
+    ) -> Tuple[Optional[str], float]:
+        """Look up a cached command for a query.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information
+            refresh: Count a hit as false and drop it instead of serving it
+
+        Returns:
+            The cached command, or None, and the similarity of the query to
+            the closest cached request
+        """
+        context = context or {}
+        # Follow-ups depend on the previous command, not just on the wording
+        if not self.semantic_cache or context.get("previous_command"):
+            return None, 0.0
+
+        cached = self.semantic_cache.lookup(
+            query, classify_directory(context.get("cwd"))
+        )
+        if cached is not None and refresh:
+            # A wrong answer says nothing about how easy the request is
+            self.semantic_cache.report_false_hit()
+            return None, 0.0
+        return cached, self.semantic_cache.last_similarity
+
+    def _cache_store(
+        self, query: str, context: Optional[Dict[str, Any]], command: str
+    ) -> None:
+        """Cache a freshly generated command.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information
+            command: The generated command
+        """
+        context = context or {}
+        if not self.semantic_cache or context.get("previous_command") or not command:
+            return
+        self.semantic_cache.store(
+            query, classify_directory(context.get("cwd")), command
+        )
 
     def _setup_llm(self):
-        """Set up the LLM for command generation."""
+        """Set up the LLM for command generation.
+
+        The client is kept on the instance rather than in the global LlamaIndex
+        settings, so several generators can coexist in one process.
+
+        Raises:
+            LLMSetupError: If no API key is configured or the client fails to start
+        """
         system_prompt = self.config.get(
             "system_prompt", prompts.get_system_prompt(self.prompt_type)
         )
@@ -34,66 +303,336 @@ class CommandGenerator:
         # Get OpenAI API key from config or environment
         api_key = self.config.get("openai_api_key") or get_openai_api_key()
 
-        # Get the model from config or default to gpt-3.5-turbo
-        model = self.config.get("model") or get_config_value("model", "gpt-3.5-turbo")
+        if not api_key:
+            raise LLMSetupError(
+                "No OpenAI API key found. Please run 'tf --config' to set up your configuration."
+            )
 
-        if api_key:
-            # Set the API key in the environment
-            os.environ["OPENAI_API_KEY"] = api_key
+        self.rate_limit_key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
 
-            try:
-                # Try to use OpenAI if API key is available
-                self.llm = OpenAI(
-                    model=model,
+        try:
+            self.llm = OpenAI(
+                model=self.model,
+                temperature=0.1,
+                system_prompt=system_prompt,
+                api_key=api_key,
+                # The scheduler retries with backoff shared across requests
+                max_retries=0,
+            )
+            if self.router and self.router.fast_model != self.model:
+                self.fast_llm = OpenAI(
+                    model=self.router.fast_model,
                     temperature=0.1,
                     system_prompt=system_prompt,
                     api_key=api_key,
+                    max_retries=0,
                 )
-                Settings.llm = self.llm
-                self.using_openai = True
-                return
-            except Exception as e:
-                # Display error and exit instead of falling back to templates
-                print(f"Error initializing OpenAI API: {e}", file=sys.stderr)
-                print(
-                    "Please check your API key and internet connection.",
-                    file=sys.stderr,
-                )
-                sys.exit(1)
-        else:
-            print(
-                "No OpenAI API key found. Please run 'tf --config' to set up your configuration.",
-                file=sys.stderr,
-            )
-            sys.exit(1)
+            self.using_openai = True
+        except Exception as e:
+            raise LLMSetupError(
+                f"Error initializing OpenAI API: {e}. "
+                "Please check your API key and internet connection."
+            ) from e
 
-    def generate(self, query: str, context: Optional[Dict[str, Any]] = None) -> str:
+    def generate(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]] = None,
+        refresh: bool = False,
+        intent_similarity: Optional[float] = None,
+    ) -> str:
         """Generate a command based on the natural language query.
 
         Args:
             query: Natural language request for a command
             context: Optional context information (history, current directory, etc.)
+            refresh: Bypass the templates and the semantic cache, counting a
+                would-be cache hit as false
+            intent_similarity: Similarity to the templates from a lookup the
+                caller already made and missed, so it is not repeated
+
+        Returns:
+            A shell command that satisfies the request
+        """
+        answer, retrieval = self._local_answer(
+            query, context, refresh, intent_similarity
+        )
+        if answer is not None:
+            return answer
+
+        try:
+            # Use LlamaIndex with OpenAI
+            prompt_text = self._build_prompt(query, context)
+            command = self._routed_complete(query, retrieval, prompt_text).strip()
+        except Exception as e:
+            # Return error as command
+            return f"echo 'Error generating command: {str(e)}'"
+
+        self._cache_store(query, context, command)
+        return command
+
+    async def agenerate(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        refresh: bool = False,
+    ) -> str:
+        """Asynchronously generate a command based on the natural language query.
+
+        Unlike generate(), failures are raised rather than returned as a command.
+        The coroutine holds no per-call state on the instance, so one generator
+        can serve many concurrent requests. Cancelling the awaiting task cancels
+        the underlying LLM request.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information (history, current directory, etc.)
+            timeout: Optional number of seconds to wait for the LLM
+            refresh: Bypass the templates and the semantic cache, counting a
+                would-be cache hit as false
 
         Returns:
             A shell command that satisfies the request
+
+        Raises:
+            GenerationTimeout: If the LLM does not answer within the timeout
+            GenerationError: If the prompt cannot be built or the LLM call fails
+        """
+        answer, retrieval = self._local_answer(query, context, refresh)
+        if answer is not None:
+            return answer
+
+        try:
+            prompt_text = self._build_prompt(query, context)
+        except Exception as e:
+            raise GenerationError(f"Could not build prompt: {e}") from e
+
+        try:
+            text = await asyncio.wait_for(
+                self._arouted_complete(query, retrieval, prompt_text), timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise GenerationTimeout(
+                f"No response from the LLM within {timeout} seconds"
+            ) from e
+        except Exception as e:
+            raise GenerationError(f"Error generating command: {e}") from e
+
+        command = text.strip()
+        self._cache_store(query, context, command)
+        return command
+
+    async def astream(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]] = None,
+        refresh: bool = False,
+    ) -> AsyncIterator[str]:
+        """Stream a generated command as text deltas.
+
+        Failures are raised like in agenerate(). Closing or cancelling the
+        consumer cancels the underlying LLM request.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information (history, current directory, etc.)
+            refresh: Bypass the templates and the semantic cache, counting a
+                would-be cache hit as false
+
+        Yields:
+            Pieces of the command text in the order they arrive
+
+        Raises:
+            GenerationError: If the prompt cannot be built or the LLM call fails
+        """
+        answer, retrieval = self._local_answer(query, context, refresh)
+        if answer is not None:
+            yield answer
+            return
+
+        try:
+            prompt_text = self._build_prompt(query, context)
+        except Exception as e:
+            raise GenerationError(f"Could not build prompt: {e}") from e
+
+        # Streamed text cannot be taken back, so streams are never escalated
+        decision = self._route(query, retrieval)
+        if self.cassette and self.cassette.replaying:
+            # Recorded responses are served in one piece
+            try:
+                text = await self._acomplete(prompt_text, decision.model)
+            except Exception as e:
+                raise GenerationError(f"Error generating command: {e}") from e
+            self._cache_store(query, context, text.strip())
+            yield text
+            return
+
+        chunks = []
+        start = time.perf_counter()
+        try:
+            # A stream cannot be replayed once it started, so it is not retried
+            async with self.scheduler.slot(
+                key=self.rate_limit_key,
+                tokens=estimate_tokens(prompt_text),
+                priority=self.priority,
+            ):
+                stream = await self._client(decision.model).astream_complete(
+                    prompt_text
+                )
+                async for response in stream:
+                    if response.delta:
+                        chunks.append(response.delta)
+                        yield response.delta
+        except Exception as e:
+            raise GenerationError(f"Error generating command: {e}") from e
+
+        if self.router:
+            self.router.log(decision, time.perf_counter() - start)
+        if self.cassette and self.cassette.recording:
+            self.cassette.record(prompt_text, "".join(chunks), decision.model)
+        self._cache_store(query, context, "".join(chunks).strip())
+
+    def _routed_complete(self, query: str, retrieval: float, prompt_text: str) -> str:
+        """Send a prompt to the model chosen by the router.
+
+        An answer from the fast model that is not a valid command is retried
+        once with the strong model.
+
+        Args:
+            query: Natural language request for a command
+            retrieval: Similarity found by the template and cache lookups
+            prompt_text: The fully formatted prompt
+
+        Returns:
+            The raw response text
+        """
+        decision = self._route(query, retrieval)
+        start = time.perf_counter()
+        text = self._complete(prompt_text, decision.model)
+        if not self.router:
+            return text
+
+        rejected = validate_command(text.strip()) if decision.tier == FAST else None
+        self.router.log(decision, time.perf_counter() - start, rejected)
+        if rejected is None:
+            return text
+
+        decision = self.router.escalate(decision)
+        start = time.perf_counter()
+        text = self._complete(prompt_text, decision.model)
+        self.router.log(decision, time.perf_counter() - start)
+        return text
+
+    async def _arouted_complete(
+        self, query: str, retrieval: float, prompt_text: str
+    ) -> str:
+        """Asynchronously send a prompt to the model chosen by the router.
+
+        Args:
+            query: Natural language request for a command
+            retrieval: Similarity found by the template and cache lookups
+            prompt_text: The fully formatted prompt
+
+        Returns:
+            The raw response text
+        """
+        decision = self._route(query, retrieval)
+        start = time.perf_counter()
+        text = await self._acomplete(prompt_text, decision.model)
+        if not self.router:
+            return text
+
+        rejected = None
+        if decision.tier == FAST:
+            rejected = await avalidate_command(text.strip())
+        self.router.log(decision, time.perf_counter() - start, rejected)
+        if rejected is None:
+            return text
+
+        decision = self.router.escalate(decision)
+        start = time.perf_counter()
+        text = await self._acomplete(prompt_text, decision.model)
+        self.router.log(decision, time.perf_counter() - start)
+        return text
+
+    def _build_prompt(self, query: str, context: Optional[Dict[str, Any]]) -> str:
+        """Select and format the command prompt for a query.
+
+        Args:
+            query: Natural language request for a command
+            context: Optional context information (history, current directory, etc.)
+
+        Returns:
+            The fully formatted prompt
         """
         context = context or {}
         prompt_args = {"query": query, **context}
 
         # Determine which prompt to use based on available context
-        if "history" in context and context["history"]:
+        if context.get("previous_command"):
+            prompt_type = "with_session"
+        elif context.get("profile"):
+            prompt_type = "with_profile"
+        elif "history" in context and context["history"]:
             prompt_type = "with_history"
         elif all(k in context for k in ["cwd", "recent_commands", "frequent_tools"]):
             prompt_type = "with_context"
         else:
             prompt_type = self.prompt_type
 
-        try:
-            # Use LlamaIndex with OpenAI
-            prompt_text = prompts.format_command_prompt(prompt_type, **prompt_args)
-            prompt = PromptTemplate(prompt_text)
-            response = self.llm.complete(prompt_text)
-            return response.text.strip()
-        except Exception as e:
-            # Return error as command
-            return f"echo 'Error generating command: {str(e)}'"
+        return prompts.format_command_prompt(prompt_type, **prompt_args)
+
+    def _complete(self, prompt_text: str, model: Optional[str] = None) -> str:
+        """Send a prompt to the LLM, going through the cassette if configured.
+
+        Args:
+            prompt_text: The fully formatted prompt
+            model: Model to use. If None, uses the configured model.
+
+        Returns:
+            The raw response text
+        """
+        model = model or self.model
+        if self.cassette and self.cassette.replaying:
+            return self.cassette.play(prompt_text, model)
+
+        llm = self._client(model)
+        text = self.scheduler.call(
+            lambda: llm.complete(prompt_text).text,
+            key=self.rate_limit_key,
+            tokens=estimate_tokens(prompt_text),
+            priority=self.priority,
+        )
+        if self.cassette and self.cassette.recording:
+            self.cassette.record(prompt_text, text, model)
+        return text
+
+    async def _acomplete(self, prompt_text: str, model: Optional[str] = None) -> str:
+        """Asynchronously send a prompt to the LLM, going through the cassette.
+
+        Args:
+            prompt_text: The fully formatted prompt
+            model: Model to use. If None, uses the configured model.
+
+        Returns:
+            The raw response text
+        """
+        model = model or self.model
+        if self.cassette and self.cassette.replaying:
+            text = self.cassette.lookup(prompt_text, model)
+            if self.cassette.latency > 0:
+                await asyncio.sleep(self.cassette.latency)
+            return text
+
+        llm = self._client(model)
+        response = await self.scheduler.acall(
+            lambda: llm.acomplete(prompt_text),
+            key=self.rate_limit_key,
+            tokens=estimate_tokens(prompt_text),
+            priority=self.priority,
+        )
+        text = response.text
+        if self.cassette and self.cassette.recording:
+            self.cassette.record(prompt_text, text, model)
+        return text
@@ -0,0 +1,632 @@
+"""Offline intent templates for routine command requests."""
+
+import os
+import re
+import shlex
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from terminalfellow.core.semantic_cache import STOPWORDS, SYNONYMS, embed
+
+# Words that carry no meaning for any template
+COMMON_WORDS = frozenset(
+    "what which how command want need do does there using some every any "
+    "would like give tell let run".split()
+)
+
+WORD_PATTERN = re.compile(r"[\w.~/*@+:-]+")
+
+ARCHIVE_EXTENSIONS = {
+    ".tar.gz": ("tar -xzf", "-C"),
+    ".tgz": ("tar -xzf", "-C"),
+    ".tar.bz2": ("tar -xjf", "-C"),
+    ".tbz2": ("tar -xjf", "-C"),
+    ".tar.xz": ("tar -xJf", "-C"),
+    ".txz": ("tar -xJf", "-C"),
+    ".tar": ("tar -xf", "-C"),
+    ".zip": ("unzip", "-d"),
+}
+
+ARCHIVE_PATTERN = re.compile(
+    r"(?<!\S)([\w~./-]+(?:"
+    + "|".join(re.escape(ext) for ext in ARCHIVE_EXTENSIONS)
+    + r"))(?=[\s,.?!]*(?:\s|$))",
+    re.IGNORECASE,
+)
+PORT_PATTERN = re.compile(
+    r"\bport\s*:?\s*(\d{1,5})\b|(?<!\S):(\d{2,5})\b", re.IGNORECASE
+)
+SIZE_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?)\s*(bytes?|[kmgt]i?b?)\b", re.IGNORECASE)
+DURATION_PATTERN = re.compile(
+    r"\b(?:(\d+|an?|one)\s*|(?<=last |past ))(minutes?|mins?|hours?|hrs?|h|days?|d|"
+    r"weeks?|w|months?|years?|yrs?)\b",
+    re.IGNORECASE,
+)
+GLOB_PATTERN = re.compile(r"(?<!\S)(\*[\w.*?-]*|\.[A-Za-z0-9]{1,10})(?=[\s,?!]|$)")
+PATH_PATTERN = re.compile(
+    r"(?<!\S)(~(?:/[^\s,?!]*)?|\.{1,2}(?:/[^\s,?!]*)?|/[^\s,?!]*|"
+    r"[\w.-]+/[^\s,?!]*)(?=[\s,?!]|$)"
+)
+COUNT_PATTERN = re.compile(r"(?<![\w.:])(\d{1,4})(?![\w.])")
+FREE_WORD = re.compile(r"^[\w][\w.@+-]*$")
+# A bare word naming a directory; "video.mp4" is a file tar is no use for
+DIRECTORY_WORD = re.compile(r"^[\w][\w@+-]*$")
+
+# Words before a duration or size that say which side of it is wanted
+OLDER = re.compile(r"\b(older|before|more than|over|at least)\b")
+NEWER = re.compile(r"\b(last|past|within|newer|less than|under|recent\w*|since)\b")
+LARGER = re.compile(
+    r"\b(larger|bigger|greater|over|above|more than|exceed\w*|at least)\b"
+)
+SMALLER = re.compile(r"\b(smaller|less than|under|below|at most)\b")
+
+# Minutes per duration unit; days and longer are matched with -mtime
+MINUTES = {"m": 1, "h": 60, "d": 1440, "w": 7 * 1440, "mo": 30 * 1440, "y": 365 * 1440}
+SIZE_UNITS = {"b": "c", "k": "k", "m": "M", "g": "G"}
+
+
+class IntentMatch(NamedTuple):
+    """A request answered by a template."""
+
+    intent: str
+    command: str
+    confidence: float
+    slots: Dict[str, str]
+
+
+class Intent(NamedTuple):
+    """A parametrized command and the requests it answers."""
+
+    name: str
+    # Must match the lowercase request, with slot values blanked out,
+    # before the intent is considered
+    trigger: "re.Pattern[str]"
+    # Canonical words (see normalize_tokens) a request may contain
+    vocabulary: FrozenSet[str]
+    # Slots the template uses; any other extracted slot rules the intent out
+    slots: FrozenSet[str]
+    required: FrozenSet[str]
+    # Slot filled by the one word left over, e.g. a process name
+    free_slot: Optional[str]
+    examples: Tuple[str, ...]
+    build: Callable[[Dict[str, str]], str]
+    # What the word left over must look like to fill the free slot
+    free_pattern: "re.Pattern[str]" = FREE_WORD
+    # Similarity needed on top of the matcher's threshold, for commands
+    # that do damage when they answer the wrong request
+    min_confidence: float = 0.0
+
+
+def quote_path(path: str) -> str:
+    """Quote a path for the shell without disabling ~ expansion.
+
+    Args:
+        path: A path typed by the user
+
+    Returns:
+        The shell-quoted path
+    """
+    if path == "~":
+        return path
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:]) if path[2:] else "~/"
+    return shlex.quote(path)
+
+
+def _direction(
+    text: str, end: int, plus: "re.Pattern[str]", minus: "re.Pattern[str]"
+) -> Optional[str]:
+    """Find whether a quantity is a lower or an upper bound.
+
+    Args:
+        text: The request
+        end: Position where the quantity ends
+        plus: Words meaning "more than"
+        minus: Words meaning "less than"
+
+    Returns:
+        "+", "-", or None if the request does not say
+    """
+    # The closest qualifying word before the quantity wins
+    window = text[max(0, end - 40) : end].lower()
+    best: Tuple[int, Optional[str]] = (-1, None)
+    for sign, pattern in (("+", plus), ("-", minus)):
+        for match in pattern.finditer(window):
+            if match.start() > best[0]:
+                best = (match.start(), sign)
+    return best[1]
+
+
+def _format_age(number: Optional[str], unit: str, sign: str) -> str:
+    """Turn a duration into find arguments.
+
+    Args:
+        number: Amount, as digits, "a"/"an"/"one" or None
+        unit: Unit word as typed
+        sign: "+" for older than, "-" for newer than
+
+    Returns:
+        -mmin or -mtime arguments
+    """
+    amount = int(number) if number and number.isdigit() else 1
+    unit = unit.lower()
+    key = "mo" if unit.startswith("mo") else "m" if unit.startswith("mi") else unit[0]
+    minutes = amount * MINUTES[key]
+    if minutes < 1440 or minutes % 1440:
+        return f"-mmin {sign}{minutes}"
+    return f"-mtime {sign}{minutes // 1440}"
+
+
+def _format_size(number: str, unit: str, sign: str) -> str:
+    """Turn a size into a find -size argument.
+
+    Args:
+        number: Amount, possibly with decimals
+        unit: Unit as typed, e.g. "MB" or "k"
+        sign: "+" for larger than, "-" for smaller than
+
+    Returns:
+        The -size argument, e.g. "+100M"
+    """
+    unit = unit.lower()[0]
+    amount = float(number)
+    if unit == "t":
+        unit, amount = "g", amount * 1024
+    # find only takes whole numbers, so fractions move to a smaller unit
+    smaller = {"g": "m", "m": "k", "k": "b"}
+    while amount != int(amount) and unit in smaller:
+        unit, amount = smaller[unit], amount * 1024
+    return f"{sign}{int(amount)}{SIZE_UNITS[unit]}"
+
+
+def extract_slots(prompt: str) -> Tuple[Dict[str, str], str]:
+    """Extract paths, durations, sizes and other values from a request.
+
+    A duration or size whose direction is not stated gets an empty value.
+
+    Args:
+        prompt: Natural language request for a command
+
+    Returns:
+        The slots found, and the request with their text blanked out
+    """
+    slots: Dict[str, str] = {}
+    rest = list(prompt)
+
+    def first_free(pattern: "re.Pattern[str]") -> Optional["re.Match[str]"]:
+        # Search the remaining text so slots never overlap
+        match = pattern.search("".join(rest))
+        if match is not None:
+            rest[match.start() : match.end()] = " " * (match.end() - match.start())
+        return match
+
+    match = first_free(ARCHIVE_PATTERN)
+    if match:
+        slots["archive"] = match.group(1)
+
+    match = first_free(PORT_PATTERN)
+    if match:
+        slots["port"] = match.group(1) or match.group(2)
+
+    match = first_free(SIZE_PATTERN)
+    if match:
+        sign = _direction(prompt, match.start(), LARGER, SMALLER)
+        slots["size"] = (
+            _format_size(match.group(1), match.group(2), sign) if sign else ""
+        )
+
+    match = first_free(DURATION_PATTERN)
+    if match:
+        sign = _direction(prompt, match.end(), OLDER, NEWER)
+        slots["age"] = _format_age(match.group(1), match.group(2), sign) if sign else ""
+
+    match = first_free(GLOB_PATTERN)
+    if match:
+        pattern = match.group(1)
+        slots["pattern"] = pattern if pattern.startswith("*") else f"*{pattern}"
+
+    match = first_free(PATH_PATTERN)
+    if match:
+        slots["path"] = match.group(1)
+
+    match = first_free(COUNT_PATTERN)
+    if match:
+        slots["count"] = match.group(1)
+
+    return slots, "".join(rest)
+
+
+def _words(text: str) -> List[Tuple[str, str]]:
+    """Split text into words that may carry meaning.
+
+    Args:
+        text: Request text with slot values blanked out
+
+    Returns:
+        (word as typed, canonical lowercase form) pairs
+    """
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        word = word.strip(".,:")
+        lower = word.lower()
+        if not word or lower in STOPWORDS or lower in COMMON_WORDS:
+            continue
+        canonical = SYNONYMS.get(lower, lower)
+        if canonical in STOPWORDS:
+            continue
+        words.append((word, canonical))
+    return words
+
+
+def _path(slots: Dict[str, str]) -> str:
+    """Get the quoted path slot, defaulting to the current directory.
+
+    Args:
+        slots: Extracted slots
+
+    Returns:
+        The shell-quoted path
+    """
+    return quote_path(slots.get("path", "."))
+
+
+def _build_tar_create(slots: Dict[str, str]) -> str:
+    """Build an archiving command, named after the path unless a name is given.
+
+    Args:
+        slots: Extracted slots
+
+    Returns:
+        The tar or zip command
+    """
+    path = slots.get("path", ".")
+    archive = slots.get("archive")
+    if archive is None:
+        name = os.path.basename(os.path.normpath(os.path.expanduser(path)))
+        archive = (
+            f"{name}.tar.gz" if name not in ("", ".", "..", "/") else "archive.tar.gz"
+        )
+    if archive.lower().endswith(".zip"):
+        return f"zip -r {quote_path(archive)} {quote_path(path)}"
+    flags = ARCHIVE_EXTENSIONS[_archive_extension(archive)][0].replace("-x", "-c")
+    return f"{flags} {quote_path(archive)} {quote_path(path)}"
+
+
+def _archive_extension(archive: str) -> str:
+    """Get the longest known archive extension of a file name.
+
+    Args:
+        archive: Archive file name
+
+    Returns:
+        A key of ARCHIVE_EXTENSIONS
+    """
+    lower = archive.lower()
+    return max((ext for ext in ARCHIVE_EXTENSIONS if lower.endswith(ext)), key=len)
+
+
+def _build_tar_extract(slots: Dict[str, str]) -> str:
+    """Build an extraction command, into the path slot if one is given.
+
+    Args:
+        slots: Extracted slots
+
+    Returns:
+        The tar or unzip command
+    """
+    archive = slots["archive"]
+    command, destination_flag = ARCHIVE_EXTENSIONS[_archive_extension(archive)]
+    command = f"{command} {quote_path(archive)}"
+    if "path" in slots:
+        command += f" {destination_flag} {quote_path(slots['path'])}"
+    return command
+
+
+def _intent(
+    name: str,
+    trigger: str,
+    vocabulary: str,
+    slots: str,
+    required: str,
+    examples: Tuple[str, ...],
+    build: Callable[[Dict[str, str]], str],
+    free_slot: Optional[str] = None,
+    free_pattern: "re.Pattern[str]" = FREE_WORD,
+    min_confidence: float = 0.0,
+) -> Intent:
+    """Define an intent from space-separated word lists.
+
+    Args:
+        name: Intent name
+        trigger: Regular expression the lowercase request must match, with
+            slot values blanked out
+        vocabulary: Canonical words the request may contain
+        slots: Slots the template uses
+        required: Slots the template needs
+        examples: Requests the intent answers, for similarity scoring
+        build: Function formatting the command from the slots
+        free_slot: Slot filled by a single unknown word
+        free_pattern: What that word must look like
+        min_confidence: Minimum similarity to an example, if higher than
+            the matcher's threshold
+
+    Returns:
+        The intent
+    """
+    return Intent(
+        name=name,
+        trigger=re.compile(trigger),
+        vocabulary=frozenset(vocabulary.split()),
+        slots=frozenset(slots.split()),
+        required=frozenset(required.split()),
+        free_slot=free_slot,
+        examples=examples,
+        build=build,
+        free_pattern=free_pattern,
+        min_confidence=min_confidence,
+    )
+
+
+FILE_WORDS = "search list file directory every "
+
+INTENTS = [
+    _intent(
+        "find_by_age",
+        r"\b(modified|changed|edited|updated|touched|older|newer|last|past|within|ago)\b",
+        FILE_WORDS + "modified changed edited updated touched older newer than "
+        "last past within ago more less over under before since were have been was",
+        "age path",
+        "age",
+        (
+            "find files modified in the last 2 days",
+            "files older than 30 days",
+            "list files changed within the past hour",
+        ),
+        lambda slots: f"find {_path(slots)} -type f {slots['age']}",
+    ),
+    _intent(
+        "find_by_size",
+        r"\b(larger|bigger|greater|over|above|more|exceed\w*|smaller|less|under|below|least|most)\b",
+        FILE_WORDS + "large larger greater than over above more exceeding "
+        "little less under below size least most",
+        "size path",
+        "size",
+        (
+            "find files larger than 100MB",
+            "files bigger than 1 gb",
+            "list files smaller than 10k",
+        ),
+        lambda slots: f"find {_path(slots)} -type f -size {slots['size']}",
+    ),
+    _intent(
+        "find_by_name",
+        r"\b(find|search|locate|list|show|where|files?)\b",
+        FILE_WORDS + "named called matching extension ending where",
+        "pattern path",
+        "pattern",
+        ("find all *.log files", "find files named *.py", "list .txt files here"),
+        lambda slots: f"find {_path(slots)} -type f -name {shlex.quote(slots['pattern'])}",
+    ),
+    _intent(
+        "largest_files",
+        r"\b(largest|biggest|heaviest|huge|big|large|most space)\b",
+        FILE_WORDS + "large top most space disk taking take up sorted by size",
+        "path count",
+        "",
+        (
+            "show the 10 largest files",
+            "biggest files in this directory",
+            "which files take up the most space",
+        ),
+        lambda slots: f"du -ah {_path(slots)} | sort -rh | head -n {slots.get('count', '10')}",
+    ),
+    _intent(
+        "disk_usage",
+        r"\b(disk usage|space|how big|how large|size of)\b",
+        "disk usage space much how large size directory take takes taking use "
+        "uses used total list file",
+        "path",
+        "",
+        (
+            "disk usage of this directory",
+            "how much space does ~/Downloads take",
+            "size of the directory",
+        ),
+        lambda slots: f"du -sh {_path(slots)}",
+    ),
+    _intent(
+        "disk_free",
+        r"\b(free|left|available|remaining)\b",
+        "disk space free left available remaining much how list have filesystem "
+        "filesystems drive drives partition partitions",
+        "path",
+        "",
+        ("how much disk space is left", "show free disk space", "available space"),
+        lambda slots: "df -h" + (f" {_path(slots)}" if "path" in slots else ""),
+    ),
+    _intent(
+        "tar_create",
+        # A verb saying an archive is to be made; "tarball" alone is a noun
+        r"\b(compress|archive|tar|pack|bundle|create|make)\b",
+        "compress archive tar tarball gzip pack bundle directory file create "
+        "make up as",
+        "path archive",
+        "path",
+        (
+            "compress the logs directory",
+            "create a tarball of src/",
+            "archive ~/project as backup.tar.gz",
+        ),
+        _build_tar_create,
+        free_slot="path",
+        free_pattern=DIRECTORY_WORD,
+    ),
+    _intent(
+        "tar_extract",
+        r"\b(extract|untar|unpack|unzip|decompress|expand)\b",
+        "extract untar unpack unzip decompress expand file archive directory",
+        "archive path",
+        "archive",
+        ("extract backup.tar.gz", "untar archive.tgz into /tmp", "unzip files.zip"),
+        _build_tar_extract,
+    ),
+    _intent(
+        "port_in_use",
+        # The port itself is a slot, so the trigger is the question about it
+        r"\b(what|which|who|using|uses|used|listening|listen|bound|occupying|open)\b",
+        "process using uses used listening listen port use who running program "
+        "app bound occupying open",
+        "port",
+        "port",
+        (
+            "what is using port 8080",
+            "which process is listening on port 3000",
+            "who is on port 5432",
+        ),
+        lambda slots: f"lsof -i :{slots['port']}",
+    ),
+    _intent(
+        "kill_port",
+        r"\b(kill|stop|free|terminate)\b",
+        "kill stop terminate free process port using running listening whatever up",
+        "port",
+        "port",
+        (
+            "kill the process on port 8080",
+            "free up port 3000",
+            "stop whatever is using port 5000",
+        ),
+        lambda slots: f"lsof -ti :{slots['port']} | xargs kill",
+    ),
+    _intent(
+        "kill_by_name",
+        # Only an explicitly named process: "stop nginx" means a service and
+        # "kill zombie processes" names no process at all
+        r"\b(kill|terminate)\b.*\b(named|called)\b",
+        "kill terminate process named called running instances",
+        "name",
+        "name",
+        (
+            "kill processes named node",
+            "kill the process called python",
+            "terminate all processes named java",
+        ),
+        lambda slots: f"pkill {shlex.quote(slots['name'])}",
+        free_slot="name",
+        min_confidence=0.6,
+    ),
+]
+
+
+# Example embeddings by intent examples, shared by the matchers of a process
+_EXAMPLE_EMBEDDINGS: Dict[Tuple[str, ...], np.ndarray] = {}
+
+
+def _embed_examples(examples: Tuple[str, ...]) -> np.ndarray:
+    """Embed the examples of an intent, once per process.
+
+    Args:
+        examples: The intent's example requests
+
+    Returns:
+        One embedding per row
+    """
+    matrix = _EXAMPLE_EMBEDDINGS.get(examples)
+    if matrix is None:
+        matrix = np.stack([embed(example) for example in examples])
+        _EXAMPLE_EMBEDDINGS[examples] = matrix
+    return matrix
+
+
+class IntentMatcher:
+    """Answer routine requests from templates, without calling the model."""
+
+    def __init__(self, threshold: float = 0.35, intents: Optional[List[Intent]] = None):
+        """Initialize the matcher.
+
+        Args:
+            threshold: Minimum similarity between a request and the closest
+                example of its intent
+            intents: Intents to match. If None, uses the built-in library.
+        """
+        self.threshold = threshold
+        self.intents = INTENTS if intents is None else intents
+        # One matrix of example embeddings per intent
+        self.examples = [_embed_examples(intent.examples) for intent in self.intents]
+
+    def match(self, prompt: str) -> Optional[IntentMatch]:
+        """Find the template that answers a request.
+
+        An intent is only considered when its trigger matches, its required
+        slots are present, every extracted slot is used by its template and
+        every meaningful word of the request belongs to its vocabulary.
+        Among those, the one closest to the request in embedding space wins.
+
+        Args:
+            prompt: Natural language request for a command
+
+        Returns:
+            The match, or None when the request should go to the model
+        """
+        return self.score(prompt)[0]
+
+    def score(self, prompt: str) -> Tuple[Optional[IntentMatch], float]:
+        """Find the template that answers a request and measure its closeness.
+
+        Args:
+            prompt: Natural language request for a command
+
+        Returns:
+            What match() returns, and the highest cosine similarity of the
+            request to an example of any intent, with no constraints checked,
+            from one embedding
+        """
+        slots, rest = extract_slots(prompt)
+        words = _words(rest)
+        # "backup.tar.gz" is a slot value; the "tar" in it is no trigger
+        text = rest.lower()
+        # A word next to an existing archive says what to do with it, as in
+        # "verify backup.tar.gz", rather than what to put in it
+        archive = slots.get("archive")
+        existing_archive = archive is not None and os.path.exists(
+            os.path.expanduser(archive)
+        )
+        vector = embed(prompt)
+        similarities = [float(np.max(examples @ vector)) for examples in self.examples]
+
+        best: Optional[IntentMatch] = None
+        for intent, confidence in zip(self.intents, similarities):
+            if not intent.trigger.search(text):
+                continue
+
+            leftovers = [
+                word for word, canonical in words if canonical not in intent.vocabulary
+            ]
+            intent_slots = dict(slots)
+            if (
+                intent.free_slot
+                and intent.free_slot not in intent_slots
+                and not existing_archive
+                and len(leftovers) == 1
+                and intent.free_pattern.match(leftovers[0])
+            ):
+                intent_slots[intent.free_slot] = leftovers.pop()
+
+            if leftovers:
+                continue
+            if not intent.required <= intent_slots.keys():
+                continue
+            if not intent_slots.keys() <= intent.slots:
+                continue
+            # A duration or size without a direction cannot be templated
+            if any(value == "" for value in intent_slots.values()):
+                continue
+
+            if confidence < max(self.threshold, intent.min_confidence):
+                continue
+            if best is None or confidence > best.confidence:
+                best = IntentMatch(
+                    intent.name, intent.build(intent_slots), confidence, intent_slots
+                )
+        return best, max(similarities, default=0.0)
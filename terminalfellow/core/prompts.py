@@ -20,7 +20,7 @@ You specialize in generating shell commands based on user requests with the foll
 Only generate valid shell commands without explanation. If a command requires explanations, provide it as a comment in the command.
 """,
     "history_aware": """You are a CLI assistant that learns from the user's command history.
-Analyze the provided command history to understand the user's preferences and patterns.
+Use the provided user profile or command history to understand the user's preferences and patterns.
 Generate commands that are consistent with their previous usage and environment.
 Be precise, efficient, and security-conscious in your responses.
 Only generate valid shell commands that would work in a Unix-like environment.
@@ -43,6 +43,15 @@ Consider the following command history when generating your response:
 
 Think step by step about what this request means and how to translate it to a shell command based on the user's history.
 Return ONLY the shell command with no explanations or additional text.
+""",
+    "with_profile": """The user's environment and habits:
+{profile}
+
+Generate a shell command for this environment that accomplishes the following task:
+{query}
+
+Prefer the user's tools, package managers and flag style where they fit the task.
+Return ONLY the shell command with no explanations or additional text.
 """,
     "with_context": """Generate a shell command that accomplishes the following task:
 {query}
@@ -54,6 +63,17 @@ Consider the following context:
 
 Think step by step about what this request means and how to translate it to a shell command.
 Return ONLY the shell command with no explanations or additional text.
+""",
+    "with_session": """Refine the previous shell command according to a follow-up request.
+
+Earlier requests in this session: {session_summary}
+Previous command:
+{previous_command}
+
+Follow-up request:
+{query}
+
+Return ONLY the updated shell command with no explanations or additional text.
 """,
 }
 
@@ -0,0 +1,313 @@
+"""Complexity-based routing of requests between a fast and a strong model."""
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+
+DEFAULT_ROUTING_LOG = os.path.join(DEFAULT_CONFIG_DIR, "routing.jsonl")
+
+FAST = "fast"
+STRONG = "strong"
+
+# Requests this long are as complex as length alone can make them
+LENGTH_WORDS = 40
+
+# How much each feature contributes to the score; retrieval lowers it
+WEIGHTS = {"length": 0.25, "steps": 0.35, "scripting": 0.45, "retrieval": -0.25}
+
+STEP_PATTERN = re.compile(
+    r"\b(?:and then|then|after that|afterwards|followed by|finally|also|once|"
+    r"until|while|unless|otherwise|if|else|for (?:each|every)|each|every|and)\b"
+    r"|;|&&|\|"
+)
+
+SCRIPT_PATTERN = re.compile(
+    r"\b(?:script|function|loop|iterat|cron|schedul|daily|nightly|hourly|retr(?:y|ies)|"
+    r"pars|report|backup|back up|rotat|monitor|watch|deploy|pipeline|csv|json|"
+    r"yaml|regex|parallel|notif|email|variable|argument|menu|install(?:er)? script)"
+    r"\w*"
+)
+
+# Responses that are prose or markdown rather than a command
+PROSE_PATTERN = re.compile(r"^(?:```|here is|here's|to do this|sure|i )", re.I)
+
+
+class RouteDecision(NamedTuple):
+    """The model chosen for a request and why."""
+
+    tier: str
+    model: str
+    score: float
+    features: Dict[str, float]
+
+
+def complexity_features(query: str, retrieval: float = 0.0) -> Dict[str, float]:
+    """Measure what makes a request hard, each on a 0-1 scale.
+
+    Args:
+        query: Natural language request for a command
+        retrieval: Similarity of the request to ones answered before
+
+    Returns:
+        Mapping of feature name to value
+    """
+    text = query.lower()
+    return {
+        "length": min(len(text.split()) / LENGTH_WORDS, 1.0),
+        "steps": min(len(STEP_PATTERN.findall(text)) / 3, 1.0),
+        "scripting": min(len(SCRIPT_PATTERN.findall(text)) / 2, 1.0),
+        "retrieval": min(max(retrieval, 0.0), 1.0),
+    }
+
+
+# Seconds bash may take to parse a command
+VALIDATE_TIMEOUT = 2
+
+
+def _reject_text(command: str) -> Optional[str]:
+    """Reject responses that are empty, an error or prose.
+
+    Args:
+        command: The generated command
+
+    Returns:
+        Why the command is rejected, or None if its syntax should be checked
+    """
+    if not command.strip():
+        return "empty response"
+    if command.startswith("echo 'Error generating command:"):
+        return "generation failed"
+    if PROSE_PATTERN.match(command.strip()):
+        return "response is not a command"
+    return None
+
+
+def _syntax_error(returncode: Optional[int], stderr: str) -> Optional[str]:
+    """Turn the result of `bash -n` into a rejection reason.
+
+    Args:
+        returncode: Exit status of bash
+        stderr: What bash printed
+
+    Returns:
+        The syntax error, or None if the command parsed
+    """
+    if not returncode:
+        return None
+    lines = stderr.strip().splitlines()
+    return "syntax error: " + (lines[-1] if lines else f"bash exited {returncode}")
+
+
+def validate_command(command: str) -> Optional[str]:
+    """Check that a response is a usable shell command.
+
+    The syntax is checked with `bash -n` when bash is available, which
+    parses the command without running it.
+
+    Args:
+        command: The generated command
+
+    Returns:
+        Why the command is rejected, or None if it looks valid
+    """
+    rejected = _reject_text(command)
+    bash = shutil.which("bash")
+    if rejected is not None or bash is None:
+        return rejected
+    try:
+        result = subprocess.run(
+            [bash, "-n"],
+            input=command,
+            capture_output=True,
+            text=True,
+            timeout=VALIDATE_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return _syntax_error(result.returncode, result.stderr)
+
+
+async def avalidate_command(command: str) -> Optional[str]:
+    """Check a response like validate_command, without blocking the event loop.
+
+    Args:
+        command: The generated command
+
+    Returns:
+        Why the command is rejected, or None if it looks valid
+    """
+    rejected = _reject_text(command)
+    bash = shutil.which("bash")
+    if rejected is not None or bash is None:
+        return rejected
+    try:
+        process = await asyncio.create_subprocess_exec(
+            bash,
+            "-n",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError:
+        return None
+    try:
+        _, stderr = await asyncio.wait_for(
+            process.communicate(command.encode("utf-8")), VALIDATE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        # Timed out or cancelled with the request
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    return _syntax_error(process.returncode, stderr.decode("utf-8", "replace"))
+
+
+class ModelRouter:
+    """Send easy requests to a fast model and hard ones to a strong model."""
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        threshold: float = 0.45,
+        log_file: Optional[str] = None,
+    ):
+        """Initialize the router.
+
+        Args:
+            fast_model: Model for one-liners
+            strong_model: Model for scripts and multi-step requests, and for
+                retrying requests the fast model answered badly
+            threshold: Minimum complexity score sent to the strong model
+            log_file: Path to the routing log. If None, uses the default path.
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.threshold = threshold
+        self.log_file = log_file or DEFAULT_ROUTING_LOG
+
+    def route(self, query: str, retrieval: float = 0.0) -> RouteDecision:
+        """Choose the model for a request.
+
+        Args:
+            query: Natural language request for a command
+            retrieval: Similarity of the request to ones answered before
+
+        Returns:
+            The decision
+        """
+        features = complexity_features(query, retrieval)
+        score = sum(WEIGHTS[name] * value for name, value in features.items())
+        score = min(max(score, 0.0), 1.0)
+        tier = STRONG if score >= self.threshold else FAST
+        model = self.strong_model if tier == STRONG else self.fast_model
+        return RouteDecision(tier, model, score, features)
+
+    def escalate(self, decision: RouteDecision) -> RouteDecision:
+        """Move a request to the strong model.
+
+        Args:
+            decision: The original decision
+
+        Returns:
+            The same decision on the strong tier
+        """
+        return decision._replace(tier=STRONG, model=self.strong_model)
+
+    def log(
+        self, decision: RouteDecision, latency: float, rejected: Optional[str] = None
+    ) -> None:
+        """Append a model call to the routing log.
+
+        An escalated request is logged twice: the rejected fast call, then
+        the strong one. The request itself is not logged, only its features.
+
+        Args:
+            decision: The tier and model that were called
+            latency: Seconds spent waiting for the model, retries included
+            rejected: Why the answer was rejected, if it was
+        """
+        record = {
+            "time": round(time.time(), 3),
+            "tier": decision.tier,
+            "model": decision.model,
+            "score": round(decision.score, 4),
+            "features": {k: round(v, 4) for k, v in decision.features.items()},
+            "latency": round(latency, 4),
+        }
+        if rejected:
+            record["rejected"] = rejected
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_file)), exist_ok=True)
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError:
+            # Logging must never fail a request
+            pass
+
+
+def read_routing_log(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Read the routing log.
+
+    Args:
+        path: Path to the log. If None, uses the default path.
+
+    Returns:
+        The logged decisions, skipping unreadable lines
+    """
+    records = []
+    try:
+        with open(path or DEFAULT_ROUTING_LOG, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def summarize_routing(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Summarize logged model calls per tier, to tune the threshold.
+
+    Args:
+        records: Output of read_routing_log
+
+    Returns:
+        Mapping of tier to calls, rejected answers, latency percentiles and
+        the score range
+    """
+    tiers: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for record in records:
+        tiers[record["tier"]].append(record)
+
+    summary = {}
+    for tier in (FAST, STRONG):
+        rows = tiers.get(tier)
+        if not rows:
+            continue
+        latencies = sorted(row["latency"] for row in rows)
+        scores = [row["score"] for row in rows]
+        rejected = [row["score"] for row in rows if row.get("rejected")]
+        summary[tier] = {
+            "calls": len(rows),
+            "rejected": len(rejected),
+            "p50_latency": latencies[len(latencies) // 2],
+            "p95_latency": latencies[min(int(len(latencies) * 0.95), len(rows) - 1)],
+            "min_score": min(scores),
+            "max_score": max(scores),
+            # Rejections at low scores suggest the threshold is too high
+            "min_rejected_score": min(rejected, default=None),
+        }
+    return summary
@@ -0,0 +1,704 @@
+"""Rate-limit-aware scheduling of LLM requests."""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from terminalfellow.utils.config import get_config_value
+
+T = TypeVar("T")
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 10
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# Statuses worth retrying: rate limited, overloaded or temporarily failing
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+RETRYABLE_ERRORS = frozenset({"APIConnectionError", "APITimeoutError"})
+
+# By default buckets hold this many seconds' worth of their per-minute quota
+BURST_SECONDS = 6.0
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parse a rate-limit reset duration such as "20ms", "1s" or "6m0s".
+
+    Args:
+        value: The header value
+
+    Returns:
+        The duration in seconds, or None if it cannot be parsed
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Get the HTTP status of a provider error.
+
+    Args:
+        error: The exception raised by the client
+
+    Returns:
+        The status code, or None if the error carries none
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _headers(error: BaseException) -> Mapping[str, str]:
+    """Get the response headers of a provider error.
+
+    Args:
+        error: The exception raised by the client
+
+    Returns:
+        The headers, or an empty mapping
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers if headers is not None else {}
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Check whether an error means the quota was exceeded.
+
+    Args:
+        error: The exception raised by the client
+
+    Returns:
+        True for HTTP 429 responses
+    """
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether a failed request is worth retrying.
+
+    Args:
+        error: The exception raised by the client
+
+    Returns:
+        True for rate limits, overload and transient network errors
+    """
+    return (
+        is_rate_limited(error)
+        or _status_code(error) in RETRYABLE_STATUSES
+        or type(error).__name__ in RETRYABLE_ERRORS
+    )
+
+
+def estimate_tokens(prompt: str, completion_tokens: int = 256) -> int:
+    """Estimate the tokens a request consumes from the quota.
+
+    Args:
+        prompt: The fully formatted prompt
+        completion_tokens: Tokens reserved for the response
+
+    Returns:
+        The estimated number of tokens
+    """
+    # Roughly four characters per token for English text and shell syntax
+    return len(prompt) // 4 + completion_tokens
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate.
+
+    A request larger than the capacity is admitted once the bucket is full,
+    leaving it in debt, so oversized requests are slowed down but never
+    starved.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float],
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second, or None for an unlimited bucket
+            capacity: Maximum tokens held. If None, one second's worth.
+            clock: Monotonic time source
+        """
+        self.clock = clock
+        self.configured_rate = rate
+        self.rate = rate
+        self.capacity = max(capacity or rate or 1.0, 1.0)
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.updated = clock()
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accumulated since the last update.
+
+        Args:
+            now: Current time
+        """
+        if self.rate is not None and now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = max(self.updated, now)
+
+    def delay(self, amount: float, now: Optional[float] = None) -> float:
+        """Compute how long until a request can be admitted.
+
+        Args:
+            amount: Tokens the request needs
+            now: Current time. If None, the clock is read.
+
+        Returns:
+            Seconds to wait, 0.0 if the request can go now
+        """
+        now = self.clock() if now is None else now
+        wait = max(self.blocked_until - now, 0.0)
+        if self.rate is None:
+            return wait
+
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        if missing > 0:
+            wait = max(wait, missing / self.rate)
+        return wait
+
+    def take(self, amount: float, now: Optional[float] = None) -> None:
+        """Consume tokens for an admitted request.
+
+        Args:
+            amount: Tokens the request needs
+            now: Current time. If None, the clock is read.
+        """
+        if self.rate is None:
+            return
+        self._refill(self.clock() if now is None else now)
+        self.tokens -= amount
+
+    def apply_headers(
+        self,
+        remaining: Optional[float],
+        reset: Optional[float],
+        limit: Optional[float] = None,
+        now: Optional[float] = None,
+        burst_seconds: float = BURST_SECONDS,
+    ) -> None:
+        """Align the bucket with the quota reported by the provider.
+
+        Args:
+            remaining: Requests or tokens left in the provider's window
+            reset: Seconds until the provider's window is replenished
+            limit: Per-minute limit, used when none was configured
+            now: Current time. If None, the clock is read.
+            burst_seconds: Seconds' worth of the limit the bucket holds
+        """
+        now = self.clock() if now is None else now
+        if limit and self.configured_rate is None:
+            self.configured_rate = self.rate = limit / 60.0
+            self.capacity = max(limit / 60.0 * burst_seconds, 1.0)
+            self.tokens = self.capacity
+            self.updated = now
+
+        if remaining is None:
+            return
+        self._refill(now)
+        if self.rate is not None:
+            self.tokens = min(self.tokens, remaining)
+        if remaining < 1 and reset:
+            self.blocked_until = max(self.blocked_until, now + reset)
+
+    def throttle(self) -> None:
+        """Halve the refill rate after the provider rejected a request."""
+        if self.rate is not None and self.configured_rate is not None:
+            self.rate = max(self.rate / 2, self.configured_rate / 16)
+
+    def recover(self) -> None:
+        """Restore part of the configured rate after a successful request."""
+        if self.rate is not None and self.configured_rate is not None:
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate / 20)
+
+
+class _Waiter:
+    """A request queued for admission."""
+
+    __slots__ = ("priority", "sequence", "key", "tokens", "wake", "granted", "done")
+
+    def __init__(
+        self,
+        priority: int,
+        sequence: int,
+        key: str,
+        tokens: int,
+        wake: Callable[[], None],
+    ):
+        self.priority = priority
+        self.sequence = sequence
+        self.key = key
+        self.tokens = tokens
+        self.wake = wake
+        self.granted = False
+        # Set once the waiter gave up and must be skipped
+        self.done = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class RateLimitScheduler:
+    """Admit LLM requests within rate limits, by priority, with retries.
+
+    Each API key gets a request bucket and a token bucket. Waiting requests
+    are admitted strictly in priority order, then arrival order, while a
+    global cap on concurrent requests holds. A 429 response pauses every
+    request for that key until the provider's retry delay has passed and
+    halves the bucket's rate until successes restore it, so a burst of
+    callers backs off together instead of producing an error storm.
+
+    The scheduler is thread-safe and serves synchronous and asyncio callers
+    at the same time.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        burst_seconds: float = BURST_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            requests_per_minute: Request quota per key, or None if unknown
+            tokens_per_minute: Token quota per key, or None if unknown
+            max_concurrency: Maximum number of requests in flight
+            max_retries: Retries of a request that failed transiently
+            base_delay: First backoff delay in seconds
+            max_delay: Longest backoff delay in seconds
+            burst_seconds: Seconds' worth of quota a bucket holds
+            clock: Monotonic time source
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.max_retries = max(int(max_retries), 0)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.burst_seconds = burst_seconds
+        self.clock = clock
+
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._queue: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+
+    def _bucket_pair(self, key: str) -> Tuple[TokenBucket, TokenBucket]:
+        """Get the request and token buckets of a key.
+
+        Args:
+            key: Identifier of the API key
+
+        Returns:
+            The request bucket and the token bucket
+        """
+        if key not in self._buckets:
+
+            def bucket(per_minute: Optional[float]) -> TokenBucket:
+                if per_minute is None:
+                    return TokenBucket(None, clock=self.clock)
+                rate = per_minute / 60.0
+                return TokenBucket(rate, rate * self.burst_seconds, clock=self.clock)
+
+            self._buckets[key] = (
+                bucket(self.requests_per_minute),
+                bucket(self.tokens_per_minute),
+            )
+        return self._buckets[key]
+
+    def _dispatch(self, caller: Optional[_Waiter] = None) -> Optional[float]:
+        """Admit queued requests in order while limits allow.
+
+        Must be called with the lock held. A head that has to wait for its
+        buckets is woken, unless it is the caller, so that it starts a timed
+        wait instead of waiting for a concurrency slot indefinitely.
+
+        Args:
+            caller: The waiter calling, if any
+
+        Returns:
+            Seconds until the first queued request may be admitted, or None
+            if it waits for a concurrency slot or nothing is queued
+        """
+        now = self.clock()
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.done:
+                heapq.heappop(self._queue)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                return None
+
+            requests, tokens = self._bucket_pair(waiter.key)
+            delay = max(requests.delay(1, now), tokens.delay(waiter.tokens, now))
+            if delay > 0:
+                if waiter is not caller:
+                    waiter.wake()
+                return delay
+
+            heapq.heappop(self._queue)
+            requests.take(1, now)
+            tokens.take(waiter.tokens, now)
+            self._in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+        return None
+
+    def _enqueue(
+        self, key: str, tokens: int, priority: int, wake: Callable[[], None]
+    ) -> _Waiter:
+        """Queue a request for admission.
+
+        Args:
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+            wake: Called when the request is admitted
+
+        Returns:
+            The queued waiter
+        """
+        with self._lock:
+            waiter = _Waiter(priority, next(self._sequence), key, tokens, wake)
+            heapq.heappush(self._queue, waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Withdraw a waiter whose caller gave up.
+
+        Args:
+            waiter: The waiter
+        """
+        with self._lock:
+            waiter.done = True
+            granted = waiter.granted
+        if granted:
+            self.release()
+
+    def acquire(
+        self, key: str = "default", tokens: int = 1, priority: int = INTERACTIVE
+    ) -> None:
+        """Block until a request may be sent.
+
+        Every acquire must be followed by a release.
+
+        Args:
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+        """
+        event = threading.Event()
+        waiter = self._enqueue(key, tokens, priority, event.set)
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    delay = self._dispatch(waiter)
+                    if waiter.granted:
+                        return
+                event.wait(delay)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    async def aacquire(
+        self, key: str = "default", tokens: int = 1, priority: int = INTERACTIVE
+    ) -> None:
+        """Wait until a request may be sent, without blocking the event loop.
+
+        Every aacquire must be followed by a release.
+
+        Args:
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(event.set)
+
+        waiter = self._enqueue(key, tokens, priority, wake)
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    delay = self._dispatch(waiter)
+                    if waiter.granted:
+                        return
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def release(self) -> None:
+        """Free the concurrency slot of a finished request."""
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def observe_headers(self, key: str, headers: Mapping[str, str]) -> None:
+        """Align a key's buckets with the provider's rate-limit headers.
+
+        Args:
+            key: Identifier of the API key
+            headers: Response headers, e.g. x-ratelimit-remaining-requests
+        """
+
+        def number(name: str) -> Optional[float]:
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        def duration(name: str) -> Optional[float]:
+            value = headers.get(name)
+            return parse_duration(value) if value is not None else None
+
+        with self._lock:
+            requests, tokens = self._bucket_pair(key)
+            requests.apply_headers(
+                number("x-ratelimit-remaining-requests"),
+                duration("x-ratelimit-reset-requests"),
+                number("x-ratelimit-limit-requests"),
+                burst_seconds=self.burst_seconds,
+            )
+            tokens.apply_headers(
+                number("x-ratelimit-remaining-tokens"),
+                duration("x-ratelimit-reset-tokens"),
+                number("x-ratelimit-limit-tokens"),
+                burst_seconds=self.burst_seconds,
+            )
+
+    def _backoff(self, key: str, error: BaseException, attempt: int) -> float:
+        """Record a failed request and compute the delay before retrying.
+
+        Args:
+            key: Identifier of the API key
+            error: The exception raised by the client
+            attempt: Number of earlier retries of this request
+
+        Returns:
+            Seconds to wait before the retry
+        """
+        headers = _headers(error)
+        if headers:
+            self.observe_headers(key, headers)
+
+        retry_after = None
+        if "retry-after-ms" in headers:
+            retry_after = parse_duration(headers["retry-after-ms"] + "ms")
+        elif "retry-after" in headers:
+            retry_after = parse_duration(headers["retry-after"])
+
+        if retry_after is not None:
+            # Spread the retries a little so they do not arrive together
+            delay = retry_after * random.uniform(1.0, 1.1)
+        else:
+            cap = min(self.max_delay, self.base_delay * 2**attempt)
+            delay = random.uniform(cap / 2, cap)
+
+        with self._lock:
+            self.stats["retries"] += 1
+            if is_rate_limited(error):
+                self.stats["rate_limited"] += 1
+                # Hold back every request for this key, not just this one
+                for bucket in self._bucket_pair(key):
+                    bucket.blocked_until = max(
+                        bucket.blocked_until, self.clock() + delay
+                    )
+                    bucket.throttle()
+        return delay
+
+    def _succeeded(self, key: str) -> None:
+        """Record a successful request.
+
+        Args:
+            key: Identifier of the API key
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            for bucket in self._bucket_pair(key):
+                bucket.recover()
+
+    def call(
+        self,
+        request: Callable[[], T],
+        key: str = "default",
+        tokens: int = 1,
+        priority: int = INTERACTIVE,
+    ) -> T:
+        """Send a request within the limits, retrying transient failures.
+
+        Args:
+            request: Function that performs the request
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+
+        Returns:
+            The result of the request
+
+        Raises:
+            Exception: The request's own error once retries are exhausted or
+                if it is not retryable
+        """
+        attempt = 0
+        while True:
+            self.acquire(key, tokens, priority)
+            try:
+                result = request()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(key, e, attempt)
+                error = e
+            else:
+                self._succeeded(key)
+                return result
+            finally:
+                self.release()
+
+            attempt += 1
+            if not is_rate_limited(error):
+                # A rate limit already paused the key's buckets
+                time.sleep(delay)
+
+    async def acall(
+        self,
+        request: Callable[[], Awaitable[T]],
+        key: str = "default",
+        tokens: int = 1,
+        priority: int = INTERACTIVE,
+    ) -> T:
+        """Send an async request within the limits, retrying transient failures.
+
+        Args:
+            request: Function returning the awaitable that performs the request
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+
+        Returns:
+            The result of the request
+
+        Raises:
+            Exception: The request's own error once retries are exhausted or
+                if it is not retryable
+        """
+        attempt = 0
+        while True:
+            await self.aacquire(key, tokens, priority)
+            try:
+                result = await request()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(key, e, attempt)
+                error = e
+            else:
+                self._succeeded(key)
+                return result
+            finally:
+                self.release()
+
+            attempt += 1
+            if not is_rate_limited(error):
+                await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, key: str = "default", tokens: int = 1, priority: int = INTERACTIVE
+    ) -> AsyncIterator[None]:
+        """Hold admission for a request that cannot be retried, like a stream.
+
+        A rate-limit error raised inside the block still pauses the key.
+
+        Args:
+            key: Identifier of the API key
+            tokens: Estimated tokens the request consumes
+            priority: INTERACTIVE, BATCH or another integer; lower goes first
+        """
+        await self.aacquire(key, tokens, priority)
+        try:
+            yield
+        except Exception as e:
+            if is_retryable(e):
+                self._backoff(key, e, 0)
+            raise
+        else:
+            self._succeeded(key)
+        finally:
+            self.release()
+
+
+_scheduler: Optional[RateLimitScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    """Get the process-wide scheduler, configured from the config file.
+
+    Returns:
+        The shared scheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler(
+                requests_per_minute=get_config_value("rate_limit_rpm", None),
+                tokens_per_minute=get_config_value("rate_limit_tpm", None),
+                max_concurrency=get_config_value("max_concurrent_requests", 4),
+                max_retries=get_config_value("rate_limit_retries", 3),
+            )
+        return _scheduler
@@ -0,0 +1,543 @@
+"""Semantic response cache for near-duplicate prompts."""
+
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+
+DEFAULT_CACHE_FILE = os.path.join(DEFAULT_CONFIG_DIR, "semantic_cache.npz")
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+STOPWORDS = frozenset(
+    "a an the in on of for to from with all my me i please can you this that "
+    "these those is are be it its and or into at by current".split()
+)
+
+# Words that ask for the same thing map to one canonical token
+SYNONYMS = {
+    "show": "list",
+    "display": "list",
+    "print": "list",
+    "ls": "list",
+    "get": "list",
+    "big": "large",
+    "bigger": "large",
+    "biggest": "large",
+    "largest": "large",
+    "huge": "large",
+    "heavy": "large",
+    "small": "little",
+    "smaller": "little",
+    "smallest": "little",
+    "tiny": "little",
+    "files": "file",
+    "dirs": "directory",
+    "dir": "directory",
+    "folder": "directory",
+    "folders": "directory",
+    "directories": "directory",
+    "here": "directory",
+    "cwd": "directory",
+    "delete": "remove",
+    "erase": "remove",
+    "rm": "remove",
+    "find": "search",
+    "locate": "search",
+    "look": "search",
+    "count": "number",
+    "processes": "process",
+    "procs": "process",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_.\-/*~]+")
+
+# Tokens carrying values (numbers, paths, extensions) must match exactly
+LITERAL_PATTERN = re.compile(r"[0-9./*~]")
+
+# Marker files that identify the kind of directory a request is made in
+DIRECTORY_MARKERS = [
+    (".git", "git"),
+    ("pyproject.toml", "python"),
+    ("setup.py", "python"),
+    ("package.json", "node"),
+    ("Cargo.toml", "rust"),
+    ("go.mod", "go"),
+    ("Makefile", "make"),
+    ("Dockerfile", "docker"),
+]
+
+
+def normalize_tokens(prompt: str) -> List[str]:
+    """Split a prompt into canonical tokens.
+
+    Args:
+        prompt: Natural language request for a command
+
+    Returns:
+        Lowercase tokens without stopwords, with synonyms folded
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(prompt.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(SYNONYMS.get(token, token))
+    return tokens
+
+
+def embed(prompt: str, dim: int = 512) -> np.ndarray:
+    """Embed a prompt locally with hashed word and character n-grams.
+
+    Args:
+        prompt: Natural language request for a command
+        dim: Size of the embedding
+
+    Returns:
+        A unit-length float32 vector
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = normalize_tokens(prompt)
+
+    features: List[Tuple[str, float]] = [(f"w:{token}", 1.0) for token in tokens]
+    features += [
+        (f"b:{first} {second}", 0.5) for first, second in zip(tokens, tokens[1:])
+    ]
+    for token in tokens:
+        padded = f"^{token}$"
+        features += [(f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+
+    for feature, weight in features:
+        digest = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        vector[digest % dim] += sign * weight
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def literal_signature(prompt: str) -> str:
+    """Extract the value-carrying tokens of a prompt.
+
+    Two prompts that differ in a number, path or extension must never share a
+    cached command, however similar the rest of their wording is.
+
+    Args:
+        prompt: Natural language request for a command
+
+    Returns:
+        The sorted literal tokens joined by spaces
+    """
+    literals = {t for t in normalize_tokens(prompt) if LITERAL_PATTERN.search(t)}
+    return " ".join(sorted(literals))
+
+
+def classify_directory(cwd: Optional[str]) -> str:
+    """Describe the kind of directory a request is made in.
+
+    Args:
+        cwd: The working directory, or None if unknown
+
+    Returns:
+        A short label such as "git+python", "home" or "dir"
+    """
+    if not cwd:
+        return "unknown"
+
+    kinds = []
+    for marker, kind in DIRECTORY_MARKERS:
+        if kind not in kinds and os.path.exists(os.path.join(cwd, marker)):
+            kinds.append(kind)
+    if kinds:
+        return "+".join(kinds)
+    if os.path.abspath(cwd) == os.path.expanduser("~"):
+        return "home"
+    return "dir"
+
+
+def _exact_key(prompt: str, context_type: str) -> str:
+    """Compute the exact-match key of a prompt.
+
+    Args:
+        prompt: Natural language request for a command
+        context_type: Kind of directory the request is made in
+
+    Returns:
+        A short hex digest
+    """
+    payload = f"{context_type}\n{' '.join(normalize_tokens(prompt))}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+class SemanticCache:
+    """Serve cached commands for identical or near-duplicate prompts.
+
+    The first tier is an exact match on the normalized prompt. The second
+    embeds the prompt and compares it against every cached prompt with one
+    matrix-vector product; the best match is served when its cosine
+    similarity reaches the threshold, its directory kind matches, and its
+    literal values (numbers, paths) are identical.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: float = 0.9,
+        max_entries: int = 500,
+        policy: str = "lru",
+        dim: int = 512,
+    ):
+        """Initialize the cache.
+
+        Args:
+            path: Path to the cache file. If None, uses the default.
+            threshold: Minimum cosine similarity for a semantic hit
+            max_entries: Maximum number of cached commands
+            policy: Eviction policy, "lru" or "lfu"
+            dim: Size of the prompt embeddings
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"Unknown eviction policy '{policy}', expected one of "
+                f"{EVICTION_POLICIES}"
+            )
+        self.path = os.path.expanduser(path or DEFAULT_CACHE_FILE)
+        self.threshold = float(threshold)
+        self.max_entries = max(int(max_entries), 1)
+        self.policy = policy
+        self.dim = dim
+
+        self.entries: List[Dict[str, Any]] = []
+        self.embeddings = np.zeros((0, dim), dtype=np.float32)
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "false_hits": 0}
+        self.last_hit: Optional[int] = None
+        self._last_hit_key: Optional[str] = None
+        self._last_hit_kind: Optional[str] = None
+        # Similarity of the last looked up prompt to the closest entry
+        self.last_similarity = 0.0
+        # Exact-match key to entry index
+        self._keys: Dict[str, int] = {}
+        # Hits and misses only change counters, so they are written at exit.
+        # Until then they are kept apart from what was read from disk, to be
+        # added to whatever other processes wrote in the meantime.
+        self._pending_stats: Dict[str, int] = {}
+        self._pending_hits: Dict[str, Tuple[int, float]] = {}
+        self._pending_since = 0.0
+        # When the cache was last cleared, and the file as last read
+        self._cleared = 0.0
+        self._file_state: Optional[Tuple[int, int, int]] = None
+        self._load()
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    @property
+    def dirty(self) -> bool:
+        """Whether lookups changed the cache since the last save."""
+        return bool(self._pending_stats or self._pending_hits)
+
+    def _stat_file(self) -> Optional[Tuple[int, int, int]]:
+        """Identify the cache file's current version.
+
+        Returns:
+            Its inode, size and modification time, or None if it is missing
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _load(self) -> None:
+        """Load the cache from disk, keeping the changes not saved yet."""
+        self._file_state = self._stat_file()
+        self.entries = []
+        self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+        self.stats = {key: 0 for key in self.stats}
+        self._cleared = 0.0
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+                embeddings = data["embeddings"].astype(np.float32)
+        except (OSError, ValueError, KeyError):
+            meta, embeddings = None, None
+
+        # Written with another embedding size, the entries are dropped
+        if meta is not None and embeddings is not None:
+            if embeddings.shape == (len(meta["entries"]), self.dim):
+                self.entries = meta["entries"]
+                self.embeddings = embeddings
+                self.stats.update(meta.get("stats", {}))
+            self._cleared = meta.get("cleared", 0.0)
+        self._reindex()
+
+        if self._cleared >= self._pending_since:
+            # Lookups made before the cache was cleared are forgotten
+            self._pending_stats, self._pending_hits = {}, {}
+        for key, delta in self._pending_stats.items():
+            self.stats[key] += delta
+        for key, (hits, last_used) in self._pending_hits.items():
+            index = self._keys.get(key)
+            if index is not None:
+                entry = self.entries[index]
+                entry["hits"] += hits
+                entry["last_used"] = max(entry["last_used"], last_used)
+
+    def _reload_if_changed(self) -> None:
+        """Pick up what other processes wrote since the cache was read."""
+        if self._stat_file() != self._file_state:
+            self._load()
+
+    def _reindex(self) -> None:
+        """Rebuild the exact-match index after entries moved."""
+        self._keys = {entry["key"]: index for index, entry in enumerate(self.entries)}
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the cache file's lock for a read-modify-write cycle.
+
+        Every write first reads the file again, so processes sharing the
+        cache, such as the daemon and the CLI, never overwrite each other.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load()
+            yield
+
+    def _count(self, kind: str, delta: int = 1) -> None:
+        """Change a statistic and remember the change until it is saved.
+
+        Args:
+            kind: Name of the statistic
+            delta: Amount to add
+        """
+        if not self.dirty:
+            self._pending_since = time.time()
+        self.stats[kind] += delta
+        self._pending_stats[kind] = self._pending_stats.get(kind, 0) + delta
+
+    def _write(self) -> None:
+        """Write the cache to disk; the caller holds the lock."""
+        meta = json.dumps(
+            {"entries": self.entries, "stats": self.stats, "cleared": self._cleared}
+        )
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            embeddings=self.embeddings,
+            meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8),
+        )
+        os.replace(tmp_path, self.path)
+        self._file_state = self._stat_file()
+        self._pending_stats, self._pending_hits = {}, {}
+
+    def flush(self) -> None:
+        """Write the cache to disk if lookups changed it since the last save."""
+        if self.dirty:
+            self.save()
+
+    def save(self) -> None:
+        """Merge the changes made here into the cache file."""
+        with self._locked():
+            self._write()
+
+    def lookup(self, prompt: str, context_type: str) -> Optional[str]:
+        """Find a cached command for a prompt.
+
+        Args:
+            prompt: Natural language request for a command
+            context_type: Kind of directory the request is made in
+
+        Returns:
+            The cached command, or None on a miss
+        """
+        self._reload_if_changed()
+        self.last_hit = None
+        self.last_similarity = 1.0
+        kind = "exact_hits"
+        index = self._find_exact(prompt, context_type)
+        if index is None:
+            kind = "semantic_hits"
+            index, self.last_similarity = self._nearest(prompt, context_type)
+            if self.last_similarity < self.threshold:
+                index = None
+
+        if index is None:
+            self._count("misses")
+            return None
+
+        self._count(kind)
+        entry = self.entries[index]
+        entry["hits"] += 1
+        entry["last_used"] = time.time()
+        hits, _ = self._pending_hits.get(entry["key"], (0, 0.0))
+        self._pending_hits[entry["key"]] = (hits + 1, entry["last_used"])
+        self.last_hit = index
+        self._last_hit_key = entry["key"]
+        self._last_hit_kind = kind
+        return entry["command"]
+
+    def _find_exact(self, prompt: str, context_type: str) -> Optional[int]:
+        """Find an entry with the same normalized prompt.
+
+        Args:
+            prompt: Natural language request for a command
+            context_type: Kind of directory the request is made in
+
+        Returns:
+            Index of the entry, or None
+        """
+        return self._keys.get(_exact_key(prompt, context_type))
+
+    def _nearest(self, prompt: str, context_type: str) -> Tuple[Optional[int], float]:
+        """Find the most similar compatible entry.
+
+        Args:
+            prompt: Natural language request for a command
+            context_type: Kind of directory the request is made in
+
+        Returns:
+            Index of the entry and its similarity, or (None, 0.0)
+        """
+        if not self.entries:
+            return None, 0.0
+
+        similarities = self.embeddings @ embed(prompt, self.dim)
+        signature = literal_signature(prompt)
+        compatible = np.fromiter(
+            (
+                entry["context_type"] == context_type and entry["literals"] == signature
+                for entry in self.entries
+            ),
+            dtype=bool,
+            count=len(self.entries),
+        )
+        similarities[~compatible] = -1.0
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < 0:
+            return None, 0.0
+        return best, float(similarities[best])
+
+    def store(self, prompt: str, context_type: str, command: str) -> None:
+        """Cache the command generated for a prompt.
+
+        Args:
+            prompt: Natural language request for a command
+            context_type: Kind of directory the request is made in
+            command: The generated command
+        """
+        now = time.time()
+        key = _exact_key(prompt, context_type)
+        entry: Dict[str, Any] = {
+            "key": key,
+            "prompt": prompt,
+            "context_type": context_type,
+            "literals": literal_signature(prompt),
+            "command": command,
+            "hits": 0,
+            "last_used": now,
+        }
+
+        embedding = embed(prompt, self.dim)
+        with self._locked():
+            index = self._keys.get(key)
+            if index is not None:
+                self.entries[index] = entry
+            else:
+                if len(self.entries) >= self.max_entries:
+                    self._remove(self._eviction_candidate())
+                self._keys[key] = len(self.entries)
+                self.entries.append(entry)
+                self.embeddings = np.vstack([self.embeddings, embedding[np.newaxis, :]])
+            self._write()
+
+    def report_false_hit(self) -> None:
+        """Record that the last found command was wrong and drop it.
+
+        The lookup that found it is counted as a miss rather than a hit.
+        """
+        if self.last_hit is None:
+            return
+        self._count("false_hits")
+        self._count(self._last_hit_kind or "exact_hits", -1)
+        self._count("misses")
+        self.last_hit = None
+        with self._locked():
+            # Entries may have moved since the lookup, so look it up by key
+            index = self._keys.get(self._last_hit_key or "")
+            if index is not None:
+                self._remove(index)
+            self._write()
+
+    def clear(self) -> None:
+        """Drop all cached commands and statistics.
+
+        An empty cache is written rather than the file deleted, so that
+        processes holding lookups made before the clear drop them instead
+        of writing the old entries back.
+        """
+        with self._locked():
+            self.entries = []
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+            self.stats = {key: 0 for key in self.stats}
+            self.last_hit = None
+            self._keys = {}
+            self._cleared = time.time()
+            self._write()
+
+    def hit_rate(self) -> float:
+        """Get the share of lookups served from the cache.
+
+        Returns:
+            Hits divided by lookups, or 0.0 before the first lookup
+        """
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else 0.0
+
+    def _eviction_candidate(self) -> int:
+        """Pick the entry to evict according to the policy.
+
+        Returns:
+            Index of the entry to evict
+        """
+        if self.policy == "lfu":
+            return min(
+                range(len(self.entries)),
+                key=lambda i: (self.entries[i]["hits"], self.entries[i]["last_used"]),
+            )
+        return min(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+
+    def _remove(self, index: int) -> None:
+        """Remove an entry and its embedding.
+
+        Args:
+            index: Index of the entry
+        """
+        del self.entries[index]
+        self.embeddings = np.delete(self.embeddings, index, axis=0)
+        self._reindex()
+
+
+def _flush_at_exit(ref: "weakref.ReferenceType[SemanticCache]") -> None:
+    """Save a cache changed by lookups when the process exits.
+
+    Args:
+        ref: Weak reference to the cache, so it can still be garbage collected
+    """
+    cache = ref()
+    # A cache whose directory is gone, e.g. a temporary one, is not recreated
+    if cache is not None and os.path.isdir(os.path.dirname(cache.path) or "."):
+        cache.flush()
@@ -0,0 +1 @@
+"""Shell integration for Terminal Fellow."""
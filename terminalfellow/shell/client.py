@@ -0,0 +1,206 @@
+"""Widget client that replaces the shell buffer with a generated command.
+
+This module is the entry point of ``tf-widget`` and is kept free of heavy
+imports so that a keystroke costs a single light process. Requests go to the
+generator daemon when one is running; otherwise the daemon is started in the
+background for next time and this request is served in-process.
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import Callable, Optional, TextIO
+
+from terminalfellow.shell.daemon import (
+    DEFAULT_SOCKET_PATH,
+    spawn_daemon,
+    startup_error,
+)
+from terminalfellow.utils.config import get_config_value
+from terminalfellow.utils.session import get_session_id
+
+
+class WidgetError(Exception):
+    """Raised when the widget cannot produce a command."""
+
+
+class _Preview:
+    """Show the streamed command on a single terminal line."""
+
+    def __init__(self, stream: TextIO):
+        """Initialize the preview.
+
+        Args:
+            stream: Stream to draw on, normally the terminal's stderr
+        """
+        self.stream = stream
+        self.enabled = stream.isatty()
+        self.text = ""
+
+    def update(self, delta: str) -> None:
+        """Append a delta and redraw the preview line.
+
+        Args:
+            delta: Newly received piece of the command
+        """
+        self.text += delta
+        if not self.enabled:
+            return
+        line = " ".join(self.text.split())
+        try:
+            width = max(os.get_terminal_size(self.stream.fileno()).columns - 1, 10)
+        except OSError:
+            width = 79
+        self.stream.write("\r\033[K" + line[-width:])
+        self.stream.flush()
+
+    def clear(self) -> None:
+        """Erase the preview line."""
+        if self.enabled and self.text:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+
+
+def generate_via_daemon(
+    prompt: str,
+    cwd: str,
+    on_delta: Callable[[str], None],
+    socket_path: Optional[str] = None,
+) -> str:
+    """Generate a command through the daemon.
+
+    Args:
+        prompt: Natural language request for a command
+        cwd: Working directory of the shell
+        on_delta: Called with each streamed piece of the command
+        socket_path: Path to the daemon socket. If None, uses the default.
+
+    Returns:
+        The generated command
+
+    Raises:
+        OSError: If the daemon is not reachable
+        WidgetError: If the daemon reports an error or the connection drops
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.connect(socket_path or DEFAULT_SOCKET_PATH)
+        request = {"prompt": prompt, "cwd": cwd, "session": get_session_id()}
+        line = json.dumps(request) + "\n"
+        sock.sendall(line.encode("utf-8"))
+
+        try:
+            with sock.makefile("r", encoding="utf-8") as events:
+                for line in events:
+                    event = json.loads(line)
+                    if "delta" in event:
+                        on_delta(event["delta"])
+                    elif "command" in event:
+                        return event["command"]
+                    elif "error" in event:
+                        raise WidgetError(event["error"])
+        except OSError as e:
+            raise WidgetError(f"Lost connection to the daemon: {e}") from e
+
+    raise WidgetError("The daemon closed the connection")
+
+
+def generate_in_process(prompt: str, cwd: str, on_delta: Callable[[str], None]) -> str:
+    """Generate a command without the daemon.
+
+    Args:
+        prompt: Natural language request for a command
+        cwd: Working directory of the shell
+        on_delta: Called with each streamed piece of the command
+
+    Returns:
+        The generated command
+
+    Raises:
+        WidgetError: If the command cannot be generated
+    """
+    import asyncio
+
+    from terminalfellow.core.context import build_context, get_session
+    from terminalfellow.core.generator import CommandGenerator, GeneratorError
+    from terminalfellow.utils.history import HistoryAnalyzer
+
+    async def stream() -> str:
+        generator = CommandGenerator()
+        session = get_session()
+        context = build_context(HistoryAnalyzer(), cwd, prompt=prompt, session=session)
+        chunks = []
+        async for delta in generator.astream(prompt, context):
+            chunks.append(delta)
+            on_delta(delta)
+
+        command = "".join(chunks).strip()
+        if session is not None and command:
+            session.add_turn(prompt, command)
+        return command
+
+    try:
+        return asyncio.run(stream())
+    except GeneratorError as e:
+        raise WidgetError(str(e)) from e
+
+
+def run_widget(
+    prompt: str,
+    socket_path: Optional[str] = None,
+    out: TextIO = sys.stdout,
+    err: TextIO = sys.stderr,
+) -> int:
+    """Generate a command for the shell buffer.
+
+    The streamed command is previewed on stderr and the final command is the
+    only thing written to stdout, for the shell to put in its buffer.
+
+    Args:
+        prompt: The current shell buffer
+        socket_path: Path to the daemon socket. If None, uses the default.
+        out: Stream receiving the final command
+        err: Stream receiving the preview and errors
+
+    Returns:
+        Process exit status; non-zero tells the widget to keep the buffer
+    """
+    if not prompt.strip():
+        return 1
+
+    preview = _Preview(err)
+    cwd = os.getcwd()
+    try:
+        try:
+            command = generate_via_daemon(prompt, cwd, preview.update, socket_path)
+        except OSError:
+            if get_config_value("auto_start_daemon", True):
+                error = startup_error(socket_path)
+                if error:
+                    err.write(f"tf: the daemon failed to start: {error}\n")
+                spawn_daemon(socket_path)
+            command = generate_in_process(prompt, cwd, preview.update)
+    except KeyboardInterrupt:
+        preview.clear()
+        return 130
+    except WidgetError as e:
+        preview.clear()
+        err.write(f"tf: {e}\n")
+        return 1
+
+    preview.clear()
+    out.write(command + "\n")
+    return 0
+
+
+def main() -> None:
+    """Entry point of ``tf-widget``."""
+    args = sys.argv[1:]
+    if args and args[0] == "--":
+        args = args[1:]
+    sys.exit(run_widget(" ".join(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Long-running generator daemon for the shell widgets.
+
+The daemon keeps a warm CommandGenerator behind a Unix socket. Each client
+connection sends one JSON line ``{"prompt": ..., "cwd": ..., "session": ...}``
+and receives newline-delimited JSON events: any number of ``{"delta": ...}``
+followed by either ``{"command": ...}`` or ``{"error": ...}``. Closing the
+connection early cancels the request.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR, ensure_config_dir
+
+DEFAULT_SOCKET_PATH = os.path.join(DEFAULT_CONFIG_DIR, "daemon.sock")
+
+# Seconds to wait after starting a daemon before starting another one
+SPAWN_BACKOFF = 60.0
+
+
+def is_daemon_running(socket_path: Optional[str] = None) -> bool:
+    """Check whether a daemon is accepting connections.
+
+    Args:
+        socket_path: Path to the daemon socket. If None, uses the default.
+
+    Returns:
+        True if something is listening on the socket
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path or DEFAULT_SOCKET_PATH)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def startup_error(socket_path: Optional[str] = None) -> Optional[str]:
+    """Get the error that stopped the last daemon from starting.
+
+    Args:
+        socket_path: Path to the daemon socket. If None, uses the default.
+
+    Returns:
+        The error message, or None if the last daemon started
+    """
+    try:
+        with open((socket_path or DEFAULT_SOCKET_PATH) + ".err", "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def spawn_daemon(socket_path: Optional[str] = None) -> bool:
+    """Start a detached daemon process in the background.
+
+    A daemon that fails to start exits right away, so within SPAWN_BACKOFF
+    seconds of the previous attempt no new daemon is started.
+
+    Args:
+        socket_path: Path to the daemon socket. If None, uses the default.
+
+    Returns:
+        True if a daemon was started
+    """
+    stamp = (socket_path or DEFAULT_SOCKET_PATH) + ".spawn"
+    try:
+        if time.time() - os.path.getmtime(stamp) < SPAWN_BACKOFF:
+            return False
+    except OSError:
+        pass
+    ensure_config_dir()
+    with open(stamp, "w"):
+        pass
+
+    args = [sys.executable, "-m", "terminalfellow.shell.daemon"]
+    if socket_path:
+        args.append(socket_path)
+
+    subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+async def _send(writer: asyncio.StreamWriter, event: Dict[str, Any]) -> None:
+    """Write one event to a client.
+
+    Args:
+        writer: The client stream
+        event: The event to send
+    """
+    writer.write((json.dumps(event) + "\n").encode("utf-8"))
+    await writer.drain()
+
+
+class GeneratorDaemon:
+    """Serve streamed command generation over a Unix socket."""
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        generator: Optional[Any] = None,
+        history_analyzer: Optional[Any] = None,
+    ):
+        """Initialize the daemon.
+
+        Args:
+            socket_path: Path to the daemon socket. If None, uses the default.
+            generator: Generator to serve. If None, a CommandGenerator is created.
+            history_analyzer: Analyzer used for history context. If None, uses
+                the default HistoryAnalyzer.
+        """
+        if generator is None:
+            from terminalfellow.core.generator import CommandGenerator
+
+            generator = CommandGenerator()
+        if history_analyzer is None:
+            from terminalfellow.utils.history import HistoryAnalyzer
+
+            history_analyzer = HistoryAnalyzer()
+
+        self.socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self.generator = generator
+        self.history_analyzer = history_analyzer
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve a single client connection.
+
+        Args:
+            reader: The client input stream
+            writer: The client output stream
+        """
+        try:
+            line = await reader.readline()
+            try:
+                request = json.loads(line)
+                prompt = request["prompt"]
+            except (ValueError, KeyError, TypeError):
+                await _send(writer, {"error": "Malformed request"})
+                return
+
+            generation = asyncio.ensure_future(
+                self._generate(
+                    prompt, request.get("cwd"), request.get("session"), writer
+                )
+            )
+            # The client never writes again, so EOF means it went away
+            disconnect = asyncio.ensure_future(reader.read())
+            done, _ = await asyncio.wait(
+                {generation, disconnect}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if generation in done:
+                disconnect.cancel()
+            else:
+                generation.cancel()
+            await asyncio.gather(generation, disconnect, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _generate(
+        self,
+        prompt: str,
+        cwd: Optional[str],
+        session_id: Optional[str],
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Generate a command and stream it to the client.
+
+        Args:
+            prompt: Natural language request for a command
+            cwd: Working directory of the client shell
+            session_id: Session identifier of the client terminal
+            writer: The client output stream
+        """
+        from terminalfellow.core.context import build_context, get_session
+
+        loop = asyncio.get_event_loop()
+        session = await loop.run_in_executor(None, get_session, session_id)
+        context = await loop.run_in_executor(
+            None,
+            lambda: build_context(
+                self.history_analyzer, cwd, prompt=prompt, session=session
+            ),
+        )
+
+        chunks = []
+        try:
+            async for delta in self.generator.astream(prompt, context):
+                chunks.append(delta)
+                await _send(writer, {"delta": delta})
+        except Exception as e:
+            await _send(writer, {"error": str(e)})
+            return
+
+        command = "".join(chunks).strip()
+        if session is not None and command:
+            await loop.run_in_executor(None, session.add_turn, prompt, command)
+        await _send(writer, {"command": command})
+
+    async def serve(self) -> None:
+        """Listen on the socket until cancelled."""
+        ensure_config_dir()
+        if os.path.exists(self.socket_path):
+            # A leftover socket from a daemon that did not shut down cleanly
+            os.unlink(self.socket_path)
+
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        try:
+            os.unlink(self.socket_path + ".err")
+        except OSError:
+            pass
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def run_daemon(socket_path: Optional[str] = None) -> bool:
+    """Run the daemon in the foreground.
+
+    Args:
+        socket_path: Path to the daemon socket. If None, uses the default.
+
+    Returns:
+        False if another daemon is already listening, True after a clean shutdown
+    """
+    if is_daemon_running(socket_path):
+        return False
+
+    daemon = GeneratorDaemon(socket_path)
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        pass
+    return True
+
+
+def main() -> None:
+    """Run a background daemon, recording why it failed to start if it did."""
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        run_daemon(socket_path)
+    except Exception as e:
+        ensure_config_dir()
+        with open((socket_path or DEFAULT_SOCKET_PATH) + ".err", "w") as f:
+            f.write(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
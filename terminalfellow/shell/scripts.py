@@ -0,0 +1,65 @@
+"""Keybinding widgets for bash, zsh and fish."""
+
+from typing import Optional
+
+# Ctrl-G in each shell's key notation
+DEFAULT_KEYS = {
+    "bash": r"\C-g",
+    "zsh": "^G",
+    "fish": r"\cg",
+}
+
+WIDGET_SCRIPTS = {
+    "bash": """# Terminal Fellow widget: press {key} to turn the current line into a command
+_tf_widget() {{
+    local result
+    result=$(tf-widget -- "$READLINE_LINE") || return
+    READLINE_LINE=$result
+    READLINE_POINT=${{#READLINE_LINE}}
+}}
+bind -x '"{key}": _tf_widget'
+""",
+    "zsh": """# Terminal Fellow widget: press {key} to turn the current line into a command
+_tf_widget() {{
+    local result
+    zle -I
+    if result=$(tf-widget -- "$BUFFER" </dev/tty); then
+        BUFFER=$result
+        CURSOR=${{#BUFFER}}
+    fi
+    zle reset-prompt
+}}
+zle -N _tf_widget
+bindkey '{key}' _tf_widget
+""",
+    "fish": """# Terminal Fellow widget: press {key} to turn the current line into a command
+function _tf_widget
+    set -l result (tf-widget -- (commandline) | string collect)
+    and commandline -r -- $result
+    commandline -f repaint
+end
+bind {key} _tf_widget
+""",
+}
+
+
+def get_init_script(shell: str, key: Optional[str] = None) -> str:
+    """Get the widget script for a shell.
+
+    Args:
+        shell: Name of the shell (bash, zsh or fish)
+        key: Key binding in the shell's own notation. If None, uses Ctrl-G.
+
+    Returns:
+        Shell code to evaluate from the shell's startup file
+
+    Raises:
+        ValueError: If the shell is not supported
+    """
+    shell = shell.lower()
+    if shell not in WIDGET_SCRIPTS:
+        raise ValueError(
+            f"Unsupported shell '{shell}', expected one of: "
+            + ", ".join(sorted(WIDGET_SCRIPTS))
+        )
+    return WIDGET_SCRIPTS[shell].format(key=key or DEFAULT_KEYS[shell])
@@ -1,23 +1,75 @@
 """Shell history analyzer for Terminal Fellow."""
 
+import hashlib
 import os
-from pathlib import Path
-from typing import List, Dict, Any, Optional
-from collections import Counter
+from typing import Iterator, List, Dict, Any, Optional
+from collections import Counter, deque
 
 from terminalfellow.utils.config import get_config_value
+from terminalfellow.utils.history_sources import (
+    DEFAULT_TIMELINE_DIR,
+    load_timeline,
+    resolve_sources,
+)
+from terminalfellow.utils.history_stats import StreamingStats
+from terminalfellow.utils.history_store import (
+    HistoryEntry,
+    HistoryStore,
+    SearchResult,
+    detect_shell,
+    parse_history,
+)
+from terminalfellow.utils.redaction import SecretScrubber, load_rules
+from terminalfellow.utils.transitions import DEFAULT_MODEL_DIR, TransitionModel
+
+# How much the likeliest next command is boosted over its text relevance: a
+# match that follows with probability p scores (1 + p * NEXT_COMMAND_BOOST)
+# times its bm25 score
+NEXT_COMMAND_BOOST = 1.0
 
 
 class HistoryAnalyzer:
     """Analyze shell command history."""
 
-    def __init__(self, history_file: Optional[str] = None):
+    def __init__(
+        self,
+        history_file: Optional[str] = None,
+        model_file: Optional[str] = None,
+        store_file: Optional[str] = None,
+        sources: Optional[List[str]] = None,
+        timeline_dir: Optional[str] = None,
+    ):
         """Initialize the history analyzer.
 
         Args:
             history_file: Path to the shell history file. If None, uses the default.
+            model_file: Path to the transition model file. If None, one is
+                derived from the history file path.
+            store_file: Path to the history database. If None, uses the default.
+            sources: History files or globs merged into one timeline. If None
+                and no history file is given, uses the history_sources setting.
+            timeline_dir: Directory caching the parsed sources. If None, uses
+                the default.
         """
+        if sources is None and history_file is None:
+            sources = get_config_value("history_sources", None)
+        self.sources = resolve_sources(sources) if sources else []
+        if history_file is None and self.sources:
+            history_file = self.sources[0]
         self.history_file = history_file or self._get_default_history_path()
+        if not self.sources:
+            self.sources = [self.history_file]
+
+        if model_file is None:
+            key = "\n".join(self.sources)
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            model_file = os.path.join(DEFAULT_MODEL_DIR, f"{digest}.npz")
+        self.model_file = model_file
+        self.store_file = store_file
+        self.timeline_dir = timeline_dir or DEFAULT_TIMELINE_DIR
+        self.scrubber = SecretScrubber(
+            load_rules(get_config_value("redaction_rules", None))
+        )
 
     def _get_default_history_path(self) -> str:
         """Get the default shell history file path.
@@ -29,16 +81,238 @@ class HistoryAnalyzer:
         return get_config_value("history_file", os.path.expanduser("~/.bash_history"))
 
     def read_history(self) -> List[str]:
-        """Read the shell history file.
+        """Read the shell history.
+
+        Several sources are merged into one timeline, oldest first.
 
         Returns:
             List of history entries
         """
-        if not os.path.exists(self.history_file):
-            return []
+        if len(self.sources) > 1:
+            return [entry.command for entry in self.timeline()]
+
+        shell = detect_shell(self.history_file)
+        return [entry.command for entry in parse_history(self.iter_history(), shell)]
+
+    def timeline(self) -> List[HistoryEntry]:
+        """Parse all history sources in parallel and merge them by timestamp.
+
+        Returns:
+            The deduplicated entries of every source, oldest first
+        """
+        return load_timeline(
+            self.sources,
+            get_config_value("history_workers", None),
+            cache_dir=self.timeline_dir,
+        )
+
+    def iter_history(self, history_file: Optional[str] = None) -> Iterator[str]:
+        """Read a shell history file lazily, one entry at a time.
+
+        Args:
+            history_file: Path to the history file. If None, uses this
+                analyzer's history file.
+
+        Yields:
+            History entries
+        """
+        path = history_file or self.history_file
+        if not os.path.exists(path):
+            return
+
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+    def _redact(self, entries: List[str]) -> List[str]:
+        """Redact secrets from entries if redaction is enabled.
+
+        Args:
+            entries: History entries
+
+        Returns:
+            The entries, redacted if configured
+        """
+        if not get_config_value("redact_history", True):
+            return entries
+        return self.scrubber.scrub_entries(entries)
+
+    def transition_model(
+        self,
+        history: Optional[List[str]] = None,
+        redacted: Optional[Dict[str, str]] = None,
+    ) -> TransitionModel:
+        """Load the transition model and learn any new history entries.
+
+        Args:
+            history: History entries. If None, the sources are read; a single
+                history file only from where the last sync stopped.
+            redacted: Entries already known to contain secrets, mapped to
+                their redacted form. If None, new entries are scrubbed.
+
+        Returns:
+            The up-to-date model
+        """
+        model = TransitionModel(self.model_file)
+        if history is None and len(self.sources) == 1:
+            # A single file is synced by offset, reading only appended bytes
+            if model.sync_file(self.history_file, scrub=self._redact):
+                model.save()
+            return model
+
+        if history is None:
+            history = self.read_history()
+
+        def scrub(entries: List[str]) -> List[str]:
+            if redacted is None:
+                return self._redact(entries)
+            return [redacted.get(cmd, cmd) for cmd in entries]
+
+        if model.sync(history, scrub=scrub):
+            model.save()
+        return model
+
+    def suggest_next(self, count: int = 3) -> List[str]:
+        """Predict the next commands from the history alone.
+
+        Args:
+            count: Maximum number of suggestions
+
+        Returns:
+            Suggested commands, most likely first
+        """
+        model = self.transition_model()
+        return [command for command, _ in model.predict(model.recent(), count)]
 
-        with open(self.history_file, "r", encoding="utf-8", errors="ignore") as f:
-            return [line.strip() for line in f if line.strip()]
+    def history_store(self) -> HistoryStore:
+        """Open the history database and sync new history entries into it.
+
+        Returns:
+            The open store; close it when done
+        """
+        store = HistoryStore(self.store_file)
+        # Sources are synced separately so each is imported incrementally
+        for path in self.sources:
+            store.sync(path, scrub=self._redact)
+        return store
+
+    def search_history(
+        self, query: str, limit: int = 10, cwd: Optional[str] = None
+    ) -> List[SearchResult]:
+        """Search the history for commands matching free text.
+
+        With next-command prediction enabled, a match's relevance is boosted
+        by how likely it is to follow the last commands run, as far as the
+        transition model knows them, so a likely next command moves up past
+        matches that are about as relevant but never a better one.
+
+        Args:
+            query: Free text; every word must occur, the last may be a prefix
+            limit: Maximum number of distinct commands returned
+            cwd: Only return commands run in this directory
+
+        Returns:
+            Distinct matching commands, best match first
+        """
+        with self.history_store() as store:
+            results = store.search(query, limit, cwd=cwd)
+            if len(results) < 2 or not get_config_value("predict_next", True):
+                return results
+            previous = store.recent()
+
+        # The model is only loaded here; `tf next` keeps it up to date
+        model = TransitionModel(self.model_file)
+        probabilities = model.probabilities(
+            [result.command for result in results], previous
+        )
+        boosted = [
+            result._replace(score=result.score * (1 + p * NEXT_COMMAND_BOOST))
+            for result, p in zip(results, probabilities)
+        ]
+        # A stable sort keeps the recency order of equally relevant matches
+        return sorted(boosted, key=lambda result: result.score, reverse=True)
+
+    def streaming_stats(
+        self,
+        history_files: Optional[List[str]] = None,
+        recent: Optional[deque] = None,
+        chunk_size: int = 10000,
+    ) -> StreamingStats:
+        """Compute tool, flag and distinct-command statistics in one pass.
+
+        Memory stays constant however long the histories are: entries are
+        read lazily and redacted and sketched a chunk at a time.
+
+        Args:
+            history_files: History files to read. If None, uses this
+                analyzer's sources.
+            recent: Bounded deque that receives the redacted entries, so the
+                most recent ones remain after the pass
+            chunk_size: Entries processed at a time
+
+        Returns:
+            The statistics of all files
+        """
+        stats = StreamingStats()
+        for path in history_files or self.sources:
+            shell = detect_shell(path)
+            chunk: List[str] = []
+            for line in self.iter_history(path):
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    self._sketch_chunk(stats, chunk, recent, shell)
+                    chunk = []
+            self._sketch_chunk(stats, chunk, recent, shell)
+        return stats
+
+    def _sketch_chunk(
+        self,
+        stats: StreamingStats,
+        chunk: List[str],
+        recent: Optional[deque],
+        shell: Optional[str] = None,
+    ) -> None:
+        """Redact a chunk of entries and add it to streaming statistics.
+
+        Args:
+            stats: The statistics to update
+            chunk: History entries
+            recent: Bounded deque that receives the redacted entries
+            shell: Shell that wrote the entries
+        """
+        # Drop bash timestamp lines, zsh metadata prefixes and fish metadata
+        chunk = [entry.command for entry in parse_history(chunk, shell)]
+        redacted: Dict[str, str] = {}
+        if get_config_value("redact_history", True):
+            redacted = self.scrubber.find_secrets(chunk)
+        if redacted:
+            chunk = [redacted.get(cmd, cmd) for cmd in chunk]
+        stats.update(chunk)
+        if recent is not None:
+            recent.extend(chunk)
+
+    def _analyze_streaming(self, max_items: int) -> Dict[str, Any]:
+        """Analyze the shell history without holding it in memory.
+
+        Args:
+            max_items: Number of recent entries to keep
+
+        Returns:
+            Dictionary with analysis results
+        """
+        recent: deque = deque(maxlen=max_items)
+        stats = self.streaming_stats(recent=recent)
+        return {
+            "count": stats.total,
+            "distinct_commands": stats.distinct_commands.count(),
+            "most_recent": list(recent),
+            "common_commands": [
+                (tool, count) for tool, count, _ in stats.tools.top(10)
+            ],
+            "redactions": dict(self.scrubber.counts),
+        }
 
     def analyze_history(self) -> Dict[str, Any]:
         """Analyze the shell history.
@@ -46,22 +320,34 @@ class HistoryAnalyzer:
         Returns:
             Dictionary with analysis results
         """
-        history = self.read_history()
         max_items = get_config_value("max_history_items", 10)
+        if get_config_value("history_stats", "exact") == "streaming":
+            return self._analyze_streaming(max_items)
+
+        history = self.read_history()
+
+        # Secrets never leave the machine: map entries containing one to
+        # their redacted form before anything is derived from them
+        redacted: Dict[str, str] = {}
+        if get_config_value("redact_history", True):
+            redacted = self.scrubber.find_secrets(history)
 
         # Create command frequency counter
         command_counter: Counter = Counter()
         for cmd in history:
+            cmd = redacted.get(cmd, cmd)
             # Use the first word as the command name
             command_name = cmd.split()[0] if cmd and " " in cmd else cmd
             command_counter[command_name] += 1
 
         # Find most common commands
         common_commands = command_counter.most_common(10)
+        most_recent = history[-max_items:] if history else []
 
         return {
             "count": len(history),
-            "most_recent": history[-max_items:] if history else [],
+            "most_recent": [redacted.get(cmd, cmd) for cmd in most_recent],
             "common_commands": common_commands,
+            "redactions": dict(self.scrubber.counts),
             # More sophisticated analysis to be added
         }
@@ -0,0 +1,404 @@
+"""Multi-source history ingestion merged into a single timeline."""
+
+import gc
+import glob
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+from terminalfellow.utils.history_store import (
+    HistoryEntry,
+    anchor_digest,
+    detect_shell,
+    parse_history,
+)
+
+DEFAULT_TIMELINE_DIR = os.path.join(DEFAULT_CONFIG_DIR, "timelines")
+
+# Below this many bytes in total, starting worker processes costs more
+# than parsing the files in this one
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+# Order key of the entries of files without any timestamps, until they are
+# merged at the file's modification time
+UNDATED = sys.maxsize
+
+
+class ParsedSource(NamedTuple):
+    """A history file's entries in time order, stored by column.
+
+    Lists of plain strings and integers cross process boundaries several
+    times faster than lists of entry tuples.
+    """
+
+    keys: List[int]
+    commands: List[str]
+    timestamps: List[Optional[int]]
+    shell: str
+    # The timestamp of the last timestamped entry in file order
+    last_timestamp: Optional[int] = None
+    # The file's modification time in seconds when it was read
+    mtime: Optional[int] = None
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Pause the cyclic garbage collector while building large lists.
+
+    Parsed entries contain no reference cycles, but allocating millions of
+    them triggers repeated full collections that scan every one.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def resolve_sources(patterns: Iterable[str]) -> List[str]:
+    """Expand history file paths and globs to existing files.
+
+    Args:
+        patterns: Paths or glob patterns, with ~ and $VARS expanded
+
+    Returns:
+        Matching files in pattern order, each file once
+    """
+    sources = []
+    seen = set()
+    for pattern in patterns:
+        pattern = os.path.expanduser(os.path.expandvars(pattern))
+        if any(char in pattern for char in "*?["):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern]
+        for path in matches:
+            real = os.path.realpath(path)
+            if os.path.isfile(path) and real not in seen:
+                seen.add(real)
+                sources.append(path)
+    return sources
+
+
+def _read_lines(data: bytes) -> List[str]:
+    """Split raw history file contents into stripped, non-empty lines.
+
+    Args:
+        data: Bytes read from a history file
+
+    Returns:
+        The lines
+    """
+    text = data.decode("utf-8", errors="ignore")
+    return [line for line in map(str.strip, text.splitlines()) if line]
+
+
+def _key_entries(
+    entries: Sequence[HistoryEntry], current: Optional[int] = None
+) -> Tuple[List[int], Optional[int]]:
+    """Find the time each entry is ordered by.
+
+    Entries without a timestamp are ordered with the closest timestamped
+    entry before them, and leading ones with the first timestamp in the
+    file. Entries of files without any timestamps are keyed UNDATED, and
+    merge_timelines places them at the file's modification time.
+
+    Args:
+        entries: Entries in file order
+        current: Timestamp of the last timestamped entry before them, if any
+
+    Returns:
+        The key of each entry, and the timestamp of the last timestamped one
+    """
+    if current is None:
+        current = next(
+            (entry.timestamp for entry in entries if entry.timestamp is not None),
+            None,
+        )
+    keys = []
+    for entry in entries:
+        if entry.timestamp is not None:
+            current = entry.timestamp
+        keys.append(UNDATED if current is None else current)
+    return keys, current
+
+
+def parse_source(path: str, end: Optional[int] = None) -> ParsedSource:
+    """Parse a history file into entries ordered by time.
+
+    Entries without a timestamp keep None as their timestamp, so they are
+    never mistaken for duplicates.
+
+    Args:
+        path: Path to the history file
+        end: Number of bytes to parse. If None, the whole file is parsed.
+
+    Returns:
+        The file's entries, oldest first
+    """
+    shell = detect_shell(path)
+    try:
+        with open(path, "rb") as f:
+            mtime = int(os.fstat(f.fileno()).st_mtime)
+            data = f.read() if end is None else f.read(end)
+    except OSError:
+        return ParsedSource([], [], [], shell)
+
+    with _gc_paused():
+        entries = parse_history(_read_lines(data), shell)
+        keys, last_timestamp = _key_entries(entries)
+
+        # Concurrent shell sessions write out of order; the sort is stable,
+        # so entries with equal timestamps keep their file order
+        order = sorted(range(len(entries)), key=keys.__getitem__)
+        return ParsedSource(
+            [keys[i] for i in order],
+            [entries[i].command for i in order],
+            [entries[i].timestamp for i in order],
+            shell,
+            last_timestamp,
+            mtime,
+        )
+
+
+def _cache_file(cache_dir: str, path: str) -> str:
+    """Get the file caching the parsed entries of a history file.
+
+    Args:
+        cache_dir: Directory of the cached sources
+        path: Path to the history file
+
+    Returns:
+        Path to the cache file
+    """
+    key = os.path.abspath(path).encode("utf-8")
+    return os.path.join(cache_dir, f"{hashlib.sha1(key).hexdigest()[:16]}.json")
+
+
+def _save_cached(
+    cache_dir: str, path: str, source: ParsedSource, state: Dict[str, Any]
+) -> None:
+    """Cache the parsed entries of a history file.
+
+    Args:
+        cache_dir: Directory of the cached sources
+        path: Path to the history file
+        source: Its parsed entries
+        state: Its size, modification time, parsed bytes and their anchor
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = _cache_file(cache_dir, path)
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({**state, "source": source}, f)
+    os.replace(tmp_file, cache_file)
+
+
+def _load_cached(cache_dir: str, path: str) -> Optional[ParsedSource]:
+    """Load the cached entries of a history file, parsing what was appended.
+
+    Args:
+        cache_dir: Directory of the cached sources
+        path: Path to the history file
+
+    Returns:
+        The file's entries, oldest first, or None if it must be parsed anew
+    """
+    try:
+        with open(_cache_file(cache_dir, path), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        source = ParsedSource(*cached.pop("source"))
+        history = open(path, "rb")
+    except (OSError, ValueError, TypeError):
+        return None
+
+    with history as f:
+        stat = os.fstat(f.fileno())
+        source = source._replace(mtime=int(stat.st_mtime))
+        if (cached["size"], cached["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return source
+        offset = cached["offset"]
+        if offset > stat.st_size or anchor_digest(f, offset) != cached["anchor"]:
+            return None
+        f.seek(offset)
+        data = f.read(stat.st_size - offset)
+        end = offset + len(data)
+        state = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "offset": end,
+            "anchor": anchor_digest(f, end),
+        }
+
+    with _gc_paused():
+        entries = parse_history(_read_lines(data), source.shell)
+        if source.last_timestamp is None and source.keys:
+            if any(entry.timestamp is not None for entry in entries):
+                # The undated entries before now have a time to go with
+                return None
+        keys, last_timestamp = _key_entries(entries, source.last_timestamp)
+        merged = ParsedSource(
+            source.keys + keys,
+            source.commands + [entry.command for entry in entries],
+            source.timestamps + [entry.timestamp for entry in entries],
+            source.shell,
+            last_timestamp,
+            source.mtime,
+        )
+        if source.keys and keys and min(keys) < source.keys[-1]:
+            # Entries written by a session that started earlier; the sort
+            # is stable and mostly merges two runs
+            order = sorted(range(len(merged.keys)), key=merged.keys.__getitem__)
+            merged = merged._replace(
+                keys=[merged.keys[i] for i in order],
+                commands=[merged.commands[i] for i in order],
+                timestamps=[merged.timestamps[i] for i in order],
+            )
+    _save_cached(cache_dir, path, merged, state)
+    return merged
+
+
+def merge_timelines(sources: Sequence[ParsedSource]) -> Iterator[HistoryEntry]:
+    """K-way merge time-ordered sources into one deduplicated timeline.
+
+    Each source is already sorted, so a stable sort of their concatenation
+    only merges k runs, in O(n log k) and without per-entry Python calls.
+    Entries with equal timestamps stay in source order, then file order.
+
+    A file without any timestamps, such as a plain bash history, was last
+    written at its modification time, so its entries are placed there as
+    one block: an old archive goes before newer dated entries instead of
+    looking like the most recent history.
+
+    The same command at the same timestamp in several sources, e.g. a
+    history archived on two hosts, is kept as often as the source that
+    repeats it most, not once per source. Only the entries sharing the
+    current timestamp are remembered.
+
+    Args:
+        sources: Time-ordered entries of each source
+
+    Yields:
+        Entries, oldest first
+    """
+    keys: List[int] = []
+    commands: List[str] = []
+    timestamps: List[Optional[int]] = []
+    origins: List[int] = []
+    for index, source in enumerate(sources):
+        if source.keys and source.keys[0] == UNDATED and source.mtime is not None:
+            keys += [source.mtime] * len(source.keys)
+        else:
+            keys += source.keys
+        commands += source.commands
+        timestamps += source.timestamps
+        origins += [index] * len(source.keys)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+
+    current = None
+    first: Optional[Tuple[int, str]] = None
+    emitted: Dict[str, int] = {}
+    per_source: Dict[Tuple[int, str], int] = {}
+    for position in order:
+        command, timestamp = commands[position], timestamps[position]
+        index = origins[position]
+        shell = sources[index].shell
+        if timestamp is None:
+            yield HistoryEntry(command, None, None, None, shell)
+            continue
+
+        if timestamp != current:
+            # Most timestamps are unique, so counting starts at the second
+            # entry that shares one
+            current, first = timestamp, (index, command)
+            yield HistoryEntry(command, timestamp, None, None, shell)
+            continue
+        if first is not None:
+            emitted = {first[1]: 1}
+            per_source = {first: 1}
+            first = None
+
+        key = (index, command)
+        per_source[key] = per_source.get(key, 0) + 1
+        if per_source[key] > emitted.get(command, 0):
+            emitted[command] = emitted.get(command, 0) + 1
+            yield HistoryEntry(command, timestamp, None, None, shell)
+
+
+def load_timeline(
+    sources: Sequence[str],
+    workers: Optional[int] = None,
+    min_bytes: int = PARALLEL_MIN_BYTES,
+    cache_dir: Optional[str] = None,
+) -> List[HistoryEntry]:
+    """Parse history files in parallel and merge them by timestamp.
+
+    With a cache directory, the parsed entries of each file are kept there
+    with its size and modification time. An unchanged file is not parsed
+    again, and of a grown one only the appended bytes are.
+
+    Args:
+        sources: Paths to the history files
+        workers: Maximum number of worker processes. If None, one per CPU.
+        min_bytes: Smallest total size parsed in worker processes
+        cache_dir: Directory of the cached sources. If None, nothing is cached.
+
+    Returns:
+        The merged, deduplicated timeline, oldest first
+    """
+    parsed: List[Optional[ParsedSource]] = [
+        _load_cached(cache_dir, path) if cache_dir else None for path in sources
+    ]
+    missing = [i for i, source in enumerate(parsed) if source is None]
+
+    # Parse up to the size seen now, so bytes appended meanwhile are not
+    # counted as parsed
+    states: Dict[int, Dict[str, Any]] = {}
+    for i in missing:
+        try:
+            with open(sources[i], "rb") as f:
+                stat = os.fstat(f.fileno())
+                states[i] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "offset": stat.st_size,
+                    "anchor": anchor_digest(f, stat.st_size),
+                }
+        except OSError:
+            pass
+
+    paths = [sources[i] for i in missing]
+    ends = [states[i]["offset"] if i in states else 0 for i in missing]
+    total = sum(ends)
+    workers = min(workers or os.cpu_count() or 1, len(missing))
+    if workers > 1 and total >= min_bytes:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fresh = list(pool.map(parse_source, paths, ends))
+    else:
+        fresh = [parse_source(path, end) for path, end in zip(paths, ends)]
+
+    for i, source in zip(missing, fresh):
+        parsed[i] = source
+        if cache_dir and i in states:
+            _save_cached(cache_dir, sources[i], source, states[i])
+    with _gc_paused():
+        return list(
+            merge_timelines([source for source in parsed if source is not None])
+        )
@@ -0,0 +1,222 @@
+"""Bounded-memory statistics over arbitrarily long histories."""
+
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from terminalfellow.utils.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+
+def tool_and_flags(command: str) -> Tuple[str, List[str]]:
+    """Split a command into its tool and the flags passed to it.
+
+    Args:
+        command: A shell command
+
+    Returns:
+        The first word, and each flag prefixed with the tool, e.g. "git --amend"
+    """
+    words = command.split()
+    if not words:
+        return "", []
+    tool = words[0]
+    flags = [
+        f"{tool} {word.split('=', 1)[0]}"
+        for word in words[1:]
+        if word.startswith("-") and len(word) > 1
+    ]
+    return tool, flags
+
+
+class StreamingStats:
+    """Tool, flag and distinct-command statistics in constant memory.
+
+    Heavy-hitter tools, flags and cd targets are kept in Space-Saving
+    summaries, tool counts can be queried for any tool from a Count-Min
+    sketch, and distinct commands and tools are estimated with HyperLogLog.
+    Entries are consumed in fixed-size chunks, so memory does not depend on
+    the history size, and statistics of different files or hosts can be
+    merged.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 200,
+        width: int = 2048,
+        depth: int = 4,
+        precision: int = 14,
+    ):
+        """Initialize empty statistics.
+
+        Args:
+            capacity: Counters kept per Space-Saving summary
+            width: Counters per row of the Count-Min sketch
+            depth: Rows of the Count-Min sketch
+            precision: Index bits of the HyperLogLog estimators
+        """
+        self.total = 0
+        self.tools = SpaceSaving(capacity)
+        self.flags = SpaceSaving(capacity)
+        self.directories = SpaceSaving(capacity)
+        self.tool_counts = CountMinSketch(width, depth)
+        self.distinct_commands = HyperLogLog(precision)
+        self.distinct_tools = HyperLogLog(precision)
+
+    def update(self, commands: Iterable[str]) -> None:
+        """Add a chunk of history entries.
+
+        Each chunk is aggregated before it touches the sketches, so repeated
+        commands are hashed once per chunk.
+
+        Args:
+            commands: History entries
+        """
+        tools: Counter = Counter()
+        flags: Counter = Counter()
+        directories: Counter = Counter()
+        distinct = set()
+        for command in commands:
+            tool, command_flags = tool_and_flags(command)
+            if not tool:
+                continue
+            self.total += 1
+            tools[tool] += 1
+            flags.update(command_flags)
+            if tool == "cd":
+                words = command.split()
+                if len(words) == 2:
+                    directories[words[1]] += 1
+            distinct.add(command)
+
+        for tool, count in tools.items():
+            self.tools.update(tool, count)
+            self.tool_counts.update(tool, count)
+            self.distinct_tools.add(tool)
+        for flag, count in flags.items():
+            self.flags.update(flag, count)
+        for directory, count in directories.items():
+            self.directories.update(directory, count)
+        for command in distinct:
+            self.distinct_commands.add(command)
+
+    def consume(self, commands: Iterable[str], chunk_size: int = 10000) -> None:
+        """Add history entries from any iterable in one pass.
+
+        Args:
+            commands: History entries, e.g. a generator over a file
+            chunk_size: Entries aggregated at a time
+        """
+        chunk: List[str] = []
+        for command in commands:
+            chunk.append(command)
+            if len(chunk) >= chunk_size:
+                self.update(chunk)
+                chunk = []
+        self.update(chunk)
+
+    def merge(self, other: "StreamingStats") -> "StreamingStats":
+        """Combine statistics of two histories.
+
+        Args:
+            other: Statistics of another history
+
+        Returns:
+            New statistics of both histories
+        """
+        merged = StreamingStats()
+        merged.total = self.total + other.total
+        merged.tools = self.tools.merge(other.tools)
+        merged.flags = self.flags.merge(other.flags)
+        merged.directories = self.directories.merge(other.directories)
+        merged.tool_counts = self.tool_counts.merge(other.tool_counts)
+        merged.distinct_commands = self.distinct_commands.merge(other.distinct_commands)
+        merged.distinct_tools = self.distinct_tools.merge(other.distinct_tools)
+        return merged
+
+    def tool_count(self, tool: str) -> int:
+        """Estimate how often a tool was run, also one outside the top tools.
+
+        Args:
+            tool: The tool, e.g. "docker"
+
+        Returns:
+            An upper bound on the tool's count from the Count-Min sketch
+        """
+        return self.tool_counts.estimate(tool)
+
+    def summary(self, n: int = 10) -> Dict[str, Any]:
+        """Summarize the statistics.
+
+        Args:
+            n: Number of top tools and flags
+
+        Returns:
+            Dictionary with the entry count, distinct estimates, and top
+            tools and flags as (name, count, maximum overestimate) tuples
+        """
+        return {
+            "count": self.total,
+            "distinct_commands": self.distinct_commands.count(),
+            "distinct_tools": self.distinct_tools.count(),
+            "top_tools": self.tools.top(n),
+            "top_flags": self.flags.top(n),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the statistics.
+
+        Returns:
+            A JSON-compatible dictionary
+        """
+        return {
+            "total": self.total,
+            "tools": self.tools.to_dict(),
+            "flags": self.flags.to_dict(),
+            "directories": self.directories.to_dict(),
+            "tool_counts": self.tool_counts.to_dict(),
+            "distinct_commands": self.distinct_commands.to_dict(),
+            "distinct_tools": self.distinct_tools.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamingStats":
+        """Deserialize statistics.
+
+        Args:
+            data: Output of to_dict
+
+        Returns:
+            The statistics
+        """
+        stats = cls()
+        stats.total = data["total"]
+        stats.tools = SpaceSaving.from_dict(data["tools"])
+        stats.flags = SpaceSaving.from_dict(data["flags"])
+        if "directories" in data:
+            stats.directories = SpaceSaving.from_dict(data["directories"])
+        stats.tool_counts = CountMinSketch.from_dict(data["tool_counts"])
+        stats.distinct_commands = HyperLogLog.from_dict(data["distinct_commands"])
+        stats.distinct_tools = HyperLogLog.from_dict(data["distinct_tools"])
+        return stats
+
+    def save(self, path: str) -> None:
+        """Write the statistics to a JSON file.
+
+        Args:
+            path: Destination file
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "StreamingStats":
+        """Read statistics written by save.
+
+        Args:
+            path: Source file
+
+        Returns:
+            The statistics
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,546 @@
+"""SQLite full-text store for shell history."""
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+
+DEFAULT_HISTORY_DB = os.path.join(DEFAULT_CONFIG_DIR, "history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    command TEXT NOT NULL UNIQUE,
+    count INTEGER NOT NULL,
+    last_used INTEGER,
+    last_entry INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    command_id INTEGER NOT NULL,
+    timestamp INTEGER,
+    cwd TEXT,
+    exit_status INTEGER,
+    shell TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_cwd ON entries(cwd, command_id)
+    WHERE cwd IS NOT NULL;
+CREATE INDEX IF NOT EXISTS entries_exit_status ON entries(exit_status, command_id)
+    WHERE exit_status IS NOT NULL;
+CREATE VIRTUAL TABLE IF NOT EXISTS commands_fts USING fts5(
+    command, content='commands', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS commands_ai AFTER INSERT ON commands BEGIN
+    INSERT INTO commands_fts(rowid, command) VALUES (new.id, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS commands_ad AFTER DELETE ON commands BEGIN
+    INSERT INTO commands_fts(commands_fts, rowid, command)
+    VALUES ('delete', old.id, old.command);
+END;
+CREATE TABLE IF NOT EXISTS source_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    anchor TEXT NOT NULL
+);
+"""
+
+# zsh with EXTENDED_HISTORY writes ": <epoch>:<duration>;<command>"
+ZSH_EXTENDED = re.compile(r"^: (\d+):\d+;(.*)$")
+
+# fish writes "- cmd: <command>", then "when: <epoch>" and the paths it used
+FISH_ESCAPE = re.compile(r"\\(.)")
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Maximum number of SQL variables used in one IN (...) lookup
+LOOKUP_CHUNK = 500
+
+# Bytes before the sync offset that tell an appended file from a rewritten one
+ANCHOR_BYTES = 4096
+
+# Source of the entries recorded by shell hooks. The same commands reach the
+# history file, so these entries add where and how a command ran but are
+# left out of every count.
+HOOK_SOURCE = "hook"
+
+
+class HistoryEntry(NamedTuple):
+    """A command run in a shell, with whatever metadata is known."""
+
+    command: str
+    timestamp: Optional[int] = None
+    cwd: Optional[str] = None
+    exit_status: Optional[int] = None
+    shell: Optional[str] = None
+
+
+class SearchResult(NamedTuple):
+    """A distinct command matching a search."""
+
+    command: str
+    timestamp: Optional[int]
+    uses: int
+    score: float
+
+
+def detect_shell(history_file: str) -> str:
+    """Guess which shell wrote a history file.
+
+    Args:
+        history_file: Path to the history file
+
+    Returns:
+        "bash", "zsh", "fish" or the basename of $SHELL
+    """
+    name = os.path.basename(history_file)
+    for shell in ("zsh", "fish", "bash"):
+        if shell in name:
+            return shell
+    return os.path.basename(os.environ.get("SHELL", "")) or "sh"
+
+
+def _parse_fish_history(
+    lines: Iterable[str], shell: Optional[str]
+) -> List[HistoryEntry]:
+    """Parse the YAML-like history file of fish.
+
+    Args:
+        lines: Stripped, non-empty history lines
+        shell: Shell recorded with each entry
+
+    Returns:
+        The commands, oldest first
+    """
+    entries: List[HistoryEntry] = []
+    for line in lines:
+        if line.startswith("- cmd:"):
+            # Backslashes and newlines in commands are escaped
+            command = FISH_ESCAPE.sub(
+                lambda match: "\n" if match.group(1) == "n" else match.group(1),
+                line[6:].strip(),
+            )
+            if command:
+                entries.append(HistoryEntry(command, None, None, None, shell))
+        elif line.startswith("when:") and entries and entries[-1].timestamp is None:
+            digits = line[5:].strip()
+            if digits.isascii() and digits.isdigit():
+                entries[-1] = entries[-1]._replace(timestamp=int(digits))
+    return entries
+
+
+def parse_history(
+    lines: Iterable[str], shell: Optional[str] = None
+) -> List[HistoryEntry]:
+    """Parse history lines, extracting timestamps where the shell wrote them.
+
+    Args:
+        lines: Stripped, non-empty history lines
+        shell: Shell recorded with each entry; "fish" selects its format
+
+    Returns:
+        The commands, oldest first
+    """
+    if shell == "fish":
+        return _parse_fish_history(lines, shell)
+
+    entries = []
+    timestamp = None
+    for line in lines:
+        # Only lines with the right first character can carry metadata:
+        # bash with HISTTIMEFORMAT writes "#<epoch>" before each command
+        if line[:1] == "#":
+            digits = line[1:]
+            if 9 <= len(digits) <= 11 and digits.isascii() and digits.isdigit():
+                timestamp = int(digits)
+                continue
+        elif line[:2] == ": ":
+            match = ZSH_EXTENDED.match(line)
+            if match:
+                timestamp, line = int(match.group(1)), match.group(2)
+        if line:
+            entries.append(HistoryEntry(line, timestamp, None, None, shell))
+        timestamp = None
+    return entries
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query.
+
+    Every word must occur; the last one may be a prefix, so results appear
+    while a word is still being typed.
+
+    Args:
+        query: Free text typed by the user
+
+    Returns:
+        The FTS5 MATCH expression, or an empty string if there are no words
+    """
+    words = WORD_PATTERN.findall(query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def anchor_digest(f: BinaryIO, offset: int) -> str:
+    """Fingerprint the bytes of a file just before an offset.
+
+    Args:
+        f: The file, opened in binary mode
+        offset: Where the previous sync stopped reading
+
+    Returns:
+        A short hex digest
+    """
+    start = max(offset - ANCHOR_BYTES, 0)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()[:16]
+
+
+class HistoryStore:
+    """Shell history in SQLite with an FTS5 index over the commands.
+
+    Every run of a command is a row in ``entries``; each distinct command is
+    a row in ``commands`` with its run count and last use, and only distinct
+    commands are indexed. Histories repeat themselves heavily, so the index
+    stays a fraction of the history's size and ranked queries touch each
+    matching command once.
+
+    The database runs in WAL mode, so searches are never blocked by a sync
+    running in another terminal. History files are synced incrementally:
+    the size, modification time and read offset of each file are stored,
+    an unchanged file is not read at all, and of a grown one only the bytes
+    appended since the last sync are parsed and inserted, in one
+    transaction.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Open the store, creating the database if needed.
+
+        Args:
+            path: Path to the database. If None, uses the default.
+        """
+        self.path = path or DEFAULT_HISTORY_DB
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.path, timeout=5.0)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_entries(self, entries: Sequence[HistoryEntry], source: str) -> int:
+        """Insert entries in one transaction.
+
+        Args:
+            entries: The entries to insert
+            source: Where the entries come from, e.g. the history file path
+
+        Returns:
+            The number of entries inserted
+        """
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._insert(entries, source)
+        return len(entries)
+
+    def _insert(self, entries: Sequence[HistoryEntry], source: str) -> None:
+        """Insert entries in the current transaction.
+
+        The transaction must hold the write lock (BEGIN IMMEDIATE), so no
+        other connection takes the entry ids read here.
+
+        Args:
+            entries: The entries to insert
+            source: Where the entries come from
+        """
+        if not entries:
+            return
+        first_id = (
+            self.connection.execute(
+                "SELECT coalesce(max(id), 0) FROM entries"
+            ).fetchone()[0]
+            + 1
+        )
+
+        # Aggregate repeated commands before touching the index
+        counted = int(source != HOOK_SOURCE)
+        usage: Dict[str, List] = {}
+        for entry_id, entry in enumerate(entries, first_id):
+            count, last_used, _ = usage.get(entry.command, (0, None, 0))
+            if entry.timestamp is not None:
+                last_used = max(last_used or 0, entry.timestamp)
+            usage[entry.command] = [count + counted, last_used, entry_id]
+
+        self.connection.executemany(
+            "INSERT INTO commands (command, count, last_used, last_entry) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (command) DO UPDATE SET "
+            "count = count + excluded.count, "
+            "last_used = coalesce(max(last_used, excluded.last_used), "
+            "last_used, excluded.last_used), "
+            "last_entry = excluded.last_entry",
+            ((command, *values) for command, values in usage.items()),
+        )
+
+        command_ids: Dict[str, int] = {}
+        commands = list(usage)
+        for start in range(0, len(commands), LOOKUP_CHUNK):
+            chunk = commands[start : start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            command_ids.update(
+                (command, command_id)
+                for command_id, command in self.connection.execute(
+                    f"SELECT id, command FROM commands WHERE command IN ({placeholders})",
+                    chunk,
+                )
+            )
+
+        self.connection.executemany(
+            "INSERT INTO entries (id, command_id, timestamp, cwd, exit_status, "
+            "shell, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    entry_id,
+                    command_ids[e.command],
+                    e.timestamp,
+                    e.cwd,
+                    e.exit_status,
+                    e.shell,
+                    source,
+                )
+                for entry_id, e in enumerate(entries, first_id)
+            ),
+        )
+
+    def _remove_source(self, source: str) -> None:
+        """Delete the entries of a source in the current transaction.
+
+        Args:
+            source: Where the entries came from
+        """
+        deleted = self.connection.execute(
+            "DELETE FROM entries WHERE source = ?", (source,)
+        ).rowcount
+        if not deleted:
+            return
+        # Separate statements, since executescript would commit the transaction
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS usage ("
+            "command_id INTEGER PRIMARY KEY, count INTEGER, last_entry INTEGER)"
+        )
+        self.connection.execute("DELETE FROM usage")
+        self.connection.execute(
+            "INSERT INTO usage SELECT command_id, sum(source != ?), max(id) "
+            "FROM entries GROUP BY command_id",
+            (HOOK_SOURCE,),
+        )
+        self.connection.execute(
+            "DELETE FROM commands WHERE id NOT IN (SELECT command_id FROM usage)"
+        )
+        self.connection.execute(
+            "UPDATE commands SET "
+            "count = (SELECT count FROM usage WHERE command_id = commands.id), "
+            "last_entry = (SELECT last_entry FROM usage "
+            "WHERE command_id = commands.id)"
+        )
+
+    def record(
+        self,
+        command: str,
+        cwd: Optional[str] = None,
+        exit_status: Optional[int] = None,
+        shell: Optional[str] = None,
+    ) -> None:
+        """Record a command reported by a shell hook.
+
+        The command is not counted as a use, since the shell also writes it
+        to the history file.
+
+        Args:
+            command: The command that ran
+            cwd: Directory it ran in
+            exit_status: Its exit status
+            shell: The shell that ran it
+        """
+        entry = HistoryEntry(command, int(time.time()), cwd, exit_status, shell)
+        self.add_entries([entry], source=HOOK_SOURCE)
+
+    def _source_state(self, history_file: str) -> Optional[Tuple[int, int, int, str]]:
+        """Look up how far a history file was synced.
+
+        Args:
+            history_file: Path to the history file
+
+        Returns:
+            Its size, modification time and offset at the last sync and the
+            anchor at that offset, or None if it was never synced
+        """
+        return self.connection.execute(
+            "SELECT size, mtime_ns, offset, anchor FROM source_files WHERE path = ?",
+            (history_file,),
+        ).fetchone()
+
+    def sync(
+        self,
+        history_file: str,
+        scrub: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> int:
+        """Insert the lines appended to a history file since the last sync.
+
+        An unchanged file is not read. If the file was rewritten or truncated
+        in the meantime, its entries are replaced.
+
+        Args:
+            history_file: Path to the history file, used as the source
+            scrub: Optional function mapping commands to their redacted form
+
+        Returns:
+            The number of entries inserted
+        """
+        state = self._source_state(history_file)
+        try:
+            f = open(history_file, "rb")
+        except OSError:
+            return 0
+
+        with f:
+            stat = os.fstat(f.fileno())
+            start = 0
+            if state is not None:
+                size, mtime_ns, offset, anchor = state
+                if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    return 0
+                if offset <= stat.st_size and anchor_digest(f, offset) == anchor:
+                    start = offset
+            f.seek(start)
+            data = f.read()
+            end = start + len(data)
+            anchor = anchor_digest(f, end)
+
+        text = data.decode("utf-8", errors="ignore")
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        entries = parse_history(lines, detect_shell(history_file))
+        if scrub is not None:
+            commands = scrub([entry.command for entry in entries])
+            entries = [
+                entry._replace(command=command)
+                for entry, command in zip(entries, commands)
+            ]
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self._source_state(history_file) != state:
+                # Another process synced the file in the meantime
+                return 0
+            if not start:
+                self._remove_source(history_file)
+            self._insert(entries, history_file)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO source_files "
+                "(path, size, mtime_ns, offset, anchor) VALUES (?, ?, ?, ?, ?)",
+                (history_file, stat.st_size, stat.st_mtime_ns, end, anchor),
+            )
+        return len(entries)
+
+    def count(self) -> int:
+        """Count the stored entries, leaving out those recorded by hooks.
+
+        Returns:
+            The number of entries
+        """
+        return self.connection.execute(
+            "SELECT count(*) FROM entries WHERE source != ?", (HOOK_SOURCE,)
+        ).fetchone()[0]
+
+    def recent(self, count: int = 2) -> List[str]:
+        """Get the commands stored last.
+
+        Args:
+            count: Number of commands
+
+        Returns:
+            The commands, oldest first
+        """
+        # Hook entries repeat commands of the history file
+        rows = self.connection.execute(
+            "SELECT c.command FROM entries AS e JOIN commands AS c "
+            "ON c.id = e.command_id WHERE e.source != ? ORDER BY e.id DESC LIMIT ?",
+            (HOOK_SOURCE, count),
+        ).fetchall()
+        return [command for command, in reversed(rows)]
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        cwd: Optional[str] = None,
+        successful_only: bool = False,
+    ) -> List[SearchResult]:
+        """Run a ranked full-text search over the stored commands.
+
+        Args:
+            query: Free text; every word must occur, the last may be a prefix
+            limit: Maximum number of distinct commands returned
+            cwd: Only return commands run in this directory
+            successful_only: Only return commands known to have exited with 0
+
+        Returns:
+            Distinct commands with how often and when they last ran, best
+            match first; equally good matches are ordered by recency
+        """
+        match = build_match_query(query)
+        if not match or limit <= 0:
+            return []
+
+        conditions = ["commands_fts MATCH ?"]
+        parameters: List[object] = [match]
+        if cwd is not None:
+            conditions.append("c.id IN (SELECT command_id FROM entries WHERE cwd = ?)")
+            parameters.append(cwd)
+        if successful_only:
+            conditions.append(
+                "c.id IN (SELECT command_id FROM entries WHERE exit_status = 0)"
+            )
+        parameters.append(limit)
+
+        rows = self.connection.execute(
+            "SELECT c.command, c.last_used, c.count, commands_fts.rank "
+            "FROM commands_fts JOIN commands AS c ON c.id = commands_fts.rowid "
+            f"WHERE {' AND '.join(conditions)} "
+            "ORDER BY commands_fts.rank, c.last_entry DESC LIMIT ?",
+            parameters,
+        ).fetchall()
+        # bm25 ranks are negative; flip them so higher is better
+        return [
+            SearchResult(command, last_used, count, -rank)
+            for command, last_used, count, rank in rows
+        ]
@@ -0,0 +1,342 @@
+"""Compact user profile derived from shell history.
+
+Instead of pasting recent history into every prompt, a short summary of the
+user's environment and habits is computed locally, stored on disk and
+reused until the history changes materially.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR, get_config_value
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.history_stats import StreamingStats
+from terminalfellow.utils.history_store import detect_shell
+
+DEFAULT_PROFILE_DIR = os.path.join(DEFAULT_CONFIG_DIR, "profiles")
+
+# Bumped when the profile format changes, so old files are recomputed
+PROFILE_VERSION = 1
+
+# A refresh that has not finished after this many seconds is assumed dead
+REFRESH_TIMEOUT = 600
+
+PACKAGE_MANAGERS = {
+    "apt": "apt",
+    "apt-get": "apt",
+    "dnf": "dnf",
+    "yum": "yum",
+    "pacman": "pacman",
+    "yay": "pacman",
+    "zypper": "zypper",
+    "apk": "apk",
+    "brew": "brew",
+    "port": "macports",
+    "nix-env": "nix",
+    "pip": "pip",
+    "pip3": "pip",
+    "uv": "uv",
+    "poetry": "poetry",
+    "conda": "conda",
+    "npm": "npm",
+    "yarn": "yarn",
+    "pnpm": "pnpm",
+    "bun": "bun",
+    "cargo": "cargo",
+    "gem": "gem",
+}
+
+# Tools everyone uses; listing them tells the model nothing
+UBIQUITOUS_TOOLS = frozenset(
+    "cd ls pwd clear exit history echo cat sudo man which".split()
+)
+
+
+def detect_os() -> str:
+    """Describe the operating system.
+
+    Returns:
+        E.g. "Ubuntu 22.04.3 LTS", "macOS 14.2" or "Linux"
+    """
+    system = platform.system()
+    if system == "Darwin":
+        version = platform.mac_ver()[0]
+        return f"macOS {version}".strip()
+    if system == "Linux":
+        try:
+            with open("/etc/os-release", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("PRETTY_NAME="):
+                        return line.split("=", 1)[1].strip().strip('"')
+        except OSError:
+            pass
+    return system or "Unknown"
+
+
+def compute_profile(history_analyzer: HistoryAnalyzer, top: int = 6) -> Dict[str, Any]:
+    """Summarize a user's environment and habits from their history.
+
+    The history is read in one bounded-memory pass and redacted first.
+
+    Args:
+        history_analyzer: Analyzer reading the user's history
+        top: Number of tools, directories and flags kept
+
+    Returns:
+        The profile, with only JSON-compatible values
+    """
+    stats: StreamingStats = history_analyzer.streaming_stats()
+    tools = stats.tools.top(stats.tools.capacity)
+
+    managers: Counter = Counter()
+    for tool, count, _ in tools:
+        if tool in PACKAGE_MANAGERS:
+            managers[PACKAGE_MANAGERS[tool]] += count
+
+    flags = stats.flags.top(stats.flags.capacity)
+    long_flags = sum(count for flag, count, _ in flags if " --" in flag)
+    total_flags = sum(count for _, count, _ in flags)
+    if not total_flags:
+        flag_style = "unknown"
+    elif long_flags > 0.6 * total_flags:
+        flag_style = "mostly long flags"
+    elif long_flags < 0.2 * total_flags:
+        flag_style = "mostly short flags"
+    else:
+        flag_style = "mixed short and long flags"
+
+    shells = Counter(detect_shell(path) for path in history_analyzer.sources)
+    return {
+        "os": detect_os(),
+        "shell": shells.most_common(1)[0][0] if shells else "sh",
+        "tools": [tool for tool, _, _ in tools if tool not in UBIQUITOUS_TOOLS][:top],
+        "package_managers": [manager for manager, _ in managers.most_common()],
+        "directories": [
+            directory
+            for directory, _, _ in stats.directories.top(top + 4)
+            if directory not in ("-", ".", "..", "~", "/")
+        ][:top],
+        "flag_style": flag_style,
+        "frequent_flags": [flag for flag, _, _ in flags[:top]],
+        "commands": stats.total,
+    }
+
+
+def render_profile(profile: Dict[str, Any]) -> str:
+    """Format a profile as a short block for prompts.
+
+    Lines always come in the same order and empty fields are left out, so
+    the block only changes when the profile does.
+
+    Args:
+        profile: Output of compute_profile
+
+    Returns:
+        The block, one fact per line
+    """
+    lines = [f"OS: {profile['os']}", f"Shell: {profile['shell']}"]
+    fields = [
+        ("Preferred tools", "tools"),
+        ("Package managers", "package_managers"),
+        ("Common directories", "directories"),
+        ("Frequent flags", "frequent_flags"),
+    ]
+    for label, key in fields:
+        if profile.get(key):
+            lines.append(f"{label}: {', '.join(profile[key])}")
+    if profile.get("flag_style", "unknown") != "unknown":
+        lines.append(f"Flag style: {profile['flag_style']}")
+    return "\n".join(lines)
+
+
+def history_fingerprint(sources: List[str]) -> Dict[str, int]:
+    """Get the size of each history source without reading it.
+
+    Args:
+        sources: Paths to the history files
+
+    Returns:
+        Mapping of path to size in bytes, -1 for missing files
+    """
+    fingerprint = {}
+    for path in sources:
+        try:
+            fingerprint[path] = os.path.getsize(path)
+        except OSError:
+            fingerprint[path] = -1
+    return fingerprint
+
+
+def changed_materially(
+    old: Dict[str, int], new: Dict[str, int], ratio: float = 0.1
+) -> bool:
+    """Decide whether the history changed enough to recompute the profile.
+
+    Args:
+        old: Fingerprint the profile was computed from
+        new: Current fingerprint
+        ratio: Relative growth that counts as material
+
+    Returns:
+        True if sources were added, removed or rewritten, or grew by ratio
+    """
+    if set(old) != set(new):
+        return True
+    if any(new[path] < old[path] for path in new):
+        return True
+    before = sum(max(size, 0) for size in old.values())
+    after = sum(max(size, 0) for size in new.values())
+    return after - before > ratio * max(before, 1)
+
+
+class ProfileStore:
+    """User profile cached on disk and refreshed when the history grows."""
+
+    def __init__(self, path: Optional[str] = None, sources: Sequence[str] = ()):
+        """Initialize the store.
+
+        Args:
+            path: Path to the profile file. If None, one is derived from the
+                history sources, so each history has its own profile.
+            sources: History files the profile is computed from
+        """
+        if path is None:
+            key = "\n".join(sources)
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            path = os.path.join(DEFAULT_PROFILE_DIR, f"{digest}.json")
+        self.path = path
+        self.lock_path = self.path + ".lock"
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Read the stored profile.
+
+        Returns:
+            The stored data with "profile", "block" and "fingerprint", or
+            None if there is no usable profile
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != PROFILE_VERSION:
+            return None
+        return data
+
+    def refresh(self, history_analyzer: HistoryAnalyzer) -> Dict[str, Any]:
+        """Recompute the profile and store it.
+
+        Args:
+            history_analyzer: Analyzer reading the user's history
+
+        Returns:
+            The stored data
+        """
+        # Sizes are taken first, so lines appended meanwhile count as new
+        fingerprint = history_fingerprint(history_analyzer.sources)
+        profile = compute_profile(history_analyzer)
+        data = {
+            "version": PROFILE_VERSION,
+            "updated": time.time(),
+            "fingerprint": fingerprint,
+            "profile": profile,
+            "block": render_profile(profile),
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+        return data
+
+    def _claim_refresh(self) -> bool:
+        """Take the refresh lock unless another refresh is running.
+
+        Returns:
+            True if the caller should refresh
+        """
+        try:
+            if time.time() - os.path.getmtime(self.lock_path) < REFRESH_TIMEOUT:
+                return False
+            os.unlink(self.lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except OSError:
+            return False
+
+    def _spawn_refresh(self, sources: List[str]) -> None:
+        """Refresh the profile in a detached background process.
+
+        Args:
+            sources: History files the profile is computed from
+        """
+        if not self._claim_refresh():
+            return
+        subprocess.Popen(
+            [sys.executable, "-m", "terminalfellow.utils.profile", self.path] + sources,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def get_block(
+        self, history_analyzer: HistoryAnalyzer, background: bool = True
+    ) -> str:
+        """Get the profile block for a prompt, refreshing it if needed.
+
+        Only the first profile is computed while the caller waits; later
+        refreshes run in the background and the previous block is served
+        meanwhile.
+
+        Args:
+            history_analyzer: Analyzer reading the user's history
+            background: Refresh a stale profile in a background process
+
+        Returns:
+            The profile block
+        """
+        data = self.load()
+        if data is None:
+            return self.refresh(history_analyzer)["block"]
+
+        fingerprint = history_fingerprint(history_analyzer.sources)
+        ratio = get_config_value("profile_refresh_ratio", 0.1)
+        if changed_materially(data["fingerprint"], fingerprint, ratio):
+            if background:
+                self._spawn_refresh(history_analyzer.sources)
+            else:
+                data = self.refresh(history_analyzer)
+        return data["block"]
+
+
+def main() -> None:
+    """Refresh a profile: python -m terminalfellow.utils.profile PATH SOURCE..."""
+    store = ProfileStore(sys.argv[1])
+    sources = sys.argv[2:]
+    try:
+        store.refresh(
+            HistoryAnalyzer(
+                history_file=sources[0] if sources else None, sources=sources or None
+            )
+        )
+    finally:
+        try:
+            os.unlink(store.lock_path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Profiling of a whole tf invocation.
+
+`tf --profile <request>` runs the invocation again in a fresh interpreter
+under this module, so imports are profiled too. Two profiles are taken at
+once: a deterministic cProfile dump, and stack samples written in the
+collapsed format read by flamegraph.pl and speedscope.
+
+With `--profile=local`, time spent blocked, such as waiting for the API,
+is left out: cProfile measures CPU time and samples are weighted by the
+CPU time used since the previous one.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+
+MODES = ("wall", "local")
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Where a slow invocation usually spends its time: (label, file suffix, function)
+PHASES = [
+    ("imports", "<frozen importlib._bootstrap>", "_find_and_load"),
+    ("config", os.path.join("terminalfellow", "utils", "config.py"), "load_config"),
+    ("history", os.path.join("terminalfellow", "core", "context.py"), "build_context"),
+    ("model", os.path.join("terminalfellow", "core", "generator.py"), "_complete"),
+    ("model", os.path.join("terminalfellow", "core", "generator.py"), "_acomplete"),
+]
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[Callable[[], float]]:
+    """Get a clock measuring the CPU time of another thread.
+
+    Args:
+        thread_id: Identifier of the thread
+
+    Returns:
+        The clock, or None where the platform cannot measure it
+    """
+    try:
+        clock_id = time.pthread_getcpuclockid(thread_id)
+        time.clock_gettime(clock_id)
+    except (AttributeError, OSError):
+        return None
+    return lambda: time.clock_gettime(clock_id)
+
+
+def _frame_name(code) -> str:
+    """Name a stack frame like flame graphs usually do.
+
+    Args:
+        code: Code object of the frame
+
+    Returns:
+        E.g. "load_config (config.py:18)"
+    """
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class StackSampler:
+    """Sample the stack of one thread from a background thread."""
+
+    def __init__(
+        self,
+        thread_id: Optional[int] = None,
+        interval: float = SAMPLE_INTERVAL,
+        cpu_only: bool = False,
+    ):
+        """Initialize the sampler.
+
+        Args:
+            thread_id: Thread to sample. If None, uses the calling thread.
+            interval: Seconds between samples
+            cpu_only: Weight samples by the CPU time the thread used since the
+                previous sample, so time spent blocked does not count
+        """
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.clock = _thread_cpu_clock(self.thread_id) if cpu_only else None
+        self.cpu_only = cpu_only
+        # Collapsed stack to its weight in samples
+        self.stacks: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampling thread."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Take samples until stopped."""
+        last = self.clock() if self.clock else 0.0
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+
+            weight = 1.0
+            if self.clock:
+                now = self.clock()
+                weight, last = (now - last) / self.interval, now
+            elif self.cpu_only and _is_waiting(frame):
+                # Without per-thread CPU clocks, drop samples blocked on I/O
+                continue
+            if weight <= 0:
+                continue
+
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + weight
+
+    def write_collapsed(self, path: str) -> None:
+        """Write the samples in the collapsed stack format.
+
+        Args:
+            path: Output file
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, weight in sorted(self.stacks.items()):
+                count = round(weight)
+                if count:
+                    f.write(f"{stack} {count}\n")
+
+
+def _is_waiting(frame) -> bool:
+    """Check whether a sampled thread is blocked on the network.
+
+    Args:
+        frame: Innermost frame of the thread
+
+    Returns:
+        True if the thread is inside socket, ssl or selector code
+    """
+    name = os.path.basename(frame.f_code.co_filename)
+    return name in ("socket.py", "ssl.py", "selectors.py")
+
+
+# Raw cProfile rows: (file, line, function) to (calls, primitive calls,
+# own time, cumulative time, callers); pstats keeps them untyped
+StatsRows = Dict[Tuple[str, int, str], Tuple[Any, ...]]
+
+
+def _rows(stats: pstats.Stats) -> StatsRows:
+    """Get the raw rows of cProfile statistics.
+
+    Args:
+        stats: The cProfile statistics
+
+    Returns:
+        The rows by function
+    """
+    return cast(StatsRows, stats.stats)  # type: ignore[attr-defined]
+
+
+def phase_times(stats: pstats.Stats) -> Dict[str, float]:
+    """Add up the time spent in each phase of an invocation.
+
+    Args:
+        stats: The cProfile statistics
+
+    Returns:
+        Mapping of phase label to cumulative seconds
+    """
+    phases: Dict[str, float] = {}
+    for (filename, _, function), row in _rows(stats).items():
+        for label, suffix, name in PHASES:
+            if function == name and filename.endswith(suffix):
+                phases[label] = phases.get(label, 0.0) + row[3]
+    return phases
+
+
+def top_functions(stats: pstats.Stats, count: int = 15) -> List[Tuple[str, float]]:
+    """Find the functions that spent the most time in their own code.
+
+    Args:
+        stats: The cProfile statistics
+        count: Number of functions returned
+
+    Returns:
+        (function, seconds) pairs, slowest first
+    """
+    rows = sorted(_rows(stats).items(), key=lambda item: item[1][2], reverse=True)
+    name = cast(
+        Callable[[Tuple[str, int, str]], str],
+        pstats.func_std_string,  # type: ignore[attr-defined]
+    )
+    return [(name(function), row[2]) for function, row in rows[:count]]
+
+
+def run_profiled(args: List[str], mode: str = "wall") -> int:
+    """Run a tf invocation under the profilers and report on stderr.
+
+    Args:
+        args: Arguments of the invocation, without --profile
+        mode: "wall" for elapsed time, or "local" to leave out time spent
+            blocked on the network
+
+    Returns:
+        The exit status of the invocation
+    """
+    local = mode == "local"
+    profiler = cProfile.Profile(time.thread_time) if local else cProfile.Profile()
+    sampler = StackSampler(cpu_only=local)
+
+    status = 1
+    sampler.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        # Imported here so that import time is part of the profile
+        from terminalfellow.cli.main import main
+
+        sys.argv = ["tf"] + args
+        main()
+        status = 0
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+    finally:
+        # Also report invocations that crashed; the exception propagates
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        _report(profiler, sampler, mode, elapsed)
+    return status
+
+
+def _report(
+    profiler: cProfile.Profile, sampler: StackSampler, mode: str, elapsed: float
+) -> None:
+    """Write the profiles and summarize them on stderr.
+
+    Args:
+        profiler: The stopped cProfile profiler
+        sampler: The stopped stack sampler
+        mode: "wall" or "local"
+        elapsed: Seconds the invocation took
+    """
+    local = mode == "local"
+    output_dir = tempfile.mkdtemp(prefix="tf-profile-")
+    profile_path = os.path.join(output_dir, "tf.prof")
+    collapsed_path = os.path.join(output_dir, "tf.collapsed")
+    profiler.dump_stats(profile_path)
+    sampler.write_collapsed(collapsed_path)
+
+    stats = pstats.Stats(profiler)
+    clock = "CPU" if local else "wall"
+    lines = [f"\nProfile ({mode}): {elapsed:.3f} s elapsed"]
+    if local:
+        total = stats.total_tt  # type: ignore[attr-defined]
+        lines.append(f"  local CPU time: {total:.3f} s")
+    for label, seconds in sorted(phase_times(stats).items(), key=lambda x: -x[1]):
+        lines.append(f"  {label:<8} {seconds:8.3f} s {clock}")
+    lines.append("Hot functions (own time):")
+    for function, seconds in top_functions(stats):
+        lines.append(f"  {seconds:8.3f} s  {function}")
+    lines.append(f"cProfile dump: {profile_path}")
+    lines.append(f"Collapsed stacks: {collapsed_path}")
+    lines.append(
+        f"Each profiled run leaves a tf-profile-* directory in "
+        f"{tempfile.gettempdir()}; delete them when done."
+    )
+    print("\n".join(lines), file=sys.stderr)
+
+
+def main() -> None:
+    """Profile an invocation: python -m terminalfellow.utils.profiling MODE ARGS..."""
+    mode = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] in MODES else "wall"
+    sys.exit(run_profiled(sys.argv[2:], mode))
+
+
+if __name__ == "__main__":
+    main()
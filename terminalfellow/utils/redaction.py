@@ -0,0 +1,298 @@
+"""Secret redaction for shell history."""
+
+import re
+from collections import Counter
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Match,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+REDACTED = "[REDACTED]"
+
+
+class RedactionRule(NamedTuple):
+    """A secret pattern and the literals every match contains.
+
+    When the pattern has a group named "secret", only that group is redacted;
+    otherwise the whole match is. Keywords are lowercase substrings of which
+    at least one occurs in every match; they let the scrubber skip lines
+    that cannot contain the secret. A rule without keywords is tried on
+    every line.
+    """
+
+    pattern: str
+    keywords: Tuple[str, ...] = ()
+
+
+DEFAULT_RULES: Dict[str, RedactionRule] = {
+    "env_assignment": RedactionRule(
+        r"\b[A-Za-z0-9_]*(?i:SECRET|TOKEN|PASS|API_?KEY|ACCESS_KEY|PRIVATE_KEY|"
+        r"CREDENTIAL)[A-Za-z0-9_]*=(?P<secret>\"[^\"\n]*\"|'[^'\n]*'|[^\s;&|]+)",
+        ("secret", "token", "pass", "key", "credential"),
+    ),
+    "auth_header": RedactionRule(
+        r"(?i:authorization:[ \t]*(?:bearer|basic|token|digest)?[ \t]*|"
+        r"x-api-key:[ \t]*|private-token:[ \t]*)(?P<secret>[^\s\"']+)",
+        ("authorization", "key", "token"),
+    ),
+    "password_flag": RedactionRule(
+        r"(?i:--(?:password|passwd|token|secret|api-key|access-key)[= ])"
+        r"(?P<secret>\"[^\"\n]*\"|'[^'\n]*'|[^\s;&|]+)",
+        ("pass", "token", "secret", "key"),
+    ),
+    "mysql_password": RedactionRule(
+        r"\b(?:mysql\w*|mariadb)\b[^\n]*?[ \t]-p(?P<secret>[^\s;&|]+)",
+        ("mysql", "mariadb"),
+    ),
+    "url_credentials": RedactionRule(
+        r"://[^/\s:@]+:(?P<secret>[^@\s/]+)@",
+        ("@",),
+    ),
+    "curl_user": RedactionRule(
+        r"\b(?:curl|wget)\b[^\n]*?[ \t](?:-u|--user)[ \t]+[^\s:]+:"
+        r"(?P<secret>[^\s;&|]+)",
+        ("curl", "wget"),
+    ),
+    "known_token": RedactionRule(
+        r"\b(?:sk-[A-Za-z0-9_-]{20,}|AKIA[0-9A-Z]{16}|gh[pousr]_[A-Za-z0-9]{36,}|"
+        r"xox[abposr]-[A-Za-z0-9-]{10,}|glpat-[A-Za-z0-9_-]{20,})",
+        ("sk-", "akia", "gh", "xox", "glpat-"),
+    ),
+}
+
+
+def load_rules(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, RedactionRule]:
+    """Merge configured rules into the default ones.
+
+    Args:
+        overrides: Mapping of rule name to a pattern string, to a dictionary
+            with "pattern" and optional "keywords", or to None to disable a
+            default rule
+
+    Returns:
+        The effective rules
+    """
+    rules = dict(DEFAULT_RULES)
+    for name, value in (overrides or {}).items():
+        if value is None:
+            rules.pop(name, None)
+        elif isinstance(value, str):
+            rules[name] = RedactionRule(value)
+        else:
+            keywords = tuple(k.lower() for k in value.get("keywords", ()))
+            rules[name] = RedactionRule(value["pattern"], keywords)
+    return rules
+
+
+class SecretScrubber:
+    """Redact secrets from history entries.
+
+    All rules are compiled into one alternation for scrubbing free text. For
+    history entries, the distinct lines are joined once and candidate lines
+    are located with C-level substring search for the rules' keywords; only
+    the rules whose keywords occur on a line are run on it. Clean history
+    therefore costs one linear scan per keyword instead of a regex step per
+    character.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, RedactionRule]] = None,
+        replacement: str = REDACTED,
+    ):
+        """Initialize the scrubber.
+
+        Args:
+            rules: Mapping of rule name to rule. If None, uses DEFAULT_RULES.
+            replacement: Text that replaces each secret
+        """
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.replacement = replacement
+        self.counts: Counter = Counter()
+        self._group_names: Dict[str, str] = {}
+        self._pattern = self._compile()
+        self._rule_patterns = {
+            name: re.compile(rule.pattern) for name, rule in self.rules.items()
+        }
+
+        # Every rule needs keywords for the prefilter to be safe
+        self._keyword_rules: Optional[Dict[str, Tuple[str, ...]]] = None
+        if all(rule.keywords for rule in self.rules.values()):
+            keyword_rules: Dict[str, Tuple[str, ...]] = {}
+            for name, rule in self.rules.items():
+                for keyword in rule.keywords:
+                    keyword_rules[keyword] = keyword_rules.get(keyword, ()) + (name,)
+            self._keyword_rules = keyword_rules
+
+    def _compile(self) -> "re.Pattern[str]":
+        """Combine the rules into one pattern.
+
+        Returns:
+            The compiled alternation of all rules
+        """
+        alternatives = []
+        for index, (name, rule) in enumerate(self.rules.items()):
+            # Group names must be unique across the alternation
+            pattern = rule.pattern.replace("(?P<secret>", f"(?P<s{index}>")
+            alternatives.append(f"(?P<r{index}>{pattern})")
+            self._group_names[f"r{index}"] = name
+
+        if not alternatives:
+            # A pattern that never matches
+            return re.compile(r"(?!x)x")
+        return re.compile("|".join(alternatives))
+
+    def _replace(self, rule: str, match: Match[str], secret: str) -> str:
+        """Replace the secret part of a match and count the hit.
+
+        Args:
+            rule: Name of the rule that matched
+            match: The match
+            secret: Name of the group holding the secret
+
+        Returns:
+            The matched text with the secret replaced
+        """
+        self.counts[rule] += 1
+        if secret not in match.re.groupindex or match.start(secret) < 0:
+            return self.replacement
+
+        offset = match.start()
+        text = match.group()
+        return (
+            text[: match.start(secret) - offset]
+            + self.replacement
+            + text[match.end(secret) - offset :]
+        )
+
+    def _redact(self, match: Match[str]) -> str:
+        """Replace the secret part of a match of the combined pattern.
+
+        Args:
+            match: A match of the combined pattern
+
+        Returns:
+            The matched text with the secret replaced
+        """
+        group = match.lastgroup or ""
+        rule = self._group_names.get(group, group)
+        return self._replace(rule, match, "s" + group[1:])
+
+    def scrub(self, text: str) -> str:
+        """Redact secrets from a piece of text.
+
+        Args:
+            text: The text to scrub
+
+        Returns:
+            The text with secrets replaced
+        """
+        return self._pattern.sub(self._redact, text)
+
+    def _scrub_line(self, line: str, rules: Set[str]) -> str:
+        """Redact secrets from a line with a subset of the rules.
+
+        Args:
+            line: The line to scrub
+            rules: Names of the rules to apply
+
+        Returns:
+            The line with secrets replaced
+        """
+        for rule in sorted(rules):
+            line = self._rule_patterns[rule].sub(
+                lambda match: self._replace(rule, match, "secret"), line
+            )
+        return line
+
+    def _candidate_lines(self, text: str) -> Optional[Dict[int, Set[str]]]:
+        """Find the lines that contain rule keywords.
+
+        Args:
+            text: Entries joined with newlines
+
+        Returns:
+            Mapping of line index to the names of the rules to run on it, or
+            None if every line has to be scanned with every rule
+        """
+        if self._keyword_rules is None:
+            return None
+
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Some characters change length when lowercased; offsets would drift
+            return None
+
+        hits: List[Tuple[int, Tuple[str, ...]]] = []
+        for keyword, rules in self._keyword_rules.items():
+            position = lowered.find(keyword)
+            while position != -1:
+                hits.append((position, rules))
+                # Continue after the end of this line
+                end = lowered.find("\n", position)
+                if end == -1:
+                    break
+                position = lowered.find(keyword, end)
+
+        hits.sort()
+        candidates: Dict[int, Set[str]] = {}
+        index = 0
+        previous = 0
+        for position, rules in hits:
+            index += lowered.count("\n", previous, position)
+            previous = position
+            candidates.setdefault(index, set()).update(rules)
+        return candidates
+
+    def find_secrets(self, entries: Iterable[str]) -> Dict[str, str]:
+        """Find the history entries that contain secrets.
+
+        Hit counters are incremented once per distinct entry.
+
+        Args:
+            entries: History entries, one command per item, without newlines
+
+        Returns:
+            Mapping of each distinct entry containing a secret to its
+            scrubbed form
+        """
+        # Histories repeat themselves; scan each distinct line once
+        unique = list(set(entries))
+        if not unique:
+            return {}
+
+        text = "\n".join(unique)
+        candidates = self._candidate_lines(text)
+        if candidates is None:
+            scrubbed = self.scrub(text).split("\n")
+            return {
+                line: clean for line, clean in zip(unique, scrubbed) if line != clean
+            }
+
+        changed = {}
+        for index, rules in candidates.items():
+            clean = self._scrub_line(unique[index], rules)
+            if clean != unique[index]:
+                changed[unique[index]] = clean
+        return changed
+
+    def scrub_entries(self, entries: List[str]) -> List[str]:
+        """Redact secrets from history entries.
+
+        Args:
+            entries: History entries, one command per item, without newlines
+
+        Returns:
+            The scrubbed entries, in the same order
+        """
+        changed = self.find_secrets(entries)
+        if not changed:
+            return list(entries)
+        return [changed.get(line, line) for line in entries]
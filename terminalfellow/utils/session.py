@@ -0,0 +1,201 @@
+"""Per-terminal session memory for conversational refinement."""
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR, get_config_value
+
+DEFAULT_SESSION_DIR = os.path.join(DEFAULT_CONFIG_DIR, "sessions")
+
+# Requests that start like this refine the previous command
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(now|also|then|and then|but|instead|actually|rather|make it|make that|"
+    r"do it|do that|do the same|same|again|plus)\b",
+    re.IGNORECASE,
+)
+
+# Verbs that start fresh requests as often as follow-ups ("remove all .pyc
+# files"), so they only count together with a reference to the last command
+MODIFIER_PATTERN = re.compile(
+    r"^\s*(and|only|just|without|except|exclude|include|add|remove|change|use|"
+    r"with)\b",
+    re.IGNORECASE,
+)
+
+# Words that refer back to the previous command
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|them|that one|that command|the same|previous|last command|too|"
+    r"as well)\b",
+    re.IGNORECASE,
+)
+
+
+def get_session_id() -> str:
+    """Identify the terminal this process runs in.
+
+    Returns:
+        The TF_SESSION environment variable, the controlling TTY, or the
+        parent process id, in that order of preference
+    """
+    session = os.environ.get("TF_SESSION")
+    if session:
+        return session
+
+    for fd in (0, 2, 1):
+        try:
+            return os.ttyname(fd)
+        except OSError:
+            continue
+
+    return f"ppid-{os.getppid()}"
+
+
+def is_follow_up(prompt: str) -> bool:
+    """Check whether a prompt refines the previous command.
+
+    Args:
+        prompt: Natural language request for a command
+
+    Returns:
+        True if the prompt reads like a follow-up
+    """
+    if FOLLOW_UP_PATTERN.match(prompt):
+        return True
+    if not REFERENCE_PATTERN.search(prompt):
+        return False
+    return bool(MODIFIER_PATTERN.match(prompt)) or len(prompt.split()) <= 6
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Shorten text to a character limit.
+
+    Args:
+        text: The text to shorten
+        limit: Maximum number of characters
+
+    Returns:
+        The text, cut with an ellipsis if it was too long
+    """
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+class SessionStore:
+    """Keep the last few (prompt, command) turns of a terminal session."""
+
+    def __init__(
+        self,
+        session_id: Optional[str] = None,
+        directory: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_turns: Optional[int] = None,
+        max_chars: int = 400,
+    ):
+        """Initialize the session store.
+
+        Args:
+            session_id: Session identifier. If None, uses the current terminal.
+            directory: Directory holding session files. If None, uses the default.
+            ttl: Seconds of inactivity after which a session expires
+            max_turns: Maximum number of turns kept per session
+            max_chars: Maximum characters kept per prompt or command
+        """
+        self.session_id = session_id or get_session_id()
+        self.directory = directory or DEFAULT_SESSION_DIR
+        self.ttl = float(
+            ttl if ttl is not None else get_config_value("session_ttl", 900)
+        )
+        self.max_turns = int(
+            max_turns
+            if max_turns is not None
+            else get_config_value("session_max_turns", 3)
+        )
+        self.max_chars = max_chars
+
+        digest = hashlib.sha1(self.session_id.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(self.directory, f"{digest}.json")
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Load the turns of the session.
+
+        Returns:
+            The turns, oldest first, or an empty list if the session expired
+        """
+        if not os.path.exists(self.path):
+            return []
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                turns = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return []
+
+        if not turns or time.time() - turns[-1].get("time", 0) > self.ttl:
+            return []
+        return turns
+
+    def add_turn(self, prompt: str, command: str) -> None:
+        """Record a turn, dropping the oldest ones beyond the size cap.
+
+        Args:
+            prompt: The request made by the user
+            command: The command that was generated
+        """
+        turns = self.load()
+        turns.append(
+            {
+                "prompt": _truncate(prompt, self.max_chars),
+                "command": _truncate(command, self.max_chars),
+                "time": time.time(),
+            }
+        )
+        turns = turns[-self.max_turns :]
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(turns, f, separators=(",", ":"))
+        self._prune()
+
+    def clear(self) -> None:
+        """Forget the session."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def follow_up_context(self, prompt: str) -> Dict[str, str]:
+        """Build the prompt context for a follow-up request.
+
+        Only the previous command and a one-line summary of the earlier
+        requests are returned, so the follow-up prompt stays small.
+
+        Args:
+            prompt: Natural language request for a command
+
+        Returns:
+            Context with "previous_command" and "session_summary", or an empty
+            dictionary if the prompt is not a follow-up or the session is empty
+        """
+        if not is_follow_up(prompt):
+            return {}
+
+        turns = self.load()
+        if not turns:
+            return {}
+
+        return {
+            "previous_command": turns[-1]["command"],
+            "session_summary": " -> ".join(turn["prompt"] for turn in turns),
+        }
+
+    def _prune(self) -> None:
+        """Delete session files of other terminals that have expired."""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except OSError:
+                continue
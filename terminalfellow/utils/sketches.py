@@ -0,0 +1,401 @@
+"""Fixed-size, mergeable sketches for streaming history statistics."""
+
+import base64
+import hashlib
+import heapq
+import itertools
+import math
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def hash64(item: str, seed: int = 0) -> int:
+    """Hash a string to 64 bits, identically on every host and process.
+
+    Args:
+        item: The string to hash
+        seed: Selects an independent hash function
+
+    Returns:
+        An unsigned 64-bit integer
+    """
+    digest = hashlib.blake2b(
+        item.encode("utf-8"), digest_size=8, salt=seed.to_bytes(8, "little")
+    ).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _encode_array(array: np.ndarray) -> str:
+    """Encode an array's bytes for JSON.
+
+    Args:
+        array: The array
+
+    Returns:
+        Base64 text
+    """
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def _decode_array(text: str, dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+    """Decode an array encoded with _encode_array.
+
+    Args:
+        text: Base64 text
+        dtype: The array's dtype
+        shape: The array's shape
+
+    Returns:
+        A writable array
+    """
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).reshape(shape).copy()
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in at most ``capacity`` counters.
+
+    Every item counted at least total/capacity times is guaranteed to be
+    tracked, and each reported count overestimates the true one by at most
+    its recorded error.
+    """
+
+    def __init__(self, capacity: int = 100):
+        """Initialize the summary.
+
+        Args:
+            capacity: Number of counters kept
+        """
+        self.capacity = max(int(capacity), 1)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # Min-heap of (count, order, item) with stale entries skipped lazily
+        self._heap: List[Tuple[int, int, str]] = []
+        self._order = itertools.count()
+
+    def _push(self, item: str) -> None:
+        """Record an item's current count in the heap.
+
+        Args:
+            item: A tracked item
+        """
+        heapq.heappush(self._heap, (self.counts[item], next(self._order), item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [
+                (count, next(self._order), key) for key, count in self.counts.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[str, int]:
+        """Remove the item with the smallest count.
+
+        Returns:
+            The item and its count
+        """
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                del self.counts[item]
+                del self.errors[item]
+                return item, count
+
+    def minimum(self) -> int:
+        """Get the smallest tracked count.
+
+        Returns:
+            The count every untracked item is known not to exceed
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def update(self, item: str, count: int = 1) -> None:
+        """Count occurrences of an item.
+
+        Args:
+            item: The item
+            count: Number of occurrences
+        """
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            # The newcomer inherits the evicted count as its error bound
+            _, evicted = self._pop_min()
+            self.counts[item] = evicted + count
+            self.errors[item] = evicted
+        self._push(item)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, int]]:
+        """Get the heaviest items.
+
+        Args:
+            n: Maximum number of items
+
+        Returns:
+            Tuples of item, estimated count and maximum overestimate,
+            heaviest first
+        """
+        items = heapq.nlargest(n, self.counts.items(), key=lambda kv: (kv[1], kv[0]))
+        return [(item, count, self.errors[item]) for item, count in items]
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Combine two summaries into one with the same guarantees.
+
+        Args:
+            other: Summary of another stream
+
+        Returns:
+            A new summary of both streams
+        """
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        floor_self, floor_other = self.minimum(), other.minimum()
+        combined = {}
+        for item in set(self.counts) | set(other.counts):
+            count = self.counts.get(item, floor_self) + other.counts.get(
+                item, floor_other
+            )
+            error = self.errors.get(item, floor_self) + other.errors.get(
+                item, floor_other
+            )
+            combined[item] = (count, error)
+
+        for item, (count, error) in heapq.nlargest(
+            merged.capacity, combined.items(), key=lambda kv: (kv[1][0], kv[0])
+        ):
+            merged.counts[item] = count
+            merged.errors[item] = error
+            merged._push(item)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the summary.
+
+        Returns:
+            A JSON-compatible dictionary
+        """
+        return {
+            "capacity": self.capacity,
+            "items": [
+                [item, count, self.errors[item]] for item, count in self.counts.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        """Deserialize a summary.
+
+        Args:
+            data: Output of to_dict
+
+        Returns:
+            The summary
+        """
+        summary = cls(data["capacity"])
+        for item, count, error in data["items"]:
+            summary.counts[item] = count
+            summary.errors[item] = error
+            summary._push(item)
+        return summary
+
+
+class CountMinSketch:
+    """Approximate counts of any item in a fixed table.
+
+    Estimates never undercount; with width w and depth d they overcount by
+    more than e/w of the total with probability at most exp(-d).
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        """Initialize the sketch.
+
+        Args:
+            width: Counters per row
+            depth: Number of rows, each with its own hash function
+        """
+        self.width = int(width)
+        self.depth = int(depth)
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, item: str) -> List[int]:
+        """Compute the item's counter in each row.
+
+        Args:
+            item: The item
+
+        Returns:
+            One column index per row
+        """
+        # Double hashing derives all rows from two 64-bit hashes
+        first, second = hash64(item, 0), hash64(item, 1) | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def update(self, item: str, count: int = 1) -> None:
+        """Count occurrences of an item.
+
+        Args:
+            item: The item
+            count: Number of occurrences
+        """
+        for row, column in enumerate(self._columns(item)):
+            self.table[row, column] += count
+        self.total += count
+
+    def estimate(self, item: str) -> int:
+        """Estimate how often an item occurred.
+
+        Args:
+            item: The item
+
+        Returns:
+            An upper bound on the item's count
+        """
+        return int(
+            min(
+                self.table[row, column]
+                for row, column in enumerate(self._columns(item))
+            )
+        )
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        """Combine two sketches built with the same dimensions.
+
+        Args:
+            other: Sketch of another stream
+
+        Returns:
+            A new sketch of both streams
+
+        Raises:
+            ValueError: If the dimensions differ
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches must have the same dimensions")
+        merged = CountMinSketch(self.width, self.depth)
+        merged.table = self.table + other.table
+        merged.total = self.total + other.total
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the sketch.
+
+        Returns:
+            A JSON-compatible dictionary
+        """
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "total": self.total,
+            "table": _encode_array(self.table.astype("<i8")),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        """Deserialize a sketch.
+
+        Args:
+            data: Output of to_dict
+
+        Returns:
+            The sketch
+        """
+        sketch = cls(data["width"], data["depth"])
+        sketch.table = _decode_array(
+            data["table"], "<i8", (sketch.depth, sketch.width)
+        ).astype(np.int64)
+        sketch.total = data["total"]
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2**precision one-byte registers.
+
+    The relative standard error is about 1.04 / sqrt(2**precision), 0.8%
+    at the default precision, whatever the number of distinct items.
+    """
+
+    def __init__(self, precision: int = 14):
+        """Initialize the estimator.
+
+        Args:
+            precision: Number of index bits, between 4 and 18
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, item: str) -> None:
+        """Add an item.
+
+        Args:
+            item: The item
+        """
+        value = hash64(item)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        """Estimate the number of distinct items added.
+
+        Returns:
+            The estimate
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Combine two estimators with the same precision.
+
+        Args:
+            other: Estimator of another stream
+
+        Returns:
+            A new estimator of both streams
+
+        Raises:
+            ValueError: If the precisions differ
+        """
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLog estimators must have the same precision")
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the estimator.
+
+        Returns:
+            A JSON-compatible dictionary
+        """
+        return {"precision": self.precision, "registers": _encode_array(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        """Deserialize an estimator.
+
+        Args:
+            data: Output of to_dict
+
+        Returns:
+            The estimator
+        """
+        estimator = cls(data["precision"])
+        estimator.registers = _decode_array(
+            data["registers"], np.uint8, (1 << estimator.precision,)
+        )
+        return estimator
@@ -0,0 +1,508 @@
+"""Next-command prediction from shell history transitions."""
+
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from terminalfellow.utils.config import DEFAULT_CONFIG_DIR
+from terminalfellow.utils.history_store import (
+    anchor_digest,
+    detect_shell,
+    parse_history,
+)
+
+DEFAULT_MODEL_DIR = os.path.join(DEFAULT_CONFIG_DIR, "transitions")
+
+# Command ids are packed into int64 keys, ID_BITS bits per position
+ID_BITS = 21
+ID_MASK = (1 << ID_BITS) - 1
+
+# Entries fingerprinted to find where the last sync ended
+ANCHOR_LINES = 3
+
+# Interpolation weights of the unigram, bigram and trigram estimates
+WEIGHTS = (0.1, 0.3, 0.6)
+
+# Tools whose first argument selects what they do
+SUBCOMMAND_TOOLS = frozenset(
+    "git docker docker-compose kubectl helm npm yarn pnpm pip pip3 cargo go "
+    "systemctl journalctl apt apt-get brew poetry conda terraform gh".split()
+)
+
+EMPTY_KEYS = np.zeros(0, dtype=np.int64)
+EMPTY_COUNTS = np.zeros(0, dtype=np.int64)
+
+
+def normalize_command(command: str) -> str:
+    """Reduce a command to its name, subcommand and flags.
+
+    Arguments such as paths, messages and values are dropped so that
+    ``git commit -m 'fix'`` and ``git commit -m 'typo'`` share a state.
+
+    Args:
+        command: A shell command
+
+    Returns:
+        The normalized command, or an empty string for blank input
+    """
+    words = command.split()
+    # Skip leading environment assignments
+    while words and "=" in words[0] and not words[0].startswith("-"):
+        words = words[1:]
+    if not words:
+        return ""
+
+    parts = [words[0]]
+    rest = words[1:]
+    if words[0] == "sudo" and rest:
+        parts.append(rest[0])
+        rest = rest[1:]
+    if parts[-1] in SUBCOMMAND_TOOLS and rest and not rest[0].startswith("-"):
+        parts.append(rest[0])
+        rest = rest[1:]
+
+    for word in rest:
+        if word.startswith("-") and len(word) > 1:
+            # Keep the flag but not an inline value
+            flag = word.split("=", 1)[0]
+            if flag not in parts:
+                parts.append(flag)
+    return " ".join(parts)
+
+
+def _entry_digests(lines: Sequence[str]) -> List[str]:
+    """Fingerprint history entries one by one.
+
+    Args:
+        lines: History entries
+
+    Returns:
+        A short hex digest per entry
+    """
+    return [hashlib.sha1(line.encode("utf-8")).hexdigest()[:16] for line in lines]
+
+
+def _merge(
+    keys: np.ndarray, counts: np.ndarray, new_keys: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Add occurrences of keys to a sorted key/count table.
+
+    Args:
+        keys: Sorted unique keys
+        counts: Count of each key
+        new_keys: Keys to add once per occurrence
+
+    Returns:
+        The merged sorted keys and their counts
+    """
+    if not len(new_keys):
+        return keys, counts
+    merged, inverse = np.unique(np.concatenate([keys, new_keys]), return_inverse=True)
+    weights = np.concatenate([counts, np.ones(len(new_keys), dtype=np.int64)])
+    return merged, np.bincount(inverse, weights=weights, minlength=len(merged)).astype(
+        np.int64
+    )
+
+
+def _successors(
+    keys: np.ndarray, counts: np.ndarray, prefix: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the entries of a table that extend a context.
+
+    Args:
+        keys: Sorted unique keys
+        counts: Count of each key
+        prefix: The packed context, shifted left by ID_BITS
+
+    Returns:
+        The ids that followed the context and how often they did
+    """
+    start, end = np.searchsorted(keys, [prefix, prefix + (1 << ID_BITS)])
+    return keys[start:end] & ID_MASK, counts[start:end]
+
+
+class TransitionModel:
+    """Interpolated trigram model over normalized commands.
+
+    Commands are mapped to integer ids. Unigram counts live in a dense array;
+    bigram and trigram counts live in sorted int64 key arrays with packed
+    ids, so the successors of a context are one binary search away and new
+    history is merged in without rebuilding the tables.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Initialize the model.
+
+        Args:
+            path: Path to the model file. If None, the model is not persisted.
+        """
+        self.path = path
+        self.vocab: List[str] = []
+        self.index: Dict[str, int] = {}
+        # The most recent full command seen for each normalized one
+        self.examples: List[str] = []
+        self.unigrams = EMPTY_COUNTS
+        self.bigram_keys, self.bigram_counts = EMPTY_KEYS, EMPTY_COUNTS
+        self.trigram_keys, self.trigram_counts = EMPTY_KEYS, EMPTY_COUNTS
+        # Last ids seen, so updates continue the sequence
+        self.tail: List[int] = []
+        # History lines consumed, and fingerprints of the last few
+        self.processed = 0
+        self.anchor: List[str] = []
+        # Path, size, modification time, offset and anchor of the history
+        # file at the last sync_file(), or None
+        self.source: Optional[List[Any]] = None
+        if path:
+            self._load()
+
+    def _load(self) -> None:
+        """Load the model from disk."""
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+                tables = {name: data[name].astype(np.int64) for name in data.files}
+        except (OSError, ValueError, KeyError):
+            return
+
+        self.vocab = meta["vocab"]
+        self.index = {command: i for i, command in enumerate(self.vocab)}
+        self.examples = meta["examples"]
+        self.tail = meta["tail"]
+        self.processed = meta["processed"]
+        # Older models kept one digest; they resume as a rewritten history
+        self.anchor = meta.get("anchor", [])
+        self.source = meta.get("source")
+        self.unigrams = tables["unigrams"]
+        self.bigram_keys = tables["bigram_keys"]
+        self.bigram_counts = tables["bigram_counts"]
+        self.trigram_keys = tables["trigram_keys"]
+        self.trigram_counts = tables["trigram_counts"]
+
+    def save(self) -> None:
+        """Write the model to disk."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        meta = json.dumps(
+            {
+                "vocab": self.vocab,
+                "examples": self.examples,
+                "tail": self.tail,
+                "processed": self.processed,
+                "anchor": self.anchor,
+                "source": self.source,
+            }
+        )
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.frombuffer(meta.encode("utf-8"), dtype=np.uint8),
+            unigrams=self.unigrams,
+            bigram_keys=self.bigram_keys,
+            bigram_counts=self.bigram_counts,
+            trigram_keys=self.trigram_keys,
+            trigram_counts=self.trigram_counts,
+        )
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        """Forget everything the model has learned."""
+        path = self.path
+        self.__init__()  # type: ignore[misc]
+        self.path = path
+
+    def _id(self, command: str) -> Optional[int]:
+        """Look up the id of a normalized command.
+
+        Args:
+            command: A full shell command
+
+        Returns:
+            The id, or None if the command was never seen
+        """
+        return self.index.get(normalize_command(command))
+
+    def update(self, commands: Iterable[str]) -> int:
+        """Learn from commands that follow the ones already seen.
+
+        Args:
+            commands: Full shell commands, oldest first
+
+        Returns:
+            The number of commands learned
+        """
+        ids = []
+        for command in commands:
+            normalized = normalize_command(command)
+            if not normalized:
+                continue
+            if normalized not in self.index:
+                if len(self.vocab) > ID_MASK:
+                    # The key packing cannot hold more commands
+                    continue
+                self.index[normalized] = len(self.vocab)
+                self.vocab.append(normalized)
+                self.examples.append(command)
+            self.examples[self.index[normalized]] = command
+            ids.append(self.index[normalized])
+        if not ids:
+            return 0
+
+        sequence = np.array(self.tail + ids, dtype=np.int64)
+        fresh = sequence[len(self.tail) :]
+        self.unigrams = np.concatenate(
+            [self.unigrams, np.zeros(len(self.vocab) - len(self.unigrams), np.int64)]
+        )
+        np.add.at(self.unigrams, fresh, 1)
+
+        # Only pairs and triples that end in a fresh command are new
+        start = len(self.tail)
+        bigrams = (sequence[:-1] << ID_BITS) | sequence[1:]
+        self.bigram_keys, self.bigram_counts = _merge(
+            self.bigram_keys, self.bigram_counts, bigrams[max(start - 1, 0) :]
+        )
+        if len(sequence) > 2:
+            trigrams = (
+                (sequence[:-2] << (2 * ID_BITS)) | (sequence[1:-1] << ID_BITS)
+            ) | sequence[2:]
+            self.trigram_keys, self.trigram_counts = _merge(
+                self.trigram_keys, self.trigram_counts, trigrams[max(start - 2, 0) :]
+            )
+
+        self.tail = [int(i) for i in sequence[-2:]]
+        return len(ids)
+
+    def _resume_position(self, history: Sequence[str]) -> Optional[int]:
+        """Find where the entries learned by the last sync end in a history.
+
+        Shells drop the oldest entries once the history reaches its size
+        limit (HISTFILESIZE), so those entries may have moved towards the
+        start since then.
+
+        Args:
+            history: All history entries, oldest first
+
+        Returns:
+            The number of entries already learned, or None if the history
+            was rewritten
+        """
+        if not self.processed:
+            return 0
+        anchor = min(self.processed, ANCHOR_LINES)
+        for end in range(min(self.processed, len(history)), anchor - 1, -1):
+            if _entry_digests(history[end - anchor : end]) == self.anchor:
+                return end
+        return None
+
+    def _learn(
+        self,
+        entries: List[str],
+        scrub: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> None:
+        """Learn history entries that follow the ones already consumed.
+
+        Args:
+            entries: New history entries, oldest first
+            scrub: Optional function mapping entries to their redacted form
+        """
+        if entries:
+            self.update(scrub(entries) if scrub is not None else entries)
+        self.processed += len(entries)
+        self.anchor = (self.anchor + _entry_digests(entries[-ANCHOR_LINES:]))[
+            -ANCHOR_LINES:
+        ]
+
+    def sync(
+        self,
+        history: Sequence[str],
+        scrub: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> bool:
+        """Bring the model up to date with a history file's entries.
+
+        Only entries added since the last sync are learned, also when the
+        oldest entries were dropped in the meantime. If the history was
+        rewritten, the model is rebuilt.
+
+        Args:
+            history: All history entries, oldest first
+            scrub: Optional function mapping entries to their redacted form
+
+        Returns:
+            True if the model changed
+        """
+        # Offsets into the file no longer say what was consumed
+        self.source = None
+        processed = self.processed
+        position = self._resume_position(history)
+        if position is None:
+            self.reset()
+            position = 0
+
+        new = list(history[position:])
+        self.processed = position
+        self._learn(new, scrub)
+        return bool(new) or processed != self.processed
+
+    def sync_file(
+        self,
+        history_file: str,
+        scrub: Optional[Callable[[List[str]], List[str]]] = None,
+    ) -> bool:
+        """Bring the model up to date with a history file, reading only new bytes.
+
+        An unchanged file is not read, and an appended one only from where
+        the last sync stopped. A file that was rewritten in the meantime,
+        e.g. to drop its oldest entries, is read in full and synced like
+        sync() does.
+
+        Args:
+            history_file: Path to the history file
+            scrub: Optional function mapping entries to their redacted form
+
+        Returns:
+            True if the model changed
+        """
+        state = self.source if self.source and self.source[0] == history_file else None
+        try:
+            f = open(history_file, "rb")
+        except OSError:
+            return False
+
+        with f:
+            stat = os.fstat(f.fileno())
+            start = 0
+            if state is not None:
+                _, size, mtime_ns, offset, anchor = state
+                if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    return False
+                if offset <= stat.st_size and anchor_digest(f, offset) == anchor:
+                    start = offset
+            f.seek(start)
+            data = f.read()
+            end = start + len(data)
+            anchor = anchor_digest(f, end)
+
+        text = data.decode("utf-8", errors="ignore")
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        entries = [
+            entry.command for entry in parse_history(lines, detect_shell(history_file))
+        ]
+        if start:
+            self._learn(entries, scrub)
+        else:
+            self.sync(entries, scrub)
+        self.source = [history_file, stat.st_size, stat.st_mtime_ns, end, anchor]
+        return True
+
+    def recent(self) -> List[str]:
+        """Get the last commands learned, the context of the next one.
+
+        Returns:
+            Up to two commands, oldest first
+        """
+        return [self.examples[i] for i in self.tail]
+
+    def _distribution(self, previous: Sequence[str]) -> np.ndarray:
+        """Compute the probability of each command following a context.
+
+        Args:
+            previous: The commands run before, oldest first
+
+        Returns:
+            A probability per command id
+        """
+        total = self.unigrams.sum()
+        if not total:
+            return np.zeros(len(self.vocab))
+
+        probabilities = WEIGHTS[0] * self.unigrams / total
+        weight = WEIGHTS[0]
+
+        context = [self._id(command) for command in previous[-2:]]
+        tables = [(self.bigram_keys, self.bigram_counts, context[-1:], WEIGHTS[1])]
+        if len(context) == 2:
+            tables.append((self.trigram_keys, self.trigram_counts, context, WEIGHTS[2]))
+
+        for keys, counts, ids, level_weight in tables:
+            known = [i for i in ids if i is not None]
+            if not ids or len(known) < len(ids):
+                continue
+            prefix = 0
+            for i in known:
+                prefix = (prefix | i) << ID_BITS
+            successors, successor_counts = _successors(keys, counts, prefix)
+            if len(successors):
+                probabilities[successors] += (
+                    level_weight * successor_counts / successor_counts.sum()
+                )
+                weight += level_weight
+
+        return probabilities / weight
+
+    def predict(
+        self, previous: Sequence[str], count: int = 3
+    ) -> List[Tuple[str, float]]:
+        """Predict the next commands.
+
+        Args:
+            previous: The commands run before, oldest first
+            count: Maximum number of predictions
+
+        Returns:
+            Pairs of the most recent full form of a predicted command and its
+            probability, most likely first
+        """
+        probabilities = self._distribution(previous)
+        if not len(probabilities) or count <= 0:
+            return []
+
+        count = min(count, len(probabilities))
+        top = np.argpartition(-probabilities, count - 1)[:count]
+        top = top[np.argsort(-probabilities[top], kind="stable")]
+        return [
+            (self.examples[i], float(probabilities[i]))
+            for i in top
+            if probabilities[i] > 0
+        ]
+
+    def probabilities(
+        self, candidates: Sequence[str], previous: Sequence[str]
+    ) -> List[float]:
+        """Compute how likely each candidate command follows a context.
+
+        Args:
+            candidates: Commands to score
+            previous: The commands run before, oldest first
+
+        Returns:
+            A probability per candidate, 0.0 for commands never seen
+        """
+        distribution = self._distribution(previous)
+        ids = [self._id(command) for command in candidates]
+        return [float(distribution[i]) if i is not None else 0.0 for i in ids]
+
+    def rank(self, candidates: Sequence[str], previous: Sequence[str]) -> List[str]:
+        """Order candidate commands by how likely they follow a context.
+
+        Candidates the model knows nothing about keep their relative order
+        after the known ones.
+
+        Args:
+            candidates: Commands to rank, e.g. from the LLM or a history search
+            previous: The commands run before, oldest first
+
+        Returns:
+            The candidates, most likely first
+        """
+        scores = self.probabilities(candidates, previous)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order]
@@ -0,0 +1,62 @@
+"""Tests for the record/replay cassette module."""
+
+import os
+import tempfile
+import pytest
+from unittest.mock import MagicMock
+from terminalfellow.core.cassette import (
+    Cassette,
+    CassetteMiss,
+    normalize_prompt,
+    prompt_key,
+)
+from terminalfellow.core.generator import CommandGenerator
+
+
+def test_prompt_key_ignores_whitespace():
+    """Test that insignificant whitespace does not change the key."""
+    assert normalize_prompt("  list\n  files ") == "list files"
+    assert prompt_key("list files") == prompt_key("list\n\tfiles  ")
+    assert prompt_key("list files", "gpt-4") != prompt_key("list files", "gpt-3.5")
+
+
+def test_cassette_record_and_replay():
+    """Test that recorded responses are persisted and served back."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cassette.json")
+
+        recorder = Cassette(path=path, mode="record")
+        recorder.record("list files", "ls -la", "gpt-4")
+        assert os.path.exists(path)
+
+        player = Cassette(path=path, mode="replay")
+        assert player.play("list   files", "gpt-4") == "ls -la"
+
+        with pytest.raises(CassetteMiss):
+            player.play("list files", "gpt-3.5-turbo")
+
+
+def test_cassette_invalid_mode():
+    """Test that an unknown mode is rejected."""
+    with pytest.raises(ValueError):
+        Cassette(path="/nonexistent/cassette.json", mode="rewind")
+
+
+def test_generator_record_then_replay():
+    """Test the generator against a recorded cassette without an LLM."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cassette.json")
+        config = {"model": "test-model", "cassette_file": path}
+
+        player = CommandGenerator(config={**config, "cassette_mode": "replay"})
+        assert player.llm is None
+
+        # Record through a fake LLM by swapping the mode in place
+        player.cassette.mode = "record"
+        player.llm = MagicMock()
+        player.llm.complete.return_value = MagicMock(text="  find . -name '*.py'\n")
+        assert player.generate("find python files") == "find . -name '*.py'"
+
+        replayer = CommandGenerator(config={**config, "cassette_mode": "replay"})
+        assert replayer.generate("find python files") == "find . -name '*.py'"
+        assert replayer.generate("something never recorded").startswith("echo")
@@ -1,7 +1,14 @@
 """Tests for the command generator module."""
 
+import asyncio
 import pytest
-from terminalfellow.core.generator import CommandGenerator
+from unittest.mock import MagicMock, patch
+from terminalfellow.core.generator import (
+    CommandGenerator,
+    GenerationError,
+    GenerationTimeout,
+    LLMSetupError,
+)
 from terminalfellow.core import prompts
 
 
@@ -71,3 +78,79 @@ def test_prompt_templates():
     assert isinstance(history_prompt, str)
     assert "repeat last git command" in history_prompt
     assert "git commit" in history_prompt
+
+
+@patch("terminalfellow.core.generator.get_openai_api_key", return_value=None)
+def test_generator_missing_api_key_raises(mock_get_key):
+    """Test that a missing API key raises instead of exiting the process."""
+    with pytest.raises(LLMSetupError):
+        CommandGenerator(config={"model": "test-model"})
+
+
+def _async_generator(acomplete):
+    """Create a generator whose LLM answers through the given coroutine."""
+    generator = CommandGenerator(config={"openai_api_key": "sk-test"})
+    generator.cassette = None
+    generator.llm = MagicMock()
+    generator.llm.acomplete = acomplete
+    return generator
+
+
+def test_agenerate_concurrent_requests():
+    """Test that one generator serves many concurrent async requests."""
+
+    async def acomplete(prompt_text):
+        await asyncio.sleep(0.01)
+        query = prompt_text.split("\n")[1]
+        return MagicMock(text=f"  echo {query}\n")
+
+    generator = _async_generator(acomplete)
+
+    async def run():
+        return await asyncio.gather(
+            *(generator.agenerate(f"task{i}") for i in range(20))
+        )
+
+    results = asyncio.run(run())
+    assert results == [f"echo task{i}" for i in range(20)]
+
+
+def test_agenerate_timeout_and_errors():
+    """Test that async failures surface as exceptions."""
+
+    async def slow(prompt_text):
+        await asyncio.sleep(1)
+        return MagicMock(text="ls")
+
+    async def broken(prompt_text):
+        raise RuntimeError("boom")
+
+    with pytest.raises(GenerationTimeout):
+        asyncio.run(_async_generator(slow).agenerate("list files", timeout=0.01))
+
+    with pytest.raises(GenerationError, match="boom"):
+        asyncio.run(_async_generator(broken).agenerate("list files"))
+
+
+def test_agenerate_cancellation():
+    """Test that cancelling the caller cancels the LLM request."""
+    cancelled = []
+
+    async def hang(prompt_text):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    generator = _async_generator(hang)
+
+    async def run():
+        task = asyncio.ensure_future(generator.agenerate("list files"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert cancelled == [True]
@@ -0,0 +1,184 @@
+"""Tests for multi-source history ingestion."""
+
+import os
+import tempfile
+from unittest.mock import patch
+
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils import history_sources
+from terminalfellow.utils.history_sources import (
+    UNDATED,
+    load_timeline,
+    merge_timelines,
+    parse_source,
+    resolve_sources,
+)
+from terminalfellow.utils.history_store import HistoryEntry
+
+
+def write(path, lines):
+    """Write a history file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_resolve_sources_globs():
+    """Test that globs expand in order and each file is used once."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for host in ["web2", "web1"]:
+            write(os.path.join(temp_dir, host, ".bash_history"), ["ls"])
+        local = os.path.join(temp_dir, ".zsh_history")
+        write(local, ["pwd"])
+
+        sources = resolve_sources(
+            [local, os.path.join(temp_dir, "*", ".bash_history"), local, "/missing"]
+        )
+        assert sources == [
+            local,
+            os.path.join(temp_dir, "web1", ".bash_history"),
+            os.path.join(temp_dir, "web2", ".bash_history"),
+        ]
+
+
+def test_parse_and_merge_timelines():
+    """Test ordering by timestamp and dropping copies of the same entries."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bash = os.path.join(temp_dir, "bash_history")
+        write(bash, ["#1700000300", "make", "#1700000100", "ls", "ls", "cd src"])
+        zsh = os.path.join(temp_dir, "zsh_history")
+        write(
+            zsh,
+            [": 1700000200:0;git status", ": 1700000100:0;ls", ": 1700000400:0;exit"],
+        )
+
+        parsed = parse_source(bash)
+        assert parsed.keys == [1700000100] * 3 + [1700000300]
+        assert parsed.commands == ["ls", "ls", "cd src", "make"]
+        assert parsed.timestamps[:2] == [1700000100, None]
+
+        timeline = list(merge_timelines([parsed, parse_source(zsh)]))
+        assert [entry.command for entry in timeline] == [
+            "ls",
+            "ls",
+            "cd src",
+            "git status",
+            "make",
+            "exit",
+        ]
+        assert timeline[1] == HistoryEntry("ls", None, shell="bash")
+        assert timeline[-1] == HistoryEntry("exit", 1700000400, shell="zsh")
+
+
+def test_multi_source_analyzer():
+    """Test the analyzer on several sources parsed in worker processes."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for host, offset in [("a", 0), ("b", 1)]:
+            lines = []
+            for i in range(50):
+                lines += [f"#{1700000000 + 2 * i + offset}", f"echo {host}{i}"]
+            write(os.path.join(temp_dir, host, ".bash_history"), lines)
+        sources = [os.path.join(temp_dir, "*", ".bash_history")]
+
+        files = resolve_sources(sources)
+        timeline = load_timeline(files + files, workers=2, min_bytes=0)
+        assert len(timeline) == 100
+        assert [entry.command for entry in timeline[:3]] == [
+            "echo a0",
+            "echo b0",
+            "echo a1",
+        ]
+
+        analyzer = HistoryAnalyzer(
+            sources=sources,
+            model_file=os.path.join(temp_dir, "model.npz"),
+            store_file=os.path.join(temp_dir, "history.db"),
+            timeline_dir=os.path.join(temp_dir, "timelines"),
+        )
+        assert analyzer.history_file == files[0]
+        assert analyzer.read_history()[-2:] == ["echo a49", "echo b49"]
+        assert [r.command for r in analyzer.search_history("b49")] == ["echo b49"]
+        assert analyzer.streaming_stats().total == 100
+
+
+def test_undated_files_merge_at_their_modification_time():
+    """Test that files without timestamps are placed by when they were written."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        undated = os.path.join(temp_dir, "bash_history")
+        write(undated, ["make", "make test"])
+        dated = os.path.join(temp_dir, "zsh_history")
+        write(dated, [": 1700000200:0;git status", ": 1700000100:0;ls"])
+
+        assert parse_source(undated).keys == [UNDATED, UNDATED]
+        # An archive written before the dated entries does not look recent
+        os.utime(undated, (1700000150, 1700000150))
+        timeline = load_timeline([undated, dated])
+        assert [entry.command for entry in timeline] == [
+            "ls",
+            "make",
+            "make test",
+            "git status",
+        ]
+
+        # A history written since comes last, in file order
+        os.utime(undated, (1700000300, 1700000300))
+        assert [entry.command for entry in load_timeline([undated, dated])] == [
+            "ls",
+            "git status",
+            "make",
+            "make test",
+        ]
+
+
+def test_timeline_cache_parses_appended_lines():
+    """Test that cached sources are reused and only their tails parsed."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_dir = os.path.join(temp_dir, "timelines")
+        bash = os.path.join(temp_dir, "bash_history")
+        write(bash, ["#1700000300", "make", "#1700000100", "ls"])
+        zsh = os.path.join(temp_dir, "zsh_history")
+        write(zsh, [": 1700000200:0;git status"])
+
+        first = load_timeline([bash, zsh], cache_dir=cache_dir)
+        with patch.object(history_sources, "parse_source", side_effect=AssertionError):
+            assert load_timeline([bash, zsh], cache_dir=cache_dir) == first
+
+            with open(bash, "a") as f:
+                f.write("#1700000150\ncd src\n#1700000400\nexit\n")
+            cached = load_timeline([bash, zsh], cache_dir=cache_dir)
+        assert cached == load_timeline([bash, zsh])
+        assert [entry.command for entry in cached] == [
+            "ls",
+            "cd src",
+            "git status",
+            "make",
+            "exit",
+        ]
+
+        # A rewritten file is parsed again
+        write(bash, ["#1700000500", "pwd"])
+        rewritten = load_timeline([bash, zsh], cache_dir=cache_dir)
+        assert [entry.command for entry in rewritten] == ["git status", "pwd"]
+
+
+def test_parse_fish_history():
+    """Test reading the YAML-like history of fish."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fish = os.path.join(temp_dir, "fish_history")
+        write(
+            fish,
+            [
+                "- cmd: cd ~/src",
+                "  when: 1700000100",
+                "  paths:",
+                "    - ~/src",
+                "- cmd: echo one\\ntwo \\\\",
+                "  when: 1700000200",
+            ],
+        )
+        parsed = parse_source(fish)
+        assert parsed.commands == ["cd ~/src", "echo one\ntwo \\"]
+        assert parsed.timestamps == [1700000100, 1700000200]
+
+        analyzer = HistoryAnalyzer(history_file=fish)
+        assert analyzer.read_history() == ["cd ~/src", "echo one\ntwo \\"]
@@ -0,0 +1,159 @@
+"""Tests for the SQLite history store."""
+
+import os
+import tempfile
+from unittest.mock import patch
+
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.history_store import (
+    ANCHOR_BYTES,
+    HistoryEntry,
+    HistoryStore,
+    build_match_query,
+    parse_history,
+)
+
+
+def test_parse_history_timestamps():
+    """Test bash HISTTIMEFORMAT and zsh EXTENDED_HISTORY lines."""
+    entries = parse_history(
+        ["#1700000000", "ls -la", "pwd", ": 1700000100:0;git status"], shell="bash"
+    )
+    assert entries == [
+        HistoryEntry("ls -la", 1700000000, shell="bash"),
+        HistoryEntry("pwd", None, shell="bash"),
+        HistoryEntry("git status", 1700000100, shell="bash"),
+    ]
+
+
+def test_build_match_query():
+    """Test that free text becomes a safe FTS5 expression."""
+    assert build_match_query("git comm") == '"git" "comm"*'
+    assert build_match_query('docker "ps') == '"docker" "ps"*'
+    assert build_match_query("  -- ") == ""
+
+
+def _write_history(path, lines, mode="w"):
+    """Write history lines to a file."""
+    with open(path, mode) as f:
+        f.write("".join(f"{line}\n" for line in lines))
+
+
+def test_sync_and_search():
+    """Test incremental sync, rewrites and ranked search."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "bash_history")
+        with HistoryStore(os.path.join(temp_dir, "history.db")) as store:
+            mode = store.connection.execute("PRAGMA journal_mode").fetchone()[0]
+            assert mode == "wal"
+
+            _write_history(
+                history_file, ["git status", "git commit -m 'one'", "git status", "ls"]
+            )
+            assert store.sync(history_file) == 4
+            assert store.sync(history_file) == 0
+            _write_history(
+                history_file, ["git commit -m 'two'", "docker compose up -d"], "a"
+            )
+            assert store.sync(history_file) == 2
+            assert store.count() == 6
+
+            results = store.search("git comm")
+            assert [r.command for r in results] == [
+                "git commit -m 'two'",
+                "git commit -m 'one'",
+            ]
+            status = store.search("status")[0]
+            assert (status.command, status.uses) == ("git status", 2)
+            assert store.search("git", limit=1)[0].score > 0
+            assert store.search("nothing") == []
+
+            # A rewritten history replaces the entries it contributed
+            _write_history(history_file, ["make test"])
+            assert store.sync(history_file) == 1
+            assert store.count() == 1
+            assert store.search("git") == []
+            assert store.search("make")[0].uses == 1
+            assert store.sync(os.path.join(temp_dir, "missing")) == 0
+
+
+def test_sync_skips_unchanged_files():
+    """Test that only the appended bytes of a history file are read."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "bash_history")
+        _write_history(history_file, ["ls -la"] * 10000)
+        with HistoryStore(os.path.join(temp_dir, "history.db")) as store:
+            assert store.sync(history_file) == 10000
+
+            read_sizes = []
+            real_open = open
+
+            def tracking_open(*args, **kwargs):
+                f = real_open(*args, **kwargs)
+                real_read = f.read
+
+                def read(*read_args):
+                    data = real_read(*read_args)
+                    read_sizes.append(len(data))
+                    return data
+
+                f.read = read
+                return f
+
+            with patch("builtins.open", tracking_open):
+                assert store.sync(history_file) == 0
+                assert read_sizes == []
+                _write_history(history_file, ["pwd"], "a")
+                assert store.sync(history_file) == 1
+            # The appended line, plus the bytes before the old and new offsets
+            assert sum(read_sizes) == len("pwd\n") + 2 * ANCHOR_BYTES
+            assert store.count() == 10001
+
+
+def test_record_with_metadata():
+    """Test commands recorded by a shell hook."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with HistoryStore(os.path.join(temp_dir, "history.db")) as store:
+            store.record("pytest -q", cwd="/repo", exit_status=1, shell="zsh")
+            store.record("pytest -q tests", cwd="/repo", exit_status=0, shell="zsh")
+            store.record("pytest -x", cwd="/other", exit_status=0, shell="zsh")
+
+            assert {r.command for r in store.search("pytest", cwd="/repo")} == {
+                "pytest -q",
+                "pytest -q tests",
+            }
+            successful = store.search("pytest", successful_only=True)
+            assert {r.command for r in successful} == {"pytest -q tests", "pytest -x"}
+            assert successful[0].timestamp is not None
+
+            # The history file has the same commands; hook entries are not uses
+            history_file = os.path.join(temp_dir, "history")
+            _write_history(history_file, ["pytest -q", "pytest -x"])
+            store.sync(history_file)
+            assert store.count() == 2
+            assert store.recent() == ["pytest -q", "pytest -x"]
+            assert {r.command: r.uses for r in store.search("pytest")} == {
+                "pytest -q": 1,
+                "pytest -x": 1,
+                "pytest -q tests": 0,
+            }
+            assert [r.command for r in store.search("pytest", cwd="/other")] == [
+                "pytest -x"
+            ]
+
+
+def test_history_analyzer_search():
+    """Test searching through the history analyzer with redaction."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "history")
+        with open(history_file, "w") as f:
+            f.write("export API_TOKEN=abc123\ncurl localhost\n")
+
+        analyzer = HistoryAnalyzer(
+            history_file=history_file,
+            store_file=os.path.join(temp_dir, "history.db"),
+        )
+        assert [r.command for r in analyzer.search_history("api token")] == [
+            "export API_TOKEN=[REDACTED]"
+        ]
+        assert analyzer.search_history("abc123") == []
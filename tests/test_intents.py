@@ -0,0 +1,165 @@
+"""Tests for the offline intent templates."""
+
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.core.intents import IntentMatcher, extract_slots, quote_path
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    """Build the matcher once; embedding the examples is the slow part."""
+    return IntentMatcher()
+
+
+@pytest.mark.parametrize(
+    "prompt, command",
+    [
+        ("find files modified in the last 2 days", "find . -type f -mtime -2"),
+        (
+            "files older than a year in ~/Downloads",
+            "find ~/Downloads -type f -mtime +365",
+        ),
+        ("list files changed within the past hour", "find . -type f -mmin -60"),
+        (
+            "show files bigger than 1.5 GB in /var/log",
+            "find /var/log -type f -size +1536M",
+        ),
+        ("find all *.log files", "find . -type f -name '*.log'"),
+        (
+            "top 5 largest files in ~/Downloads",
+            "du -ah ~/Downloads | sort -rh | head -n 5",
+        ),
+        ("how much space does ~/Downloads take", "du -sh ~/Downloads"),
+        ("how much disk space is left", "df -h"),
+        ("compress the logs directory", "tar -czf logs.tar.gz logs"),
+        ("untar archive.tgz into /tmp", "tar -xzf archive.tgz -C /tmp"),
+        ("which process is listening on port 3000", "lsof -i :3000"),
+        ("kill the process on port 8080", "lsof -ti :8080 | xargs kill"),
+        ("kill processes named node", "pkill node"),
+    ],
+)
+def test_routine_requests(matcher, prompt, command):
+    """Test that routine requests are answered from templates."""
+    match = matcher.match(prompt)
+    assert match is not None and match.command == command
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        # Extra constraints the templates cannot express
+        "find python files larger than 10MB and delete them",
+        "compress logs older than 7 days",
+        "kill all processes except bash",
+        # A duration without a direction is ambiguous
+        "find files modified 2 days ago",
+        "kill the last command",
+        "what is my ip address",
+        # Destructive or ambiguous requests that only look routine
+        "kill zombie processes",
+        "kill all node processes",
+        "stop nginx",
+        "compress video.mp4",
+        "usage",
+    ],
+)
+def test_uncertain_requests_fall_back(matcher, prompt):
+    """Test that anything not fully understood is left to the model."""
+    assert matcher.match(prompt) is None
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "delete backup.tar.gz",
+        "verify backup.tar.gz",
+        "upload backup.tar.gz",
+        "rename backup.tar.gz",
+        "verify the archive backup.tar.gz",
+        "tarball backup",
+    ],
+)
+def test_existing_archives_are_never_overwritten(
+    matcher, prompt, tmp_path, monkeypatch
+):
+    """Test that requests about an existing archive never create one."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "backup.tar.gz").write_bytes(b"archive")
+    assert matcher.match(prompt) is None
+
+
+def test_slots_and_quoting(matcher):
+    """Test slot extraction and shell quoting of user-supplied values."""
+    slots, rest = extract_slots("files over 2k older than 3 weeks in ~/my docs/")
+    assert slots["size"] == "+2k"
+    assert slots["age"] == "-mtime +21"
+    assert "2k" not in rest and "3 weeks" not in rest
+
+    assert quote_path("~/my dir") == "~/'my dir'"
+    assert quote_path("/tmp/$(reboot)") == "'/tmp/$(reboot)'"
+    # Shell syntax never reaches a template as a free word
+    assert matcher.match("kill processes named foo;reboot") is None
+
+    start = time.perf_counter()
+    for _ in range(100):
+        matcher.match("find files larger than 100MB in /var/log")
+    assert (time.perf_counter() - start) / 100 < 0.02
+    # Matchers share the example embeddings instead of computing them again
+    assert IntentMatcher(threshold=0.5).examples[0] is matcher.examples[0]
+
+
+def test_generator_answers_from_templates():
+    """Test that the generator skips the LLM for templated requests."""
+    generator = CommandGenerator(
+        config={"openai_api_key": "sk-test", "intent_templates": True}
+    )
+    generator.llm = MagicMock()
+    generator.llm.complete.return_value = MagicMock(text="echo llm\n")
+
+    assert generator.generate("unzip files.zip") == "unzip files.zip"
+    assert generator.llm.complete.call_count == 0
+
+    # Refreshing and follow-ups go to the model
+    assert generator.generate("unzip files.zip", refresh=True) == "echo llm"
+    context = {"previous_command": "ls", "session_summary": "list files"}
+    assert generator.generate("unzip files.zip", context) == "echo llm"
+    assert generator.llm.complete.call_count == 2
+
+
+def test_generator_trusts_the_callers_template_lookup():
+    """Test that a lookup the caller already made is not repeated."""
+    generator = CommandGenerator(
+        config={"openai_api_key": "sk-test", "intent_templates": True}
+    )
+    generator.llm = MagicMock()
+    generator.llm.complete.return_value = MagicMock(text="echo llm\n")
+    generator.intent_matcher.score = MagicMock(side_effect=AssertionError)
+
+    assert generator.generate("unzip files.zip", intent_similarity=0.2) == "echo llm"
+
+
+def test_templated_answers_skip_the_model_imports(tmp_path):
+    """Test that the CLI answers a template without importing the LLM client."""
+    script = (
+        "import sys\n"
+        "sys.argv = ['tf', 'how much disk space is left']\n"
+        "from terminalfellow.cli.main import main\n"
+        "main()\n"
+        "assert 'terminalfellow.core.generator' not in sys.modules\n"
+        "assert 'llama_index' not in sys.modules\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "HOME": str(tmp_path)},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "df -h\n"
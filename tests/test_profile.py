@@ -0,0 +1,111 @@
+"""Tests for the cached user profile."""
+
+import os
+import tempfile
+from unittest.mock import patch
+
+from terminalfellow.core.context import build_context
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.profile import (
+    ProfileStore,
+    changed_materially,
+    compute_profile,
+    render_profile,
+)
+
+HISTORY = [
+    "cd ~/src/api",
+    "git status",
+    "git pull --rebase",
+    "git commit --amend --no-edit",
+    "docker compose up -d",
+    "cd ~/src/api",
+    "apt install jq",
+    "pip install requests",
+    "pip install -U pip",
+    "export API_TOKEN=abc123",
+    "ls -la",
+] * 3
+
+
+def write_history(path, lines):
+    """Write a history file."""
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_compute_and_render_profile():
+    """Test that habits are summarized without leaking secrets."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, ".zsh_history")
+        write_history(history_file, HISTORY)
+
+        profile = compute_profile(HistoryAnalyzer(history_file=history_file))
+        assert profile["shell"] == "zsh"
+        assert profile["tools"][:2] == ["git", "pip"]
+        assert "ls" not in profile["tools"]
+        assert profile["package_managers"] == ["pip", "apt"]
+        assert profile["directories"] == ["~/src/api"]
+        assert profile["commands"] == len(HISTORY)
+
+        block = render_profile(profile)
+        assert block.splitlines()[1] == "Shell: zsh"
+        assert "Package managers: pip, apt" in block
+        assert "abc123" not in block
+
+
+def test_profile_refreshes_on_material_change():
+    """Test that the stored profile is reused until the history grows."""
+    assert not changed_materially({"a": 1000}, {"a": 1050})
+    assert changed_materially({"a": 1000}, {"a": 1200})
+    assert changed_materially({"a": 1000}, {"a": 900})
+    assert changed_materially({"a": 1000}, {"a": 1000, "b": 10})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "bash_history")
+        write_history(history_file, HISTORY)
+        analyzer = HistoryAnalyzer(history_file=history_file)
+        store = ProfileStore(os.path.join(temp_dir, "profile.json"))
+
+        block = store.get_block(analyzer)
+        assert "Preferred tools: git" in block
+
+        # A few new commands do not change the profile
+        write_history(history_file, HISTORY + ["make test"])
+        with patch("terminalfellow.utils.profile.subprocess.Popen") as popen:
+            assert store.get_block(analyzer) == block
+            popen.assert_not_called()
+
+            # Material growth is refreshed in the background, once
+            write_history(history_file, HISTORY + ["kubectl get pods"] * 200)
+            assert store.get_block(analyzer) == block
+            assert store.get_block(analyzer) == block
+            assert popen.call_count == 1
+            assert popen.call_args[0][0][-2:] == [store.path, history_file]
+
+        os.unlink(store.lock_path)
+        refreshed = store.get_block(analyzer, background=False)
+        assert "Preferred tools: kubectl" in refreshed
+
+
+def test_profile_in_prompt():
+    """Test that the profile replaces raw history at the top of the prompt."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "bash_history")
+        write_history(history_file, HISTORY)
+        config = {
+            "use_history": True,
+            "profile_file": os.path.join(temp_dir, "profile.json"),
+        }
+        with patch("terminalfellow.core.context.load_config", return_value=config):
+            context = build_context(HistoryAnalyzer(history_file=history_file), "/tmp")
+        assert "history" not in context
+        assert context["profile"].startswith("OS: ")
+
+        generator = CommandGenerator(
+            config={"openai_api_key": "sk-test", "cassette_mode": None}
+        )
+        prompt_text = generator._build_prompt("install jq", context)
+        assert prompt_text.startswith("The user's environment and habits:\nOS: ")
+        assert prompt_text.index("Package managers") < prompt_text.index("install jq")
@@ -0,0 +1,77 @@
+"""Tests for profiling a tf invocation."""
+
+import os
+import pstats
+import time
+from unittest.mock import patch
+
+import pytest
+
+# Imported up front so the profiled invocation does not import it again
+from terminalfellow.cli.main import app  # noqa: F401
+from terminalfellow.utils.profiling import StackSampler, run_profiled
+
+
+def _idle(seconds):
+    """Block without using the CPU."""
+    time.sleep(seconds)
+
+
+def _busy(seconds):
+    """Use the CPU."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_leaves_out_blocked_time():
+    """Test that CPU-only sampling ignores time spent blocked."""
+
+    def weight(sampler, name):
+        return sum(w for stack, w in sampler.stacks.items() if f";{name} (" in stack)
+
+    wall = StackSampler(interval=0.002)
+    wall.start()
+    _idle(0.2)
+    _busy(0.2)
+    wall.stop()
+    assert weight(wall, "_idle") > 0
+    assert weight(wall, "_busy") > 0
+
+    local = StackSampler(interval=0.002, cpu_only=True)
+    local.start()
+    _idle(0.2)
+    _busy(0.2)
+    local.stop()
+    assert weight(local, "_idle") < 0.2 * weight(local, "_busy")
+
+
+def test_run_profiled_writes_profiles(capsys):
+    """Test that an invocation is profiled and reported."""
+    assert run_profiled(["version"]) == 0
+
+    captured = capsys.readouterr()
+    assert "Terminal Fellow" in captured.out
+    assert "Hot functions" in captured.err
+    assert "leaves a tf-profile-* directory" in captured.err
+    profile_path = captured.err.split("cProfile dump: ")[1].splitlines()[0]
+    collapsed_path = captured.err.split("Collapsed stacks: ")[1].splitlines()[0]
+
+    assert pstats.Stats(profile_path).total_tt > 0
+    assert os.path.exists(collapsed_path)
+    with open(collapsed_path) as f:
+        for line in f:
+            stack, count = line.rsplit(" ", 1)
+            assert "run_profiled (profiling.py" in stack
+            assert int(count) > 0
+
+
+def test_run_profiled_reports_crashes(capsys):
+    """Test that an invocation raising an exception is still reported."""
+    with patch("terminalfellow.cli.main.main", side_effect=RuntimeError("boom")):
+        with pytest.raises(RuntimeError):
+            run_profiled(["version"])
+    assert "Hot functions" in capsys.readouterr().err
+
+    with patch("terminalfellow.cli.main.main", side_effect=SystemExit()):
+        assert run_profiled(["version"]) == 0
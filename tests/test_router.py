@@ -0,0 +1,162 @@
+"""Tests for complexity-based model routing."""
+
+import asyncio
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.core.router import (
+    FAST,
+    STRONG,
+    ModelRouter,
+    avalidate_command,
+    read_routing_log,
+    summarize_routing,
+    validate_command,
+)
+
+
+def test_route_by_complexity():
+    """Test that one-liners go to the fast model and scripts to the strong one."""
+    router = ModelRouter("fast-model", "strong-model")
+
+    easy = router.route("list files by size")
+    assert (easy.tier, easy.model) == (FAST, "fast-model")
+
+    script = router.route(
+        "write a script that backs up my home directory every night "
+        "and emails me if it fails"
+    )
+    assert (script.tier, script.model) == (STRONG, "strong-model")
+    assert script.features["scripting"] == 1.0
+    assert script.features["steps"] == 1.0
+
+    # A request close to ones answered before is easier
+    borderline = "create a cron job that rotates logs daily"
+    assert router.route(borderline).tier == STRONG
+    assert router.route(borderline, retrieval=0.9).tier == FAST
+    assert router.escalate(easy).model == "strong-model"
+
+
+def test_validate_command():
+    """Test that unusable answers are rejected."""
+    assert validate_command("ls -la | sort -k5 -n") is None
+    assert validate_command("if true; then\n  echo ok\nfi") is None
+    assert validate_command("") == "empty response"
+    assert validate_command("Here is the command: ls") == "response is not a command"
+    assert validate_command("for f in *; do echo $f").startswith("syntax error")
+
+    for command in ["ls -la | sort -k5 -n", "", "for f in *; do echo $f"]:
+        assert asyncio.run(avalidate_command(command)) == validate_command(command)
+
+
+def test_generator_escalates_invalid_answers():
+    """Test that a bad fast answer is retried on the strong model and logged."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, "routing.jsonl")
+        generator = CommandGenerator(
+            config={
+                "openai_api_key": "sk-test",
+                "cassette_mode": None,
+                "intent_templates": False,
+                "model_routing": True,
+                "fast_model": "gpt-3.5-turbo",
+                "strong_model": "gpt-4",
+                "routing_log": log_file,
+            }
+        )
+        assert generator.model == "gpt-4"
+        assert generator.fast_llm.model == "gpt-3.5-turbo"
+        generator.llm = MagicMock()
+        generator.fast_llm = MagicMock()
+        generator.llm.complete.return_value = MagicMock(text="git stash list\n")
+
+        generator.fast_llm.complete.return_value = MagicMock(text="git log -1\n")
+        assert generator.generate("show the last commit") == "git log -1"
+        assert generator.llm.complete.call_count == 0
+
+        generator.fast_llm.complete.return_value = MagicMock(text="git stash (\n")
+        assert generator.generate("show my stashes") == "git stash list"
+        assert generator.llm.complete.call_count == 1
+
+        records = read_routing_log(log_file)
+        assert [(r["tier"], "rejected" in r) for r in records] == [
+            (FAST, False),
+            (FAST, True),
+            (STRONG, False),
+        ]
+        assert "show" not in open(log_file).read()
+
+        summary = summarize_routing(records)
+        assert summary[FAST]["calls"] == 2
+        assert summary[FAST]["rejected"] == 1
+        assert summary[STRONG]["calls"] == 1
+
+
+def test_agenerate_routes_scripts_to_strong_model():
+    """Test that async requests are routed the same way."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generator = CommandGenerator(
+            config={
+                "openai_api_key": "sk-test",
+                "cassette_mode": None,
+                "model_routing": True,
+                "strong_model": "gpt-4",
+                "routing_log": os.path.join(temp_dir, "routing.jsonl"),
+            }
+        )
+
+        async def strong(prompt_text):
+            return MagicMock(text='for f in *.csv; do wc -l "$f"; done\n')
+
+        generator.llm = MagicMock(acomplete=strong)
+        generator.fast_llm = MagicMock()
+
+        command = asyncio.run(
+            generator.agenerate(
+                "write a script that loops over every csv file and reports "
+                "the row count of each"
+            )
+        )
+        assert command.startswith("for f in *.csv")
+        generator.fast_llm.acomplete.assert_not_called()
+
+
+def test_async_routing_reuses_lookup_scores(monkeypatch):
+    """Test that async escalation neither blocks nor recomputes similarities."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, "routing.jsonl")
+        generator = CommandGenerator(
+            config={
+                "openai_api_key": "sk-test",
+                "cassette_mode": None,
+                "intent_templates": True,
+                "model_routing": True,
+                "strong_model": "gpt-4",
+                "routing_log": log_file,
+            }
+        )
+        score = MagicMock(wraps=generator.intent_matcher.score)
+        generator.intent_matcher.score = score
+        monkeypatch.setattr(
+            "terminalfellow.core.generator.validate_command",
+            MagicMock(side_effect=AssertionError),
+        )
+
+        async def fast(prompt_text):
+            return MagicMock(text="git log (\n")
+
+        async def strong(prompt_text):
+            return MagicMock(text="git log -1\n")
+
+        generator.fast_llm = MagicMock(acomplete=fast)
+        generator.llm = MagicMock(acomplete=strong)
+
+        query = "show the last commit"
+        assert asyncio.run(generator.agenerate(query)) == "git log -1"
+        assert score.call_count == 1
+        records = read_routing_log(log_file)
+        assert [r["tier"] for r in records] == [FAST, STRONG]
+        _, similarity = generator.intent_matcher.score(query)
+        assert records[0]["features"]["retrieval"] == round(similarity, 4)
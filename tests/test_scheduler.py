@@ -0,0 +1,166 @@
+"""Tests for the rate-limit-aware request scheduler."""
+
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.core.scheduler import (
+    BATCH,
+    INTERACTIVE,
+    RateLimitScheduler,
+    TokenBucket,
+    parse_duration,
+)
+
+
+class RateLimitError(Exception):
+    """Stand-in for the provider's 429 error."""
+
+    def __init__(self, headers=None):
+        super().__init__("Rate limit reached")
+        self.status_code = 429
+        self.response = MagicMock(headers=headers or {})
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_duration():
+    """Test the reset durations used in rate-limit headers."""
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1s") == 1.0
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("2.5") == 2.5
+    assert parse_duration("soon") is None
+
+
+def test_token_bucket():
+    """Test refill, debt and provider headers."""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=4.0, clock=clock)
+    assert bucket.delay(4) == 0.0
+
+    bucket.take(4)
+    assert bucket.delay(1) == pytest.approx(0.5)
+    clock.now += 1.0
+    assert bucket.delay(2) == 0.0
+
+    # Requests larger than the capacity wait for a full bucket
+    assert bucket.delay(10) == pytest.approx(1.0)
+
+    bucket.apply_headers(remaining=0, reset=30.0)
+    assert bucket.delay(1) == pytest.approx(30.0)
+
+    unknown = TokenBucket(rate=None, clock=clock)
+    unknown.apply_headers(remaining=10, reset=1.0, limit=600)
+    assert unknown.rate == 10.0
+
+
+def test_priority_order():
+    """Test that interactive requests overtake queued batch requests."""
+    scheduler = RateLimitScheduler(max_concurrency=1)
+    order = []
+
+    async def request(name, priority):
+        await scheduler.aacquire(priority=priority)
+        order.append(name)
+        scheduler.release()
+
+    async def run():
+        await scheduler.aacquire()
+        tasks = [
+            asyncio.ensure_future(request("batch1", BATCH)),
+            asyncio.ensure_future(request("batch2", BATCH)),
+            asyncio.ensure_future(request("interactive", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0.01)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch1", "batch2"]
+
+
+def test_concurrency_cap_and_throughput():
+    """Test that requests are paced to the quota without errors."""
+    scheduler = RateLimitScheduler(
+        requests_per_minute=6000, max_concurrency=2, burst_seconds=0.05
+    )
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def request():
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.001)
+        with lock:
+            in_flight.pop()
+        return "ok"
+
+    start = time.monotonic()
+    threads = [
+        threading.Thread(target=scheduler.call, args=(request,)) for _ in range(25)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    # 100 requests per second with a burst of 5: 20 paced requests
+    assert 0.15 < elapsed < 1.0
+    assert max(peak) <= 2
+    assert scheduler.stats["requests"] == 25
+
+
+def test_rate_limit_retries():
+    """Test retries honouring Retry-After and pausing the key."""
+    scheduler = RateLimitScheduler(max_retries=2, base_delay=0.01)
+    failures = [RateLimitError({"retry-after-ms": "20"})] * 2
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if failures:
+            raise failures.pop()
+        return "ls"
+
+    assert scheduler.call(request) == "ls"
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.02
+    assert scheduler.stats["rate_limited"] == 2
+
+    # Exhausted retries and permanent errors surface unchanged
+    with pytest.raises(RateLimitError):
+        scheduler.call(lambda: (_ for _ in ()).throw(RateLimitError()), key="other")
+    with pytest.raises(ValueError):
+        scheduler.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+
+
+def test_generator_retries_rate_limits():
+    """Test that generate retries instead of echoing a 429."""
+    scheduler = RateLimitScheduler(base_delay=0.01)
+    generator = CommandGenerator(
+        config={"openai_api_key": "sk-test", "scheduler": scheduler}
+    )
+    generator.llm = MagicMock()
+    generator.llm.complete.side_effect = [
+        RateLimitError({"retry-after": "0.01"}),
+        MagicMock(text="ls -la\n"),
+    ]
+
+    assert generator.generate("list files") == "ls -la"
+    assert scheduler.stats["retries"] == 1
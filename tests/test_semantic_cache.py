@@ -0,0 +1,176 @@
+"""Tests for the semantic response cache."""
+
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.core.semantic_cache import (
+    SemanticCache,
+    classify_directory,
+    embed,
+    literal_signature,
+)
+
+
+def test_embed_near_duplicates():
+    """Test that paraphrases embed closer than different requests."""
+    base = embed("list big files here")
+    paraphrase = embed("show the largest files in this dir")
+    other = embed("delete the largest files in this dir")
+
+    assert np.isclose(np.linalg.norm(base), 1.0)
+    assert base @ paraphrase > 0.9
+    assert base @ other < base @ paraphrase
+
+
+def test_literal_signature():
+    """Test that values in a prompt are part of its signature."""
+    assert literal_signature("files older than 7 days") == "7"
+    assert literal_signature("find *.py files") == "*.py"
+    assert literal_signature("list files") == ""
+
+
+def test_classify_directory():
+    """Test directory classification from marker files."""
+    assert classify_directory(None) == "unknown"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        assert classify_directory(temp_dir) == "dir"
+        os.mkdir(os.path.join(temp_dir, ".git"))
+        open(os.path.join(temp_dir, "setup.py"), "w").close()
+        assert classify_directory(temp_dir) == "git+python"
+
+
+def test_cache_hits_and_misses():
+    """Test exact and semantic hits, and misses on incompatible prompts."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = SemanticCache(path=os.path.join(temp_dir, "cache.npz"), threshold=0.8)
+        cache.store("list big files here", "git", "du -ah . | sort -rh | head")
+
+        assert cache.lookup("Show the largest files in this dir", "git") == (
+            "du -ah . | sort -rh | head"
+        )
+        assert cache.lookup("list big files located here", "git") is not None
+        assert cache.stats["exact_hits"] == 1
+        assert cache.stats["semantic_hits"] == 1
+
+        # Another kind of directory, or different values, never share a command
+        assert cache.lookup("list big files here", "python") is None
+        cache.store("files older than 7 days", "dir", "find . -mtime +7")
+        assert cache.lookup("files older than 30 days", "dir") is None
+        assert cache.stats["misses"] == 2
+        assert cache.hit_rate() == 0.5
+
+        # Lookups only update counters, which are written on flush or exit
+        assert SemanticCache(path=cache.path).stats["misses"] == 1
+        cache.flush()
+
+        # Entries and statistics survive a restart
+        reloaded = SemanticCache(path=cache.path)
+        assert len(reloaded.entries) == 2
+        assert reloaded.stats == cache.stats
+
+
+def test_processes_sharing_a_cache_merge_their_changes():
+    """Test that saves merge with the file instead of overwriting it."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "cache.npz")
+        daemon, cli = SemanticCache(path=path), SemanticCache(path=path)
+        daemon.store("list big files here", "dir", "ls -S")
+        cli.store("compress logs", "dir", "tar -czf logs.tar.gz logs")
+        assert daemon.lookup("compress logs", "dir") == "tar -czf logs.tar.gz logs"
+        assert cli.lookup("list big files here", "dir") == "ls -S"
+        assert cli.lookup("count lines of code", "dir") is None
+        daemon.flush()
+        cli.flush()
+
+        merged = SemanticCache(path=path)
+        assert len(merged.entries) == 2
+        assert merged.stats["exact_hits"] == 2
+        assert merged.stats["misses"] == 1
+        assert [entry["hits"] for entry in merged.entries] == [1, 1]
+
+        # A clear is not undone by a process that looked up entries before it
+        assert daemon.lookup("compress logs", "dir") is not None
+        SemanticCache(path=path).clear()
+        daemon.flush()
+        assert SemanticCache(path=path).entries == []
+        assert SemanticCache(path=path).stats["exact_hits"] == 0
+        assert daemon.lookup("compress logs", "dir") is None
+
+
+@pytest.mark.parametrize("policy, evicted", [("lru", "b"), ("lfu", "a")])
+def test_cache_eviction(policy, evicted):
+    """Test that the cache stays bounded under each eviction policy."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = SemanticCache(
+            path=os.path.join(temp_dir, "cache.npz"), max_entries=2, policy=policy
+        )
+        cache.store("compress logs", "dir", "a")
+        cache.store("show disk usage", "dir", "b")
+        cache.lookup("show disk usage", "dir")
+        cache.lookup("show disk usage", "dir")
+        cache.lookup("compress logs", "dir")
+        cache.store("count lines of code", "dir", "c")
+
+        commands = [entry["command"] for entry in cache.entries]
+        assert len(commands) == 2
+        assert evicted not in commands
+        assert cache.embeddings.shape == (2, cache.dim)
+
+    with pytest.raises(ValueError):
+        SemanticCache(path="/nonexistent/cache.npz", policy="fifo")
+
+
+def test_report_false_hit():
+    """Test that a reported false hit is counted and dropped."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = SemanticCache(path=os.path.join(temp_dir, "cache.npz"))
+        cache.store("list big files here", "dir", "ls -S")
+        assert cache.lookup("show the largest files in this dir", "dir") == "ls -S"
+
+        cache.report_false_hit()
+        assert cache.stats["false_hits"] == 1
+        assert cache.hit_rate() == 0.0
+        assert cache.entries == []
+        assert cache.lookup("list big files here", "dir") is None
+
+
+def test_generator_uses_semantic_cache():
+    """Test that the generator serves near-duplicates without the LLM."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generator = CommandGenerator(
+            config={
+                "openai_api_key": "sk-test",
+                "semantic_cache": True,
+                "semantic_cache_file": os.path.join(temp_dir, "cache.npz"),
+                # These requests would otherwise be answered by templates
+                "intent_templates": False,
+            }
+        )
+        generator.llm = MagicMock()
+        generator.llm.complete.return_value = MagicMock(text="ls -S\n")
+        context = {"cwd": temp_dir}
+
+        assert generator.generate("list big files here", context) == "ls -S"
+        assert generator.generate("show the largest files in this dir", context) == (
+            "ls -S"
+        )
+        assert generator.llm.complete.call_count == 1
+
+        # A refresh goes back to the LLM and drops the cached answer
+        generator.llm.complete.return_value = MagicMock(text="du -ah | sort -rh\n")
+        assert (
+            generator.generate("list big files here", context, refresh=True)
+            == "du -ah | sort -rh"
+        )
+        assert generator.llm.complete.call_count == 2
+        assert generator.semantic_cache.stats["false_hits"] == 1
+
+        # Errors are never cached
+        generator.llm.complete.side_effect = RuntimeError("boom")
+        assert generator.generate("compress logs", context).startswith("echo")
+        assert generator.semantic_cache.lookup("compress logs", "dir") is None
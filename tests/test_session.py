@@ -0,0 +1,80 @@
+"""Tests for the session memory module."""
+
+import os
+import tempfile
+import time
+from unittest.mock import patch
+from terminalfellow.core.context import build_context
+from terminalfellow.core.generator import CommandGenerator
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.session import SessionStore, get_session_id, is_follow_up
+
+
+def test_is_follow_up():
+    """Test follow-up detection."""
+    assert is_follow_up("now make it recursive")
+    assert is_follow_up("Also include hidden files")
+    assert is_follow_up("sort them by size")
+    assert not is_follow_up("find all pdf files created in the last 7 days")
+    assert not is_follow_up("list files that are larger than 10MB in my home folder")
+
+    # Verbs that also start fresh requests need a reference to the last command
+    assert is_follow_up("remove the -v flag from it")
+    assert is_follow_up("include hidden files too")
+    assert not is_follow_up("remove all .pyc files")
+    assert not is_follow_up("use rsync to copy my photos to the backup drive")
+    assert not is_follow_up("add a user named bob to the docker group")
+    assert not is_follow_up("change the owner of /var/www to www-data")
+    assert not is_follow_up("only show listening tcp ports")
+    assert not is_follow_up("remove files that end in .tmp")
+
+
+@patch.dict(os.environ, {"TF_SESSION": "my-terminal"})
+def test_session_id_override():
+    """Test that TF_SESSION overrides the terminal detection."""
+    assert get_session_id() == "my-terminal"
+
+
+def test_session_turns_are_capped_and_expire():
+    """Test the size cap and the TTL of a session."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SessionStore("tty1", directory=temp_dir, ttl=60, max_turns=2)
+        store.add_turn("list files", "ls")
+        store.add_turn("now with hidden files", "ls -a")
+        store.add_turn("now as a long listing", "ls -la")
+
+        turns = store.load()
+        assert [turn["command"] for turn in turns] == ["ls -a", "ls -la"]
+
+        # Other terminals have their own session
+        assert SessionStore("tty2", directory=temp_dir, ttl=60).load() == []
+
+        # Expired sessions are forgotten
+        later = time.time() + 120
+        with patch("terminalfellow.utils.session.time.time", return_value=later):
+            assert store.load() == []
+
+
+def test_follow_up_context_replaces_history():
+    """Test that a follow-up sends only the previous turn."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = SessionStore("tty1", directory=temp_dir, ttl=60, max_turns=3)
+        store.add_turn("find python files", "find . -name '*.py'")
+
+        analyzer = HistoryAnalyzer(history_file="/nonexistent/path")
+        context = build_context(
+            analyzer, "/tmp", prompt="now only in src", session=store
+        )
+        assert context["previous_command"] == "find . -name '*.py'"
+        assert context["session_summary"] == "find python files"
+        assert "history" not in context
+
+        fresh = build_context(analyzer, "/tmp", prompt="show disk usage", session=store)
+        assert "previous_command" not in fresh
+
+        generator = CommandGenerator(
+            config={"openai_api_key": "sk-test", "cassette_mode": None}
+        )
+        prompt_text = generator._build_prompt("now only in src", context)
+        assert "Previous command:\nfind . -name '*.py'" in prompt_text
+        assert "now only in src" in prompt_text
@@ -0,0 +1,207 @@
+"""Tests for the shell widget integration."""
+
+import asyncio
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+import json
+import pytest
+from importlib import import_module
+from contextlib import contextmanager
+from unittest.mock import patch
+from terminalfellow.shell.client import (
+    WidgetError,
+    generate_via_daemon,
+    run_widget,
+)
+from terminalfellow.shell.daemon import (
+    GeneratorDaemon,
+    is_daemon_running,
+    spawn_daemon,
+)
+from terminalfellow.shell.scripts import get_init_script
+from terminalfellow.utils.history import HistoryAnalyzer
+
+# The package exports the main() function under the module's name
+cli = import_module("terminalfellow.cli.main")
+
+
+class FakeGenerator:
+    """Generator that streams canned deltas."""
+
+    def __init__(self, deltas, delay=0.0, error=None):
+        self.deltas = deltas
+        self.delay = delay
+        self.error = error
+        self.cancelled = threading.Event()
+        self.prompts = []
+
+    async def astream(self, query, context=None):
+        self.prompts.append((query, context["cwd"]))
+        try:
+            for delta in self.deltas:
+                await asyncio.sleep(self.delay)
+                yield delta
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        if self.error:
+            raise self.error
+
+
+@contextmanager
+def running_daemon(generator):
+    """Run a daemon serving the given generator in a background thread."""
+    temp_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(temp_dir, "tf.sock")
+    daemon = GeneratorDaemon(
+        socket_path, generator, HistoryAnalyzer(history_file="/nonexistent/path")
+    )
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    future = asyncio.run_coroutine_threadsafe(daemon.serve(), loop)
+    session_dir = patch(
+        "terminalfellow.utils.session.DEFAULT_SESSION_DIR",
+        os.path.join(temp_dir, "sessions"),
+    )
+    try:
+        session_dir.start()
+        for _ in range(200):
+            if is_daemon_running(socket_path):
+                break
+            time.sleep(0.01)
+        yield socket_path
+    finally:
+        session_dir.stop()
+        loop.call_soon_threadsafe(future.cancel)
+        time.sleep(0.05)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=2)
+
+
+def test_init_scripts():
+    """Test that every supported shell gets a widget bound to a key."""
+    assert "bind -x '\"\\C-g\": _tf_widget'" in get_init_script("bash")
+    assert "READLINE_LINE" in get_init_script("bash")
+    assert "bindkey '^T' _tf_widget" in get_init_script("zsh", key="^T")
+    assert "commandline -r" in get_init_script("Fish")
+
+    with pytest.raises(ValueError):
+        get_init_script("powershell")
+
+
+def test_daemon_streams_command():
+    """Test that deltas are streamed and the final command is returned."""
+    generator = FakeGenerator(["find . ", "-name ", "'*.py'\n"])
+    deltas = []
+
+    with running_daemon(generator) as socket_path:
+        command = generate_via_daemon(
+            "find python files", "/tmp/project", deltas.append, socket_path
+        )
+
+    assert command == "find . -name '*.py'"
+    assert deltas == ["find . ", "-name ", "'*.py'\n"]
+    assert generator.prompts == [("find python files", "/tmp/project")]
+
+
+def test_daemon_reports_errors():
+    """Test that generation errors reach the client."""
+    generator = FakeGenerator(["ls"], error=RuntimeError("quota exceeded"))
+
+    with running_daemon(generator) as socket_path:
+        with pytest.raises(WidgetError, match="quota exceeded"):
+            generate_via_daemon("list files", "/tmp", lambda delta: None, socket_path)
+
+
+def test_client_disconnect_cancels_generation():
+    """Test that closing the connection cancels the request."""
+    generator = FakeGenerator(["sleep"] * 100, delay=0.05)
+
+    with running_daemon(generator) as socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps({"prompt": "wait", "cwd": "/"}) + "\n").encode())
+        sock.recv(1024)
+        sock.close()
+
+        assert generator.cancelled.wait(timeout=2)
+
+
+def test_run_widget_prints_only_the_command():
+    """Test that the widget writes the bare command to stdout."""
+    generator = FakeGenerator(["du -sh ", "*"])
+    out, err = io.StringIO(), io.StringIO()
+
+    with running_daemon(generator) as socket_path:
+        status = run_widget("disk usage here", socket_path, out=out, err=err)
+
+    assert status == 0
+    assert out.getvalue() == "du -sh *\n"
+    assert run_widget("   ", socket_path, out=out, err=err) == 1
+
+
+def test_cli_dispatches_only_exact_subcommands():
+    """Test that prompts starting with a subcommand name stay prompts."""
+    cases = [
+        (["shell-init", "zsh"], True),
+        (["shell-init", "bash", "--key", "^T"], True),
+        (["daemon"], True),
+        (["shell-init", "for", "my", "new", "laptop"], False),
+        (["daemon", "that", "restarts", "nginx"], False),
+        (["cache", "--clear"], True),
+        (["cache", "npm", "packages", "offline"], False),
+    ]
+    for args, is_subcommand in cases:
+        with patch.object(cli, "app") as app, patch.object(
+            cli, "generate_command"
+        ) as generate, patch.object(cli.sys, "argv", ["tf"] + args):
+            cli.main()
+        assert app.called == is_subcommand, args
+        assert generate.called != is_subcommand, args
+
+
+def test_cli_profile_flag_anywhere():
+    """Test that --profile is taken out of the arguments wherever it is."""
+    for args, mode in [
+        (["--profile", "next"], "wall"),
+        (["next", "--profile=local"], "local"),
+        (["find", "pdf", "files", "--profile"], "wall"),
+    ]:
+        # The mocked execv returns, so the rest of main() must not run anything
+        with patch.object(cli.os, "execv") as execv, patch.object(
+            cli, "app"
+        ), patch.object(cli, "generate_command"), patch.object(
+            cli.sys, "argv", ["tf"] + args
+        ):
+            cli.main()
+        command = execv.call_args[0][1]
+        assert command[1:4] == ["-m", "terminalfellow.utils.profiling", mode]
+        assert command[4:] == [arg for arg in args if not arg.startswith("--prof")]
+
+
+def test_failed_daemon_is_reported_not_respawned():
+    """Test that a daemon failing to start is not restarted on every keypress."""
+    temp_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(temp_dir, "tf.sock")
+
+    with patch("terminalfellow.shell.daemon.subprocess.Popen") as popen:
+        assert spawn_daemon(socket_path)
+        assert not spawn_daemon(socket_path)
+        assert popen.call_count == 1
+
+    with open(socket_path + ".err", "w") as f:
+        f.write("No OpenAI API key found.")
+    err = io.StringIO()
+    with patch(
+        "terminalfellow.shell.client.generate_in_process",
+        side_effect=WidgetError("No OpenAI API key found."),
+    ), patch("terminalfellow.shell.daemon.subprocess.Popen") as popen:
+        assert run_widget("list files", socket_path, out=io.StringIO(), err=err) == 1
+        popen.assert_not_called()
+    assert "the daemon failed to start: No OpenAI API key found." in err.getvalue()
@@ -0,0 +1,133 @@
+"""Tests for the streaming sketches and history statistics."""
+
+import json
+import os
+import random
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+import pytest
+
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.history_stats import StreamingStats, tool_and_flags
+from terminalfellow.utils.sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+
+def zipf_stream(length, vocabulary, seed=0):
+    """Make a skewed stream like real shell usage."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, vocabulary + 1)]
+    return rng.choices([f"tool{i}" for i in range(vocabulary)], weights, k=length)
+
+
+def test_space_saving_top_k_and_merge():
+    """Test that heavy hitters are found and bounded, also after merging."""
+    first, second = zipf_stream(20000, 1000), zipf_stream(20000, 1000, seed=1)
+    exact = Counter(first) + Counter(second)
+
+    left, right = SpaceSaving(50), SpaceSaving(50)
+    for item in first:
+        left.update(item)
+    for item in second:
+        right.update(item)
+    merged = left.merge(right)
+
+    expected = [item for item, _ in exact.most_common(5)]
+    assert [item for item, _, _ in merged.top(5)] == expected
+    for item, count, error in merged.top(20):
+        assert count - error <= exact[item] <= count
+
+
+def test_count_min_never_undercounts():
+    """Test Count-Min estimates and merging."""
+    stream = zipf_stream(20000, 1000)
+    exact = Counter(stream)
+    left, right = CountMinSketch(512, 4), CountMinSketch(512, 4)
+    for item in stream[:10000]:
+        left.update(item)
+    for item in stream[10000:]:
+        right.update(item)
+    merged = left.merge(right)
+
+    assert merged.total == len(stream)
+    for item, count in exact.items():
+        assert count <= merged.estimate(item) <= count + 0.01 * len(stream)
+    with pytest.raises(ValueError):
+        left.merge(CountMinSketch(256, 4))
+
+
+def test_hyperloglog_distinct_count():
+    """Test HyperLogLog accuracy and that merging gives the union."""
+    left, right = HyperLogLog(), HyperLogLog()
+    for i in range(60000):
+        left.add(f"cmd {i}")
+    for i in range(30000, 100000):
+        right.add(f"cmd {i}")
+
+    assert abs(left.count() - 60000) / 60000 < 0.03
+    assert abs(left.merge(right).count() - 100000) / 100000 < 0.03
+
+    small = HyperLogLog()
+    for item in ["ls", "pwd", "ls", "git status"]:
+        small.add(item)
+    assert small.count() == 3
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+
+
+def test_streaming_stats_round_trip():
+    """Test tool and flag statistics, serialization and merging."""
+    assert tool_and_flags("git commit --amend -m=x") == (
+        "git",
+        ["git --amend", "git -m"],
+    )
+
+    stats = StreamingStats()
+    stats.consume(["ls -la", "git status", "ls -la", "ls", "git commit -a"], 2)
+    summary = stats.summary(2)
+    assert summary["count"] == 5
+    assert summary["top_tools"] == [("ls", 3, 0), ("git", 2, 0)]
+    assert summary["top_flags"] == [("ls -la", 2, 0), ("git -a", 1, 0)]
+    assert summary["distinct_commands"] == 4
+    assert stats.tool_count("git") == 2
+    assert stats.tool_count("docker") == 0
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "stats.json")
+        stats.save(path)
+        with open(path) as f:
+            json.load(f)
+        loaded = StreamingStats.load(path)
+    assert loaded.summary(2) == summary
+
+    assert loaded.tool_count("git") == 2
+
+    merged = stats.merge(loaded)
+    assert merged.summary(1)["top_tools"] == [("ls", 6, 0)]
+    assert merged.tool_count("git") == 4
+    assert merged.summary()["distinct_commands"] == 4
+
+
+def test_streaming_history_analysis():
+    """Test the bounded-memory analysis mode with redaction."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "history")
+        with open(history_file, "w") as f:
+            f.write("ls\nexport API_TOKEN=abc123\nls -la\ngit status\n")
+
+        analyzer = HistoryAnalyzer(history_file=history_file)
+        config = {"history_stats": "streaming", "max_history_items": 2}
+        with patch(
+            "terminalfellow.utils.history.get_config_value",
+            side_effect=lambda key, default=None: config.get(key, default),
+        ):
+            analysis = analyzer.analyze_history()
+
+        assert analysis["count"] == 4
+        assert analysis["common_commands"][0] == ("ls", 2)
+        assert analysis["most_recent"] == ["ls -la", "git status"]
+        assert analysis["distinct_commands"] == 4
+        stats = analyzer.streaming_stats([history_file, history_file], chunk_size=1)
+        assert stats.total == 8
+        assert "abc123" not in json.dumps(stats.to_dict())
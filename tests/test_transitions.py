@@ -0,0 +1,173 @@
+"""Tests for the next-command transition model."""
+
+import os
+import tempfile
+
+import numpy as np
+
+from terminalfellow.utils.history import HistoryAnalyzer
+from terminalfellow.utils.transitions import TransitionModel, normalize_command
+
+WORKFLOW = [
+    "git status",
+    "git add .",
+    "git commit -m 'first'",
+    "git push",
+    "ls -la",
+    "git status",
+    "git add src/",
+    "git commit -m 'second'",
+    "git push",
+]
+
+
+def test_normalize_command():
+    """Test that arguments are dropped but subcommands and flags kept."""
+    assert normalize_command("git commit -m 'fix bug'") == "git commit -m"
+    assert normalize_command("FOO=1 python -m pytest -q") == "python -m -q"
+    assert normalize_command("sudo apt install vim") == "sudo apt install"
+    assert normalize_command("ls --color=auto /tmp") == "ls --color"
+    assert normalize_command("   ") == ""
+
+
+def test_predict_and_rank():
+    """Test predictions from trigram context with unigram backoff."""
+    model = TransitionModel()
+    assert model.predict(["git status"]) == []
+
+    model.update(WORKFLOW)
+    predictions = model.predict(["git add .", "git commit -m 'x'"])
+    assert predictions[0][0] == "git push"
+    assert 0 < predictions[0][1] <= 1
+    # The most recent full form of a command is suggested
+    assert model.predict(["git status"])[0][0] == "git add src/"
+    assert model.predict(["never seen"], count=1)[0][0].startswith("git")
+
+    candidates = ["rm -rf build", "ls -la", "git push origin main"]
+    ranked = model.rank(candidates, ["git add .", "git commit -m 'x'"])
+    assert ranked == ["git push origin main", "ls -la", "rm -rf build"]
+
+
+def test_incremental_update_matches_batch():
+    """Test that learning in pieces equals learning at once."""
+    batch = TransitionModel()
+    batch.update(WORKFLOW)
+
+    pieces = TransitionModel()
+    for start in range(0, len(WORKFLOW), 2):
+        pieces.update(WORKFLOW[start : start + 2])
+
+    assert pieces.vocab == batch.vocab
+    assert np.array_equal(pieces.unigrams, batch.unigrams)
+    assert np.array_equal(pieces.bigram_keys, batch.bigram_keys)
+    assert np.array_equal(pieces.bigram_counts, batch.bigram_counts)
+    assert np.array_equal(pieces.trigram_keys, batch.trigram_keys)
+    assert np.array_equal(pieces.trigram_counts, batch.trigram_counts)
+
+
+def test_sync_persists_and_rebuilds():
+    """Test syncing with a history that grows and is then rewritten."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "model.npz")
+        model = TransitionModel(path)
+        assert model.sync(WORKFLOW[:4])
+        model.save()
+
+        reloaded = TransitionModel(path)
+        assert reloaded.processed == 4
+        assert not reloaded.sync(WORKFLOW[:4])
+        assert reloaded.sync(WORKFLOW)
+        assert reloaded.unigrams.sum() == len(WORKFLOW)
+
+        # Dropping the oldest entries keeps what was learned
+        assert reloaded.sync(WORKFLOW[3:] + ["make"])
+        assert reloaded.processed == len(WORKFLOW) - 2
+        assert reloaded.unigrams.sum() == len(WORKFLOW) + 1
+        assert not reloaded.sync(WORKFLOW[3:] + ["make"])
+
+        # A rewritten history is relearned from scratch
+        assert reloaded.sync(["make", "make test"])
+        assert reloaded.vocab == ["make"]
+        assert reloaded.unigrams.sum() == 2
+
+
+def test_sync_file_reads_appended_bytes():
+    """Test syncing a history file by offset as it grows and is rewritten."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "history")
+        path = os.path.join(temp_dir, "model.npz")
+        with open(history_file, "w") as f:
+            f.write("\n".join(WORKFLOW[:4]) + "\n")
+        model = TransitionModel(path)
+        assert model.sync_file(history_file)
+        model.save()
+
+        reloaded = TransitionModel(path)
+        assert not reloaded.sync_file(history_file)
+        with open(history_file, "a") as f:
+            f.write("\n".join(WORKFLOW[4:]) + "\n")
+        assert reloaded.sync_file(history_file)
+        assert reloaded.unigrams.sum() == len(WORKFLOW)
+        assert reloaded.recent() == WORKFLOW[-2:]
+
+        # Dropping the oldest entries rewrites the file but keeps what was learned
+        with open(history_file, "w") as f:
+            f.write("\n".join(WORKFLOW[3:] + ["make"]) + "\n")
+        assert reloaded.sync_file(history_file)
+        assert reloaded.unigrams.sum() == len(WORKFLOW) + 1
+
+        # A rewritten file is relearned from scratch
+        with open(history_file, "w") as f:
+            f.write("make\nmake test\n")
+        assert reloaded.sync_file(history_file)
+        assert reloaded.vocab == ["make"]
+        assert reloaded.unigrams.sum() == 2
+
+
+def test_history_analyzer_suggests_next():
+    """Test suggestions and redaction through the history analyzer."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "history")
+        with open(history_file, "w") as f:
+            f.write("\n".join(WORKFLOW[:-1] + ["export API_TOKEN=abc123"]))
+
+        analyzer = HistoryAnalyzer(
+            history_file=history_file,
+            model_file=os.path.join(temp_dir, "model.npz"),
+        )
+        assert analyzer.analyze_history()["count"] == len(WORKFLOW)
+        # Analyzing the history for a prompt does not touch the model
+        assert not os.path.exists(analyzer.model_file)
+
+        model = analyzer.transition_model()
+        assert "export API_TOKEN=[REDACTED]" in model.examples
+
+        with open(history_file, "w") as f:
+            f.write("\n".join(WORKFLOW[:-1]))
+        assert analyzer.suggest_next(1) == ["git push"]
+
+
+def test_search_results_ranked_by_next_command():
+    """Test that history search puts the likeliest next command first."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_file = os.path.join(temp_dir, "history")
+        with open(history_file, "w") as f:
+            f.write("\n".join(WORKFLOW[:-1] + ["git status"]))
+
+        analyzer = HistoryAnalyzer(
+            history_file=history_file,
+            model_file=os.path.join(temp_dir, "model.npz"),
+            store_file=os.path.join(temp_dir, "history.db"),
+        )
+        commands = [result.command for result in analyzer.search_history("git")]
+        assert not commands[0].startswith("git add")
+
+        # "git add" followed "git status" every time
+        analyzer.suggest_next()
+        boosted = [result.command for result in analyzer.search_history("git")]
+        assert boosted[0].startswith("git add")
+        # Matches the model does not favour keep their relevance order
+        unlikely = [
+            command for command in commands if not command.startswith("git add")
+        ]
+        assert [command for command in boosted if command in unlikely] == unlikely